@@ -0,0 +1,67 @@
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#   "compact_json",
+#   "inflection",
+#   "typer",
+#   "uv",
+# ]
+# ///
+
+import json
+import time
+from pathlib import Path
+
+import typer
+
+from scenarios import ResolutionLines, extract_filename
+
+
+def parse_log(lines: list[str], fast_parse: bool) -> tuple[list[dict], float]:
+    extract_filename.cache_clear()
+    resolution_lines = ResolutionLines(fast_parse=fast_parse)
+    start = time.perf_counter()
+    for line in lines:
+        resolution_lines.process_line(line)
+    elapsed = time.perf_counter() - start
+    return resolution_lines.round_dicts(), elapsed
+
+
+def main(log_files: list[Path], repeat: int = 3) -> None:
+    """
+    Benchmark the regex based Reporter line parser against the AST based
+    parser over recorded pip stdout logs, e.g. those written by
+    scenarios.py --include-logs, and check both give identical rounds
+    """
+    total_ast = 0.0
+    total_fast = 0.0
+    for log_file in log_files:
+        lines = log_file.read_text().splitlines()
+        reporter_lines = sum(line.startswith("Reporter.") for line in lines)
+
+        ast_rounds, _ = parse_log(lines, fast_parse=False)
+        fast_rounds, _ = parse_log(lines, fast_parse=True)
+        # Compare through JSON so defaultdicts and dicts compare the same way
+        if json.dumps(ast_rounds) != json.dumps(fast_rounds):
+            print(f"Error: parsers disagree on {log_file}")
+            raise typer.Exit(1)
+
+        ast_time = min(parse_log(lines, fast_parse=False)[1] for _ in range(repeat))
+        fast_time = min(parse_log(lines, fast_parse=True)[1] for _ in range(repeat))
+        total_ast += ast_time
+        total_fast += fast_time
+        print(
+            f"{log_file}: {reporter_lines} reporter lines, {len(ast_rounds)} rounds, "
+            f"ast {ast_time:.3f}s, fast {fast_time:.3f}s "
+            f"({ast_time / fast_time:.1f}x)"
+        )
+
+    if len(log_files) > 1:
+        print(
+            f"Total: ast {total_ast:.3f}s, fast {total_fast:.3f}s "
+            f"({total_ast / total_fast:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,269 @@
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#   "compact_json",
+#   "inflection",
+#   "typer",
+#   "uv",
+# ]
+# ///
+
+import json
+import math
+import os
+import platform
+import subprocess
+from pathlib import Path
+from typing import Any
+
+import typer
+
+from budgets import load_scenarios
+from index_snapshot import INDEX_MODES, REPLAY
+from scenarios import (
+    VENV_POOL_DIR,
+    VENV_POOL_SIZE,
+    process_scenario,
+    summary_is_current,
+)
+
+# Each commit's summaries are kept under bisect/<toml>/<scenario>/<commit>.json
+BISECT_DIR = "bisect"
+
+
+def git(repo: Path, *args: str) -> str:
+    result = subprocess.run(
+        ["git", "-C", str(repo), *args], capture_output=True, text=True, check=False
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args)} failed: {result.stderr.strip()}")
+    return result.stdout.strip()
+
+
+def commit_range(repo: Path, good: str, bad: str) -> list[str]:
+    """
+    Commits after good up to and including bad, oldest first, following
+    first parents so the range is linear.
+    """
+    output = git(
+        repo,
+        "rev-list",
+        "--reverse",
+        "--first-parent",
+        "--ancestry-path",
+        f"{good}..{bad}",
+    )
+    return output.splitlines()
+
+
+def metric_value(summary_json: dict[str, Any], metric: str) -> Any:
+    if metric == "success":
+        return summary_json["result"]["success"]
+    if metric in summary_json["summary"]:
+        return summary_json["summary"][metric]
+    timing = summary_json.get("timing") or {}
+    if metric in timing:
+        return timing[metric]
+    raise RuntimeError(f"Unknown metric: {metric}")
+
+
+def is_regression(
+    metric: str, ratio: float, baseline: dict[str, Any], summary_json: dict[str, Any]
+) -> bool:
+    """
+    Whether summary_json is bad compared to the good commit's baseline, for
+    success that is any change and otherwise more than ratio times the
+    baseline value.
+    """
+    value = metric_value(summary_json, metric)
+    baseline_value = metric_value(baseline, metric)
+    if metric == "success":
+        return value != baseline_value
+    if value is None or baseline_value is None:
+        return False
+    return value > ratio * baseline_value
+
+
+def run_commit(
+    repo: Path,
+    commit: str,
+    toml_file: Path,
+    scenarios: dict[str, dict[str, Any]],
+    run_options: dict[str, Any],
+) -> dict[str, dict[str, Any]] | None:
+    """
+    Run every scenario with pip built from commit of the local repo, reusing
+    summaries from earlier bisects. Returns {scenario_name: summary_json},
+    or None if pip could not be installed at this commit.
+    """
+    pip_name = f"{repo.name}@{commit}"
+    pip_requirement = f"pip @ git+{repo.resolve().as_uri()}@{commit}"
+
+    summaries = {}
+    for scenario_name, scenario in scenarios.items():
+        expected_input = {
+            "pip_version": pip_name,
+            "python_version": scenario["python_version"],
+            "datetime": scenario["datetime"],
+            "platform_system": scenario["platform_system"],
+            "requirements": scenario["requirements"],
+            "max_resolution_rounds": scenario.get("max_resolution_rounds"),
+            "constraints": scenario.get("constraints"),
+            "project_name": scenario.get("project_name"),
+            "project_extras": scenario.get("project_extras"),
+            "optional_dependencies": scenario.get("optional_dependencies"),
+            "budgets": scenario["budgets"],
+            "local_index": scenario.get("local_index"),
+        }
+        summary_path = (
+            Path(BISECT_DIR) / toml_file.stem / scenario_name / f"{commit}.json"
+        )
+        if summary_path.exists():
+            summary_json = json.loads(summary_path.read_text())
+            if summary_is_current(summary_json, expected_input, 1):
+                summaries[scenario_name] = summary_json
+                continue
+
+        summary_path.parent.mkdir(parents=True, exist_ok=True)
+        scenario_kwargs = {k: v for k, v in expected_input.items() if k != "pip_version"}
+        local_index = scenario.get("local_index")
+        # A summary left by an earlier bisect is no result for this one
+        if not process_scenario(
+            pip_name=pip_name,
+            pip_requirement=pip_requirement,
+            summary_path=summary_path,
+            local_index_dir=toml_file.parent / local_index if local_index else None,
+            **scenario_kwargs,
+            **run_options,
+        ):
+            return None
+        summaries[scenario_name] = json.loads(summary_path.read_text())
+    return summaries
+
+
+def main(
+    pip_repo: Path,
+    good: str,
+    bad: str,
+    toml_file: Path,
+    scenario: list[str] | None = None,
+    metric: str = "total_rounds",
+    ratio: float = 1.2,
+    index_snapshot: Path | None = None,
+    index_mode: str = REPLAY,
+    venv_pool: bool = True,
+    find_links: Path | None = None,
+) -> None:
+    """
+    Find the first commit of the local pip clone PIP_REPO (bare repos
+    work) after GOOD up to BAD where a scenario of TOML_FILE regressed,
+    running pip built from each commit tested. Pass --scenario once per scenario to check, by
+    default every scenario of toml_file for this platform is checked.
+
+    A commit is bad if any scenario's --metric is more than --ratio times
+    its value at the good commit, or for --metric success if it changed.
+
+    With --index-snapshot the scenarios need no network, but building pip
+    needs its build backend, flit-core or for older commits setuptools,
+    which uv takes from its cache or PyPI. --find-links DIR builds pip with
+    uv offline, taking the backend's wheels from DIR, so with both no
+    network is needed at all.
+    """
+    if index_mode not in INDEX_MODES:
+        raise RuntimeError(f"--index-mode must be one of: {', '.join(INDEX_MODES)}")
+
+    good = git(pip_repo, "rev-parse", "--verify", f"{good}^{{commit}}")
+    bad = git(pip_repo, "rev-parse", "--verify", f"{bad}^{{commit}}")
+    commits = commit_range(pip_repo, good, bad)
+    if not commits:
+        raise RuntimeError(f"{bad} is not a descendant of {good}")
+
+    all_scenarios = load_scenarios(toml_file)
+    if scenario:
+        missing = [name for name in scenario if name not in all_scenarios]
+        if missing:
+            raise RuntimeError(f"Scenarios not in {toml_file}: {', '.join(missing)}")
+        scenarios = {name: all_scenarios[name] for name in scenario}
+    else:
+        scenarios = {
+            name: s
+            for name, s in all_scenarios.items()
+            if s["platform_system"] == platform.system()
+        }
+
+    if find_links is not None:
+        # For the uv commands building venvs and installing pip, pip's own
+        # runs do not read them
+        os.environ["UV_FIND_LINKS"] = str(find_links.resolve())
+        os.environ["UV_OFFLINE"] = "1"
+
+    run_options: dict[str, Any] = {}
+    if index_snapshot is not None:
+        run_options["index_snapshot_dir"] = index_snapshot
+        run_options["index_snapshot_mode"] = index_mode
+    if venv_pool:
+        run_options["venv_pool_dir"] = Path(VENV_POOL_DIR)
+        run_options["venv_pool_size"] = VENV_POOL_SIZE
+
+    def bad_scenarios(summaries: dict[str, dict[str, Any]]) -> list[str]:
+        return [
+            name
+            for name, summary_json in summaries.items()
+            if is_regression(metric, ratio, baseline[name], summary_json)
+        ]
+
+    print(f"Testing good commit {good}")
+    baseline = run_commit(pip_repo, good, toml_file, scenarios, run_options)
+    if baseline is None:
+        raise RuntimeError(f"Could not install pip at the good commit {good}")
+
+    print(f"Testing bad commit {bad}")
+    bad_summaries = run_commit(pip_repo, bad, toml_file, scenarios, run_options)
+    if bad_summaries is None:
+        raise RuntimeError(f"Could not install pip at the bad commit {bad}")
+    if not bad_scenarios(bad_summaries):
+        raise RuntimeError(f"{metric} did not regress at the bad commit {bad}")
+
+    # commits[low] is the last known good, -1 being the good commit itself,
+    # and commits[high] the first known bad
+    low, high = -1, len(commits) - 1
+    skipped: set[int] = set()
+    while high - low > 1:
+        candidates = [i for i in range(low + 1, high) if i not in skipped]
+        if not candidates:
+            break
+        middle = min(candidates, key=lambda i: abs(i - (low + high) / 2))
+        print(
+            f"Bisecting: {len(candidates)} commits left to test "
+            f"(roughly {math.ceil(math.log2(len(candidates) + 1))} steps), "
+            f"testing {commits[middle]}"
+        )
+        summaries = run_commit(
+            pip_repo, commits[middle], toml_file, scenarios, run_options
+        )
+        if summaries is None:
+            print(f"Skipping {commits[middle]}, pip could not be installed")
+            skipped.add(middle)
+        elif bad_scenarios(summaries):
+            high = middle
+        else:
+            low = middle
+
+    if high - low > 1:
+        print("The first bad commit could be any of:")
+        for commit in commits[low + 1 : high + 1]:
+            print(f"\t{git(pip_repo, 'log', '-1', '--format=%h %s', commit)}")
+        return
+
+    first_bad = commits[high]
+    print(f"First bad commit: {git(pip_repo, 'log', '-1', '--format=%H %s', first_bad)}")
+    summaries = run_commit(pip_repo, first_bad, toml_file, scenarios, run_options)
+    for name in bad_scenarios(summaries):
+        print(
+            f"\t{name}: {metric} {metric_value(baseline[name], metric)} -> "
+            f"{metric_value(summaries[name], metric)}"
+        )
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,94 @@
+import re
+import tomllib
+from pathlib import Path
+from typing import Any
+
+# A top level [budgets] table applies to every scenario of a TOML file, the
+# same keys set on a scenario override it for that scenario
+BUDGETS_TABLE = "budgets"
+BUDGET_KEYS = ("max_wall_seconds", "max_sdist_builds", "max_stall_rounds")
+
+WALL_BUDGET_EXCEEDED = "Wall Time Budget Exceeded"
+SDIST_BUDGET_EXCEEDED = "Sdist Build Budget Exceeded"
+RESOLUTION_STALLED = "Resolution Stalled"
+
+# pip prepares the metadata of every sdist it considers by building it,
+# non-interactive output logs one of these lines as each build starts
+SDIST_BUILD_RE = re.compile(r"\s*Preparing metadata \([^)]*\): started")
+
+
+def validate_budgets(budgets: dict[str, Any], where: str) -> dict[str, Any]:
+    unknown = [key for key in budgets if key not in BUDGET_KEYS]
+    if unknown:
+        raise RuntimeError(f"Unknown budget in {where}: {', '.join(unknown)}")
+    for key, value in budgets.items():
+        if (
+            isinstance(value, bool)
+            or not isinstance(value, (int, float))
+            or value <= 0
+            or (key != "max_wall_seconds" and not isinstance(value, int))
+        ):
+            raise RuntimeError(f"Budget {key} in {where} must be positive: {value!r}")
+    return budgets
+
+
+def load_scenarios(toml_file: Path) -> dict[str, dict[str, Any]]:
+    """
+    Load the scenarios of toml_file, each with a "budgets" key holding its
+    budgets merged over the file's [budgets] table, or None if it has none.
+    """
+    with open(toml_file, "rb") as f:
+        scenarios = tomllib.load(f)
+
+    global_budgets = validate_budgets(
+        scenarios.pop(BUDGETS_TABLE, {}), f"{toml_file} [{BUDGETS_TABLE}]"
+    )
+    for scenario_name, scenario in scenarios.items():
+        scenario_budgets = validate_budgets(
+            {key: scenario[key] for key in BUDGET_KEYS if key in scenario},
+            f"{toml_file} [{scenario_name}]",
+        )
+        budgets = {**global_budgets, **scenario_budgets}
+        scenario["budgets"] = dict(sorted(budgets.items())) or None
+    return scenarios
+
+
+class RunBudget:
+    """
+    Tracks one pip run against its budgets, exceeded is set to the failure
+    reason of the first budget that runs out. The wall time budget is
+    enforced by the caller as max_wall_seconds.
+    """
+
+    def __init__(self, budgets: dict[str, Any] | None = None) -> None:
+        budgets = budgets or {}
+        self.max_wall_seconds: float | None = budgets.get("max_wall_seconds")
+        self.max_sdist_builds: int | None = budgets.get("max_sdist_builds")
+        self.max_stall_rounds: int | None = budgets.get("max_stall_rounds")
+        self.exceeded: str | None = None
+        self.sdist_builds = 0
+        self.stalled_rounds = 0
+        self._pins: set[str] = set()
+
+    def process_line(self, line: str) -> None:
+        if SDIST_BUILD_RE.match(line):
+            self.sdist_builds += 1
+            # The build that would go over the budget is not waited for
+            if (
+                self.max_sdist_builds is not None
+                and self.sdist_builds > self.max_sdist_builds
+            ):
+                self.exceeded = self.exceeded or SDIST_BUDGET_EXCEEDED
+
+    def add_round(self, resolution_round: dict[str, Any]) -> None:
+        pinned = set(resolution_round.get("pinned", ()))
+        if pinned - self._pins:
+            self._pins.update(pinned)
+            self.stalled_rounds = 0
+        else:
+            self.stalled_rounds += 1
+            if (
+                self.max_stall_rounds is not None
+                and self.stalled_rounds >= self.max_stall_rounds
+            ):
+                self.exceeded = self.exceeded or RESOLUTION_STALLED
@@ -5,15 +5,73 @@
 # ]
 # ///
 
+import functools
 import json
+import math
 import os
-import tomllib
+import sqlite3
 from pathlib import Path
+from typing import Any
 
 import typer
 
+from budgets import load_scenarios
+from results_db import connect, load_summaries
+from stats import mann_whitney_u
+
 SCENARIOS_DIR = "scenarios"
 
+# Timing metrics of the summary "timing" block, with a label and a formatter
+TIMING_METRICS = [
+    ("wall_seconds", "Wall time", lambda v: f"{v:.2f}s"),
+    ("user_cpu_seconds", "User CPU time", lambda v: f"{v:.2f}s"),
+    ("system_cpu_seconds", "System CPU time", lambda v: f"{v:.2f}s"),
+    ("max_rss_bytes", "Peak RSS", lambda v: f"{v / (1024 * 1024):.1f}MiB"),
+    ("time_to_first_round_seconds", "Time to first round", lambda v: f"{v:.2f}s"),
+    ("time_to_first_pin_seconds", "Time to first pin", lambda v: f"{v:.2f}s"),
+    ("round_duration_p50_seconds", "Round duration p50", lambda v: f"{v:.4f}s"),
+    ("round_duration_p95_seconds", "Round duration p95", lambda v: f"{v:.4f}s"),
+    ("round_duration_max_seconds", "Round duration max", lambda v: f"{v:.4f}s"),
+    ("rejection_round_time_share", "Time in rejecting rounds", lambda v: f"{v:.1%}"),
+    (
+        "adding_requirement_latency_p95_seconds",
+        "Adding latency p95",
+        lambda v: f"{v:.4f}s",
+    ),
+    ("pinning_latency_p95_seconds", "Pinning latency p95", lambda v: f"{v:.4f}s"),
+    (
+        "rejecting_candidate_latency_p95_seconds",
+        "Rejecting latency p95",
+        lambda v: f"{v:.4f}s",
+    ),
+    ("sdist_build_seconds", "Sdist build time", lambda v: f"{v:.2f}s"),
+]
+
+# Most sdist builds listed per side when only one side built them
+MAX_SDIST_BUILDS_LISTED = 5
+
+
+# Summary metrics shown in the matrix, lower is better for all of them
+SUMMARY_METRICS = [
+    ("distinct_sdists_visited", "Distinct Sdists visisted"),
+    ("distinct_wheels_visited", "Distinct Wheels visisted"),
+    ("total_visited_packages", "Total visisted packages"),
+    ("total_visited_requirements", "Total visisted requirements"),
+    ("total_rejected_requirements", "Total rejected requirements"),
+    ("total_pinned_packages", "Total pinned packages"),
+    ("total_rounds", "Total rounds"),
+]
+
+# Metrics aggregated across scenarios as a geometric mean ratio
+AGGREGATE_METRICS = [
+    ("total_rounds", "Total rounds"),
+    ("distinct_sdists_visited", "Distinct Sdists visisted"),
+    ("distinct_wheels_visited", "Distinct Wheels visisted"),
+]
+
+BEST_MARKER = "*"
+WORST_MARKER = "!"
+
 
 def percent_change(value_1: int, value_2: int) -> str:
     if value_1 == 0:
@@ -25,66 +83,198 @@ def percent_change(value_1: int, value_2: int) -> str:
     return f"{(value_2 * 100) / value_1:.2f}%"
 
 
-def process_toml_file(toml_file: Path, pip_name_1: str, pip_name_2: str) -> None:
-    with open(toml_file, "rb") as f:
-        scenarios = tomllib.load(f)
+def timing_messages(
+    timing_1: dict | None,
+    timing_2: dict | None,
+    threshold: float,
+    samples_1: dict | None = None,
+    samples_2: dict | None = None,
+    alpha: float = 0.05,
+) -> list[str]:
+    """
+    Describe timing metrics that changed by more than threshold percent,
+    summaries from before timing was recorded have no timing block. When
+    both summaries have samples from --repeat a change is only reported if
+    the Mann-Whitney U test finds it significant at alpha.
+    """
+    if not timing_1 or not timing_2:
+        return []
+
+    messages = []
+    for key, label, fmt in TIMING_METRICS:
+        value_1 = timing_1.get(key)
+        value_2 = timing_2.get(key)
+        if value_1 is None or value_2 is None:
+            continue
+        if value_1 and abs(value_2 - value_1) * 100 / value_1 <= threshold:
+            continue
+        if not value_1 and not value_2:
+            continue
 
-    for scenario_name, scenario in scenarios.items():
-        python_version: str = scenario["python_version"]
-        platform_system: str = scenario["platform_system"]
-        datetime: str = scenario["datetime"]
-        requirements: list[str] = scenario["requirements"]
-        max_resolution_rounds: int | None = scenario.get("max_resolution_rounds")
-        constraints: list[str] | None = scenario.get("constraints")
-
-        json_path_1 = (
-            Path("summaries")
-            / os.path.splitext(toml_file.name)[0]
-            / scenario_name
-            / f"{pip_name_1}.json"
+        significance = ""
+        if samples_1 and samples_2 and key in samples_1 and key in samples_2:
+            p_value = mann_whitney_u(samples_1[key], samples_2[key])
+            if p_value >= alpha:
+                continue
+            significance = f", p={p_value:.3f}"
+        messages.append(
+            f"{label}: {fmt(value_1)} -> {fmt(value_2)} "
+            f"({percent_change(value_1, value_2)}{significance})"
         )
-        json_path_2 = (
-            Path("summaries")
-            / os.path.splitext(toml_file.name)[0]
-            / scenario_name
-            / f"{pip_name_2}.json"
+    return messages
+
+
+def cache_messages(cache_1: dict | None, cache_2: dict | None) -> list[str]:
+    """
+    Describe differences in how each side used pip's cache, summaries from
+    before --cache-mode used the user's cache.
+    """
+    cache_1 = cache_1 or {"mode": "user"}
+    cache_2 = cache_2 or {"mode": "user"}
+    if cache_1["mode"] != cache_2["mode"]:
+        return [f"Cache mode: {cache_1['mode']} -> {cache_2['mode']}"]
+
+    # With the user's cache the counts mostly reflect the machine's state
+    messages = []
+    if cache_1["mode"] != "user" and "hits" in cache_1 and "hits" in cache_2:
+        counts_1 = (cache_1["hits"], cache_1["misses"])
+        counts_2 = (cache_2["hits"], cache_2["misses"])
+        if counts_1 != counts_2:
+            messages.append(
+                f"Cache hits/misses: {counts_1[0]}/{counts_1[1]} -> "
+                f"{counts_2[0]}/{counts_2[1]}"
+            )
+    return messages
+
+
+def sdist_build_messages(
+    pip_name_1: str,
+    pip_name_2: str,
+    builds_1: list[dict[str, Any]] | None,
+    builds_2: list[dict[str, Any]] | None,
+) -> list[str]:
+    """
+    Describe the sdists only one side built, slowest first, as those are
+    where the resolution paths differ in build cost. Summaries from before
+    sdist builds were timed have no build table.
+    """
+    if builds_1 is None or builds_2 is None:
+        return []
+
+    def build_times(builds: list[dict[str, Any]]) -> dict[str, float]:
+        times: dict[str, float] = {}
+        for build in builds:
+            key = f"{build['name'] or 'unknown sdist'} {build['version'] or ''}".strip()
+            times[key] = times.get(key, 0.0) + build["seconds"]
+        return times
+
+    times_1 = build_times(builds_1)
+    times_2 = build_times(builds_2)
+    messages = []
+    for pip_name, times, other_times in (
+        (pip_name_1, times_1, times_2),
+        (pip_name_2, times_2, times_1),
+    ):
+        only = sorted(
+            ((key, seconds) for key, seconds in times.items() if key not in other_times),
+            key=lambda item: -item[1],
         )
-        if not json_path_1.exists():
-            continue
-        if not json_path_2.exists():
+        if not only:
             continue
+        listed = ", ".join(
+            f"{key} ({seconds:.2f}s)" for key, seconds in only[:MAX_SDIST_BUILDS_LISTED]
+        )
+        if len(only) > MAX_SDIST_BUILDS_LISTED:
+            listed += f" and {len(only) - MAX_SDIST_BUILDS_LISTED} more"
+        messages.append(f"Sdists only built with {pip_name}: {listed}")
+    return messages
 
-        json_1 = json.load(json_path_1.open())
-        input_1 = json_1["input"]
-        if input_1 != (
-            {
-                "pip_version": pip_name_1,
-                "python_version": python_version,
-                "datetime": datetime,
-                "platform_system": platform_system,
-                "requirements": requirements,
-                "max_resolution_rounds": max_resolution_rounds,
-                "constraints": constraints,
-            }
-        ):
-            print(f"Warning: JSON 1 not in sync with TOML scenario: {str(json_path_1)}")
-            continue
 
-        json_2 = json.load(json_path_2.open())
-        input_2 = json_2["input"]
-        if input_2 != (
-            {
-                "pip_version": pip_name_2,
-                "python_version": python_version,
-                "datetime": datetime,
-                "platform_system": platform_system,
-                "requirements": requirements,
-                "max_resolution_rounds": max_resolution_rounds,
-                "constraints": constraints,
-            }
-        ):
-            print(f"Warning: JSON 2 not in sync with TOML scenario: {str(json_path_2)}")
+def nondeterminism_messages(pip_name: str, summary_json: dict[str, Any]) -> list[str]:
+    """
+    Describe metrics that should be deterministic but differed between the
+    repeated runs of a scenario.
+    """
+    nondeterministic = (summary_json.get("repeat") or {}).get("nondeterministic")
+    if not nondeterministic:
+        return []
+    return [
+        f"Nondeterministic across repeats with {pip_name}: {', '.join(nondeterministic)}"
+    ]
+
+
+def expected_input(scenario: dict[str, Any], pip_name: str) -> dict[str, Any]:
+    return {
+        "pip_version": pip_name,
+        "python_version": scenario["python_version"],
+        "datetime": scenario["datetime"],
+        "platform_system": scenario["platform_system"],
+        "requirements": scenario["requirements"],
+        "max_resolution_rounds": scenario.get("max_resolution_rounds"),
+        "constraints": scenario.get("constraints"),
+        "project_name": scenario.get("project_name"),
+        "project_extras": scenario.get("project_extras"),
+        "optional_dependencies": scenario.get("optional_dependencies"),
+        "budgets": scenario["budgets"],
+        "local_index": scenario.get("local_index"),
+    }
+
+
+def load_toml_summaries(
+    toml_file: Path, pip_names: list[str], conn: sqlite3.Connection | None = None
+) -> dict[str, dict[str, dict[str, Any]]]:
+    """
+    Load the summary of every scenario in toml_file for each pip name, each
+    file is read once, or from the results database when conn is given.
+    Returns {scenario_name: {pip_name: summary_json}}, summaries that are
+    missing or out of sync with the TOML are left out.
+    """
+    scenarios = load_scenarios(toml_file)
+
+    toml_name = os.path.splitext(toml_file.name)[0]
+    stored = load_summaries(conn, toml_name, pip_names) if conn is not None else {}
+
+    summaries: dict[str, dict[str, dict[str, Any]]] = {}
+    for scenario_name, scenario in scenarios.items():
+        summaries[scenario_name] = {}
+        for pip_name in pip_names:
+            json_path = Path("summaries") / toml_name / scenario_name / f"{pip_name}.json"
+            if conn is not None:
+                summary_json = stored.get(scenario_name, {}).get(pip_name)
+                if summary_json is None:
+                    continue
+            else:
+                if not json_path.exists():
+                    continue
+                summary_json = json.load(json_path.open())
+
+            # Treat missing keys as None so older summaries still match
+            summary_input = summary_json["input"]
+            expected = expected_input(scenario, pip_name)
+            if {k: summary_input.get(k) for k in expected} != expected:
+                print(f"Warning: JSON not in sync with TOML scenario: {json_path}")
+                continue
+
+            summaries[scenario_name][pip_name] = summary_json
+
+    return summaries
+
+
+def process_toml_file(
+    toml_file: Path,
+    pip_name_1: str,
+    pip_name_2: str,
+    timing_threshold: float = 10.0,
+    conn: sqlite3.Connection | None = None,
+    alpha: float = 0.05,
+) -> None:
+    summaries = load_toml_summaries(toml_file, [pip_name_1, pip_name_2], conn)
+
+    for scenario_name, scenario_summaries in summaries.items():
+        if pip_name_1 not in scenario_summaries or pip_name_2 not in scenario_summaries:
             continue
+        json_1 = scenario_summaries[pip_name_1]
+        json_2 = scenario_summaries[pip_name_2]
 
         success_1 = json_1["result"]["success"]
         success_2 = json_2["result"]["success"]
@@ -182,12 +372,190 @@ def process_toml_file(toml_file: Path, pip_name_1: str, pip_name_2: str) -> None
                     f"Total rounds: {number_rounds_1} -> {number_rounds_2} ({percent_change(number_rounds_1, number_rounds_2)})"
                 )
 
+        difference_messages.extend(
+            timing_messages(
+                json_1.get("timing"),
+                json_2.get("timing"),
+                timing_threshold,
+                json_1.get("timing_samples"),
+                json_2.get("timing_samples"),
+                alpha,
+            )
+        )
+        difference_messages.extend(
+            cache_messages(json_1.get("cache"), json_2.get("cache"))
+        )
+        difference_messages.extend(
+            sdist_build_messages(
+                pip_name_1,
+                pip_name_2,
+                json_1.get("sdist_builds"),
+                json_2.get("sdist_builds"),
+            )
+        )
+        difference_messages.extend(nondeterminism_messages(pip_name_1, json_1))
+        difference_messages.extend(nondeterminism_messages(pip_name_2, json_2))
+
         if difference_messages:
             print(f"Difference for scenario {toml_file} - {scenario_name}:")
             print("\n".join(f"\t{d}" for d in difference_messages))
             print()
 
 
+def mark_best_worst(values: list[Any], higher_is_better: bool = False) -> list[str]:
+    """
+    Format values, marking the best with BEST_MARKER and the worst with
+    WORST_MARKER when they are not all the same.
+    """
+    present = [v for v in values if v is not None]
+    if len(set(present)) <= 1:
+        return ["-" if v is None else str(v) for v in values]
+
+    best = max(present) if higher_is_better else min(present)
+    worst = min(present) if higher_is_better else max(present)
+    cells = []
+    for value in values:
+        if value is None:
+            cells.append("-")
+        elif value == best:
+            cells.append(f"{value}{BEST_MARKER}")
+        elif value == worst:
+            cells.append(f"{value}{WORST_MARKER}")
+        else:
+            cells.append(str(value))
+    return cells
+
+
+def print_table(header: list[str], rows: list[list[str]], indent: str = "\t") -> None:
+    widths = [max(len(row[i]) for row in [header, *rows]) for i in range(len(header))]
+    for row in [header, *rows]:
+        print(indent + "  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+
+
+def geometric_mean(values: list[float]) -> float:
+    return math.exp(sum(math.log(v) for v in values) / len(values))
+
+
+def ratio(baseline: int, value: int) -> float:
+    # Add one so scenarios with zero sdists or wheels still contribute
+    return (value + 1) / (baseline + 1)
+
+
+def summary_values(
+    scenario_summaries: dict[str, dict[str, Any]],
+    pip_names: list[str],
+    section: str,
+    key: str,
+) -> list[Any]:
+    """
+    A value of each pip name's summary of a scenario, None where a pip name
+    has no summary or its summary no such section.
+    """
+    return [
+        scenario_summaries[pip_name][section].get(key)
+        if pip_name in scenario_summaries and scenario_summaries[pip_name].get(section)
+        else None
+        for pip_name in pip_names
+    ]
+
+
+def process_toml_file_matrix(
+    toml_file: Path, pip_names: list[str], conn: sqlite3.Connection | None = None
+) -> dict[str, dict[str, list[float]]]:
+    """
+    Print a metric by pip version table for every scenario in toml_file.
+    Returns {metric: {pip_name: [ratio to the first pip name, ...]}} over
+    the scenarios every pip name has a summary for.
+    """
+    summaries = load_toml_summaries(toml_file, pip_names, conn)
+    ratios: dict[str, dict[str, list[float]]] = {
+        metric: {pip_name: [] for pip_name in pip_names}
+        for metric, _ in AGGREGATE_METRICS
+    }
+
+    for scenario_name, scenario_summaries in summaries.items():
+        if not scenario_summaries:
+            continue
+        values = functools.partial(summary_values, scenario_summaries, pip_names)
+        rows = [["Success", *mark_best_worst(values("result", "success"), True)]]
+        rows.append(
+            [
+                "Failure Reason",
+                *[
+                    "-"
+                    if pip_name not in scenario_summaries
+                    else str(scenario_summaries[pip_name]["result"]["failure_reason"])[
+                        :40
+                    ]
+                    for pip_name in pip_names
+                ],
+            ]
+        )
+        for metric, label in SUMMARY_METRICS:
+            rows.append([label, *mark_best_worst(values("summary", metric))])
+        if any(v is not None for v in values("timing", "wall_seconds")):
+            rows.append(
+                ["Wall time (s)", *mark_best_worst(values("timing", "wall_seconds"))]
+            )
+
+        print(f"Scenario {toml_file} - {scenario_name}:")
+        print_table(["Metric", *pip_names], rows)
+        for pip_name, summary_json in scenario_summaries.items():
+            for message in nondeterminism_messages(pip_name, summary_json):
+                print(f"\t{message}")
+        print()
+
+        if len(scenario_summaries) == len(pip_names):
+            baseline = scenario_summaries[pip_names[0]]["summary"]
+            for metric, _ in AGGREGATE_METRICS:
+                for pip_name in pip_names:
+                    ratios[metric][pip_name].append(
+                        ratio(
+                            baseline[metric],
+                            scenario_summaries[pip_name]["summary"][metric],
+                        )
+                    )
+
+    return ratios
+
+
+def print_aggregates(
+    title: str, pip_names: list[str], ratios: dict[str, dict[str, list[float]]]
+) -> None:
+    scenario_count = len(ratios[AGGREGATE_METRICS[0][0]][pip_names[0]])
+    if not scenario_count:
+        return
+
+    print(
+        f"{title}: geometric mean ratio to {pip_names[0]} over {scenario_count} scenarios"
+    )
+    rows = []
+    for metric, label in AGGREGATE_METRICS:
+        means = [
+            round(geometric_mean(ratios[metric][pip_name]), 3) for pip_name in pip_names
+        ]
+        rows.append([label, *mark_best_worst(means)])
+    print_table(["Metric", *pip_names], rows)
+    print()
+
+
+def compare_matrix(
+    scenarios_path: Path, pip_names: list[str], conn: sqlite3.Connection | None = None
+) -> None:
+    overall: dict[str, dict[str, list[float]]] = {
+        metric: {pip_name: [] for pip_name in pip_names}
+        for metric, _ in AGGREGATE_METRICS
+    }
+    print(f"Best values are marked {BEST_MARKER} and worst {WORST_MARKER}\n")
+    for toml_file in scenarios_path.glob("*.toml"):
+        ratios = process_toml_file_matrix(toml_file, pip_names, conn)
+        print_aggregates(f"File {toml_file.name[:-5]}", pip_names, ratios)
+        for metric, pip_ratios in ratios.items():
+            for pip_name, values in pip_ratios.items():
+                overall[metric][pip_name].extend(values)
+    print_aggregates("Overall", pip_names, overall)
+
+
 def main(
     pip_version_1: str | None = None,
     github_repo_1: str | None = None,
@@ -195,10 +563,42 @@ def main(
     pip_version_2: str | None = None,
     github_repo_2: str | None = None,
     git_commit_2: str | None = None,
+    timing_threshold: float = 10.0,
+    matrix: list[str] | None = None,
+    results_db: Path | None = None,
+    alpha: float = 0.05,
+    scenarios_dir: Path = Path(SCENARIOS_DIR),
 ) -> None:
     """
-    Pass in either a pip version or a github branch and git commit
+    Pass in either a pip version or a github branch and git commit,
+    timing changes smaller than --timing-threshold percent are not shown,
+    nor, for summaries recorded with --repeat, changes the Mann-Whitney U
+    test does not find significant at --alpha.
+
+    Alternatively pass --matrix once per pip name (as used in summaries/,
+    e.g. 26.0 or notatallshaw#pip@<commit>) to compare any number of them,
+    ratios are relative to the first one given.
+
+    With --results-db summaries are read from that database (see
+    results_db.py) instead of the summaries/ directory.
+
+    --scenarios-dir compares the TOML files of another directory, e.g. the
+    synthetic scenarios written by synthetic.py.
     """
+    scenarios_path = scenarios_dir
+    conn = None
+    if results_db is not None:
+        if not results_db.exists():
+            raise RuntimeError(f"Results database {results_db} does not exist")
+        conn = connect(results_db)
+
+    if matrix:
+        if not scenarios_path.exists() or not scenarios_path.is_dir():
+            print(f"The directory '{scenarios_dir}' does not exist")
+            return
+        compare_matrix(scenarios_path, matrix, conn)
+        return
+
     if pip_version_1:
         pip_name_1 = pip_version_1
     elif github_repo_1 and git_commit_1:
@@ -217,15 +617,19 @@ def main(
             "Provide either a pip version or a github branch and git commit"
         )
 
-    scenarios_path = Path(SCENARIOS_DIR)
     if not scenarios_path.exists() or not scenarios_path.is_dir():
-        print(f"The directory '{SCENARIOS_DIR}' does not exist")
+        print(f"The directory '{scenarios_dir}' does not exist")
         return
 
     # Loop through each TOML file in the scenarios directory
     for toml_file in scenarios_path.glob("*.toml"):
         process_toml_file(
-            toml_file=toml_file, pip_name_1=pip_name_1, pip_name_2=pip_name_2
+            toml_file=toml_file,
+            pip_name_1=pip_name_1,
+            pip_name_2=pip_name_2,
+            timing_threshold=timing_threshold,
+            conn=conn,
+            alpha=alpha,
         )
 
 
@@ -0,0 +1,38 @@
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#   "typer",
+# ]
+# ///
+
+from pathlib import Path
+
+import typer
+
+from traces import TRACE_SUFFIXES, TraceWriter, read_trace, trace_codec
+
+
+def main(source: Path, destination: Path) -> None:
+    """
+    Convert a resolution trace between codecs, by the suffix of each path,
+    e.g. a compact .ctrace trace back to JSON Lines with
+    convert_trace.py 24.2.ctrace 24.2.jsonl. Every record is kept as is
+    """
+    if not any(destination.name.endswith(s) for s in TRACE_SUFFIXES.values()):
+        raise RuntimeError(
+            f"{destination} must end with one of: {', '.join(TRACE_SUFFIXES.values())}"
+        )
+    if source.resolve() == destination.resolve():
+        raise RuntimeError("The source and destination must be different files")
+
+    with TraceWriter(destination, trace_codec(destination)) as trace_writer:
+        for record in read_trace(source):
+            trace_writer.write(record)
+    print(
+        f"Wrote {destination}: {destination.stat().st_size} bytes "
+        f"from {source.stat().st_size} bytes"
+    )
+
+
+if __name__ == "__main__":
+    typer.run(main)
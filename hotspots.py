@@ -0,0 +1,195 @@
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#   "typer",
+# ]
+# ///
+
+import re
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any
+
+import typer
+
+from compare import print_table
+from traces import TRACE_SUFFIXES, read_trace
+
+OUTPUT_DIR = "output"
+# Traces written before output was streamed are a single JSON document
+TRACE_FILE_SUFFIXES = (*TRACE_SUFFIXES.values(), ".json")
+REQUIREMENT_NAME_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
+# Most rejection causes listed per project
+MAX_CAUSES_LISTED = 3
+
+
+def canonical_name(name: str) -> str:
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def file_project(filename: str) -> str:
+    """
+    Project of a pinned or added file, wheel names end at the first dash
+    while sdist names can contain dashes and end at the last one.
+    """
+    if filename == "PythonCandidate":
+        return "<python>"
+    if filename.endswith(".whl"):
+        return canonical_name(filename.split("-", 1)[0])
+    stem = re.sub(r"\.(tar\.gz|tar\.bz2|tar\.xz|tgz|tar|zip)$", "", filename)
+    name, _, _ = stem.rpartition("-")
+    return canonical_name(name or stem)
+
+
+def requirement_project(requirement: str) -> str:
+    match = REQUIREMENT_NAME_RE.match(requirement.strip())
+    return canonical_name(match[0]) if match else requirement
+
+
+class ProjectHotspots:
+    """
+    Per project counters accumulated one resolution round at a time: the
+    rounds it owned, the distinct versions tried, how often it was pinned
+    and rejected, and the requirements behind each rejection.
+
+    A round is owned by the project pinned in it or, in a round that pins
+    nothing, by the project whose candidates were tried.
+    """
+
+    def __init__(self) -> None:
+        self.number_rounds = 0
+        self.rounds_owned: Counter[str] = Counter()
+        self.versions_tried: defaultdict[str, set[str]] = defaultdict(set)
+        self.pins: Counter[str] = Counter()
+        self.rejections: Counter[str] = Counter()
+        self.rejection_causes: defaultdict[str, Counter[str]] = defaultdict(Counter)
+
+    def add_round(self, resolution_round: dict[str, Any]) -> None:
+        self.number_rounds += 1
+        pinned = resolution_round.get("pinned", [])
+        added = resolution_round.get("added", {})
+        rejected = resolution_round.get("rejected", {})
+
+        for filename in pinned:
+            self.pins[file_project(filename)] += 1
+        for filename in [*pinned, *added]:
+            self.versions_tried[file_project(filename)].add(filename)
+
+        rejected_projects = set()
+        for requirement, froms in rejected.items():
+            project = requirement_project(requirement)
+            rejected_projects.add(project)
+            for from_file in froms:
+                cause = f"{requirement} by {file_project(from_file)}"
+                self.rejection_causes[project][cause] += 1
+        self.rejections.update(rejected_projects)
+
+        if pinned:
+            owner = file_project(pinned[0])
+        elif added:
+            owner = file_project(next(iter(added)))
+        elif rejected:
+            owner = requirement_project(next(iter(rejected)))
+        else:
+            return
+        self.rounds_owned[owner] += 1
+
+    def ranked(self, top: int) -> list[list[str]]:
+        """
+        Table rows of the top projects by rounds owned, then rejections.
+        """
+        projects = sorted(
+            set(self.rounds_owned) | set(self.rejections),
+            key=lambda p: (-self.rounds_owned[p], -self.rejections[p], p),
+        )
+        rows = []
+        for project in projects[:top]:
+            owned = self.rounds_owned[project]
+            share = owned / self.number_rounds if self.number_rounds else 0.0
+            causes = ", ".join(
+                f"{cause} ({count})"
+                for cause, count in self.rejection_causes[project].most_common(
+                    MAX_CAUSES_LISTED
+                )
+            )
+            rows.append(
+                [
+                    project,
+                    str(owned),
+                    f"{share:.1%}",
+                    str(len(self.versions_tried[project])),
+                    str(self.pins[project]),
+                    str(self.rejections[project]),
+                    causes,
+                ]
+            )
+        return rows
+
+
+def trace_hotspots(trace_path: Path) -> ProjectHotspots:
+    hotspots = ProjectHotspots()
+    for record in read_trace(trace_path):
+        if "round" in record:
+            hotspots.add_round(record["round"])
+    return hotspots
+
+
+def find_traces(
+    output_dir: Path, pip_names: list[str] | None, scenario_names: list[str] | None
+) -> list[tuple[str, str, str, Path]]:
+    """
+    Find output/<toml>/<scenario>/<pip name><suffix> traces, returned as
+    (toml name, scenario name, pip name, path), filtered by pip and
+    scenario name when given.
+    """
+    traces = []
+    for path in sorted(output_dir.glob("*/*/*")):
+        suffix = next((s for s in TRACE_FILE_SUFFIXES if path.name.endswith(s)), None)
+        if suffix is None or path.name.startswith("."):
+            continue
+        pip_name = path.name.removesuffix(suffix)
+        scenario_name = path.parent.name
+        if pip_names and pip_name not in pip_names:
+            continue
+        if scenario_names and scenario_name not in scenario_names:
+            continue
+        traces.append((path.parent.parent.name, scenario_name, pip_name, path))
+    return traces
+
+
+def main(
+    pip_name: list[str] | None = None,
+    scenario: list[str] | None = None,
+    top: int = 10,
+    output_dir: Path = Path(OUTPUT_DIR),
+) -> None:
+    """
+    Rank the projects the resolver spent its rounds on, per scenario and
+    pip name, from the traces written by scenarios.py --include-output.
+    --pip-name and --scenario, both repeatable, limit which traces are read
+    """
+    traces = find_traces(output_dir, pip_name, scenario)
+    if not traces:
+        raise RuntimeError(f"No resolution traces found under {output_dir}")
+
+    header = [
+        "project",
+        "rounds owned",
+        "share",
+        "versions tried",
+        "pins",
+        "rejections",
+        "top rejection causes",
+    ]
+    for toml_name, scenario_name, trace_pip_name, path in traces:
+        hotspots = trace_hotspots(path)
+        print(
+            f"Hotspots for {toml_name} - {scenario_name} with {trace_pip_name} "
+            f"({hotspots.number_rounds} rounds):"
+        )
+        print_table(header, hotspots.ranked(top))
+        print()
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,280 @@
+import hashlib
+import html
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+from urllib.parse import unquote, urljoin, urlsplit
+
+RECORD = "record"
+REPLAY = "replay"
+INDEX_MODES = (RECORD, REPLAY)
+
+UPSTREAM_INDEX_URL = "https://pypi.org/simple/"
+
+JSON_CONTENT_TYPES = ("application/vnd.pypi.simple.v1+json", "application/json")
+HTML_ANCHOR_RE = re.compile(r"<a\s[^>]*>.*?</a>\s*(?:<br\s*/?>)?", re.DOTALL)
+HTML_ATTRIBUTE_RE = re.compile(r'([\w-]+)="([^"]*)"')
+
+CHUNK_SIZE = 1024 * 1024
+
+# The same caching headers PyPI sends, so pip's HTTP cache behaves as it
+# would against PyPI, project pages go stale and files never change
+PAGE_CACHE_CONTROL = "max-age=600, public"
+FILE_CACHE_CONTROL = "max-age=365000000, immutable, public"
+
+
+def parse_upload_time(value: str) -> datetime:
+    """
+    Parse an upload time the same way pip parses --uploaded-prior-to,
+    naive datetimes are taken to be in local time.
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.astimezone()
+    return parsed
+
+
+class SnapshotStore:
+    """
+    Content addressed store of index responses, objects are stored by the
+    sha256 of their content and refs map each upstream URL to an object.
+    Every file is written to a temporary file and renamed into place, so
+    concurrent recorders never see partial files.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.objects_dir = root / "objects"
+        self.refs_dir = root / "refs"
+
+    def _ref_path(self, url: str) -> Path:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.refs_dir / key[:2] / f"{key}.json"
+
+    def object_path(self, sha256: str) -> Path:
+        return self.objects_dir / sha256[:2] / sha256
+
+    def lookup(self, url: str) -> dict[str, str] | None:
+        try:
+            ref = json.loads(self._ref_path(url).read_text())
+        except (OSError, json.JSONDecodeError):
+            return None
+        if not self.object_path(ref["sha256"]).exists():
+            return None
+        return ref
+
+    def _write_atomic(self, path: Path, write: Any) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(temp_name, path)
+        finally:
+            Path(temp_name).unlink(missing_ok=True)
+
+    def record(self, url: str, content_type: str, response: Any) -> dict[str, str]:
+        """
+        Stream response into the store and point the ref for url at it.
+        """
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, temp_name = tempfile.mkstemp(prefix=".download.", dir=self.objects_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while chunk := response.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+            sha256 = digest.hexdigest()
+            object_path = self.object_path(sha256)
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(temp_name, object_path)
+        finally:
+            Path(temp_name).unlink(missing_ok=True)
+
+        ref = {"url": url, "sha256": sha256, "content_type": content_type}
+        self._write_atomic(
+            self._ref_path(url), lambda f: f.write(json.dumps(ref, indent=1).encode())
+        )
+        return ref
+
+
+class SnapshotIndexServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        store: SnapshotStore,
+        mode: str,
+        uploaded_prior_to: datetime | None,
+        upstream_index_url: str = UPSTREAM_INDEX_URL,
+        port: int = 0,
+    ) -> None:
+        super().__init__(("127.0.0.1", port), SnapshotIndexHandler)
+        self.store = store
+        self.mode = mode
+        self.uploaded_prior_to = uploaded_prior_to
+        self.upstream_index_url = upstream_index_url
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def index_url(self) -> str:
+        return f"{self.base_url}/simple/"
+
+    def local_file_url(self, upstream_url: str) -> str:
+        parts = urlsplit(upstream_url)
+        local_url = f"{self.base_url}/files/{parts.scheme}/{parts.netloc}{parts.path}"
+        if parts.fragment:
+            local_url += f"#{parts.fragment}"
+        return local_url
+
+    def upstream_url(self, path: str) -> str | None:
+        if path.startswith("/simple/"):
+            return urljoin(self.upstream_index_url, path[len("/simple/") :])
+        if path.startswith("/files/"):
+            scheme, _, rest = path[len("/files/") :].partition("/")
+            if scheme in ("http", "https") and rest:
+                return f"{scheme}://{rest}"
+        return None
+
+    def is_uploaded_in_time(self, upload_time: str | None) -> bool:
+        if self.uploaded_prior_to is None or upload_time is None:
+            return True
+        return parse_upload_time(upload_time) < self.uploaded_prior_to
+
+    def rewrite_json_page(self, page_url: str, content: bytes) -> bytes:
+        page = json.loads(content)
+        files = []
+        for file in page.get("files", []):
+            if not self.is_uploaded_in_time(file.get("upload-time")):
+                continue
+            file = {**file, "url": self.local_file_url(urljoin(page_url, file["url"]))}
+            files.append(file)
+        page["files"] = files
+        return json.dumps(page).encode()
+
+    def rewrite_html_page(self, page_url: str, content: bytes) -> bytes:
+        def rewrite_anchor(match: re.Match[str]) -> str:
+            anchor = match.group(0)
+            attributes = dict(HTML_ATTRIBUTE_RE.findall(anchor))
+            if not self.is_uploaded_in_time(attributes.get("data-upload-time")):
+                return ""
+            if "href" not in attributes:
+                return anchor
+            upstream_url = urljoin(page_url, html.unescape(attributes["href"]))
+            local_url = html.escape(self.local_file_url(upstream_url))
+            return anchor.replace(f'href="{attributes["href"]}"', f'href="{local_url}"')
+
+        return HTML_ANCHOR_RE.sub(rewrite_anchor, content.decode()).encode()
+
+
+class SnapshotIndexHandler(BaseHTTPRequestHandler):
+    server: SnapshotIndexServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        path = unquote(urlsplit(self.path).path)
+        upstream_url = self.server.upstream_url(path)
+        if upstream_url is None:
+            self.send_error(404)
+            return
+
+        store = self.server.store
+        ref = store.lookup(upstream_url)
+        if ref is None and self.server.mode == RECORD:
+            ref = self.fetch_upstream(upstream_url)
+        if ref is None:
+            self.send_error(404, f"Not in snapshot: {upstream_url}")
+            return
+
+        object_path = store.object_path(ref["sha256"])
+        content_type = ref["content_type"]
+        if path.startswith("/simple/"):
+            content = object_path.read_bytes()
+            media_type = content_type.split(";")[0].strip()
+            if media_type in JSON_CONTENT_TYPES:
+                content = self.server.rewrite_json_page(upstream_url, content)
+            elif media_type == "text/html":
+                content = self.server.rewrite_html_page(upstream_url, content)
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(content)))
+            self.send_header("Cache-Control", PAGE_CACHE_CONTROL)
+            self.end_headers()
+            self.wfile.write(content)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(object_path.stat().st_size))
+        self.send_header("Cache-Control", FILE_CACHE_CONTROL)
+        self.end_headers()
+        with open(object_path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+    def fetch_upstream(self, upstream_url: str) -> dict[str, str] | None:
+        headers = {"User-Agent": "pip-resolution-scenarios-snapshot"}
+        if accept := self.headers.get("Accept"):
+            headers["Accept"] = accept
+        request = urllib.request.Request(upstream_url, headers=headers)
+        try:
+            with urllib.request.urlopen(request) as response:
+                content_type = response.headers.get(
+                    "Content-Type", "application/octet-stream"
+                )
+                return self.server.store.record(upstream_url, content_type, response)
+        except urllib.error.URLError:
+            return None
+
+
+@contextmanager
+def serve_index_snapshot(
+    snapshot_dir: Path,
+    mode: str,
+    uploaded_prior_to: str | None = None,
+    upstream_index_url: str = UPSTREAM_INDEX_URL,
+    port: int = 0,
+) -> Iterator[str]:
+    """
+    Serve snapshot_dir as a local simple index for the duration of the
+    context, yielding the index URL to pass to pip. In record mode
+    anything missing is fetched from upstream_index_url and stored, in
+    replay mode only the snapshot is used. Files uploaded at or after
+    uploaded_prior_to are left out of project pages. Port 0 picks a free
+    port, a fixed one keeps the URLs, and so pip's HTTP cache keys, stable.
+    """
+    if mode not in INDEX_MODES:
+        raise ValueError(f"Unknown index snapshot mode: {mode}")
+
+    server = SnapshotIndexServer(
+        SnapshotStore(snapshot_dir),
+        mode,
+        parse_upload_time(uploaded_prior_to) if uploaded_prior_to else None,
+        upstream_index_url,
+        port,
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server.index_url
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
@@ -0,0 +1,69 @@
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#   "typer",
+# ]
+# ///
+
+from pathlib import Path
+
+import typer
+
+from compare import print_table
+from profiles import FunctionCost, load_profile
+
+
+def format_change(before: float, after: float) -> str:
+    change = after - before
+    if before:
+        return f"{change:+.3f}s ({change / before:+.0%})"
+    return f"{change:+.3f}s"
+
+
+def main(profile_1: Path, profile_2: Path, top: int = 20) -> None:
+    """
+    Compare two profiles written by scenarios.py --profile, e.g. the same
+    scenario with two pip versions, listing the functions whose self time
+    and whose cumulative time changed the most. Functions are matched by
+    file and name, so they are matched across pip versions
+    """
+    total_1, costs_1 = load_profile(profile_1)
+    total_2, costs_2 = load_profile(profile_2)
+    print(f"1: {profile_1} ({total_1:.3f}s)")
+    print(f"2: {profile_2} ({total_2:.3f}s)")
+    print(f"Total: {format_change(total_1, total_2)}")
+
+    missing = FunctionCost()
+    for by, label in (
+        ("self_seconds", "self time"),
+        ("cumulative_seconds", "cumulative time"),
+    ):
+        changes = sorted(
+            costs_1.keys() | costs_2.keys(),
+            key=lambda key: (
+                -abs(
+                    getattr(costs_2.get(key, missing), by)
+                    - getattr(costs_1.get(key, missing), by)
+                )
+            ),
+        )
+        rows = []
+        for key in changes[:top]:
+            cost_1 = costs_1.get(key, missing)
+            cost_2 = costs_2.get(key, missing)
+            rows.append(
+                [
+                    key,
+                    f"{getattr(cost_1, by):.3f}s",
+                    f"{getattr(cost_2, by):.3f}s",
+                    format_change(getattr(cost_1, by), getattr(cost_2, by)),
+                    str(cost_1.calls),
+                    str(cost_2.calls),
+                ]
+            )
+        print(f"\nLargest changes in {label}:")
+        print_table(["function", "1", "2", "change", "calls 1", "calls 2"], rows)
+
+
+if __name__ == "__main__":
+    typer.run(main)
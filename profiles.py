@@ -0,0 +1,87 @@
+import pstats
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+PROFILE_SUFFIX = ".pstats"
+# Functions listed by cumulative and by self time in a summary's profile
+PROFILE_TOP = 20
+# Everything up to a distribution's or the standard library's top level
+# module, which differs between virtual environments and Python versions
+LIBRARY_PREFIX_RE = re.compile(r".*[/\\](?:site-packages|lib[/\\]python\d+\.\d+)[/\\]")
+
+
+@dataclass
+class FunctionCost:
+    calls: int = 0
+    self_seconds: float = 0.0
+    cumulative_seconds: float = 0.0
+
+
+def function_key(filename: str, name: str) -> str:
+    """
+    A name for a profiled function that is the same in every virtual
+    environment and pip version, e.g.
+    pip/_internal/resolution/resolvelib/factory.py:find_candidates. Line
+    numbers are left out as they move between pip versions.
+    """
+    if filename == "~":
+        # Built-in functions, e.g. <method 'sort' of 'list' objects>
+        return name
+    if filename.startswith("<"):
+        return f"{filename}:{name}"
+    path = LIBRARY_PREFIX_RE.sub("", filename)
+    if path == filename:
+        path = Path(filename).name
+    return path.replace("\\", "/") + f":{name}"
+
+
+def load_profile(path: Path) -> tuple[float, dict[str, FunctionCost]]:
+    """
+    The total profiled seconds of a .pstats file and the cost of each
+    function by function_key. Functions of a file sharing a name, e.g.
+    methods of two classes, are numbered in line order, name#2 and so on.
+    """
+    stats = pstats.Stats(str(path))
+    by_key: dict[str, list[tuple[int, FunctionCost]]] = {}
+    for (filename, line, name), stat in stats.stats.items():
+        _, calls, self_seconds, cumulative_seconds, _ = stat
+        by_key.setdefault(function_key(filename, name), []).append(
+            (line, FunctionCost(calls, self_seconds, cumulative_seconds))
+        )
+
+    costs: dict[str, FunctionCost] = {}
+    for key, functions in by_key.items():
+        functions.sort(key=lambda function: function[0])
+        for number, (_, cost) in enumerate(functions, 1):
+            costs[key if number == 1 else f"{key}#{number}"] = cost
+    return stats.total_tt, costs
+
+
+def top_functions(
+    costs: dict[str, FunctionCost], by: str, top: int = PROFILE_TOP
+) -> list[dict[str, Any]]:
+    ranked = sorted(costs.items(), key=lambda item: -getattr(item[1], by))
+    return [
+        {
+            "function": key,
+            "calls": cost.calls,
+            "self_seconds": round(cost.self_seconds, 4),
+            "cumulative_seconds": round(cost.cumulative_seconds, 4),
+        }
+        for key, cost in ranked[:top]
+    ]
+
+
+def profile_summary(path: Path, top: int = PROFILE_TOP) -> dict[str, Any]:
+    """
+    The profile block of a summary: the total profiled time and the top
+    functions by cumulative and by self time.
+    """
+    total_seconds, costs = load_profile(path)
+    return {
+        "total_seconds": round(total_seconds, 3),
+        "top_cumulative": top_functions(costs, "cumulative_seconds", top),
+        "top_self": top_functions(costs, "self_seconds", top),
+    }
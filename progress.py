@@ -0,0 +1,254 @@
+import multiprocessing
+import queue
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from types import TracebackType
+from typing import Any, Self, TextIO
+
+# How often a running pip run publishes its progress, and the view redraws
+PUBLISH_SECONDS = 1.0
+REFRESH_SECONDS = 1.0
+# How often each running scenario is logged when stdout is not a terminal
+LOG_SECONDS = 30.0
+# Throughput is rounds completed over this trailing window
+RATE_WINDOW_SECONDS = 30.0
+# Throughput has collapsed when it falls below this fraction of the peak
+# rate seen over a full window, or no round completes for this long
+COLLAPSED_RATE_FRACTION = 0.1
+STALL_SECONDS = 120.0
+
+CLEAR_LINE = "\x1b[2K"
+CURSOR_UP = "\x1b[{}A"
+
+
+def format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+class ProgressTracker:
+    """
+    Publishes the progress of one pip run at most every PUBLISH_SECONDS as
+    a snapshot dict: the current round, rounds per second over the last
+    RATE_WINDOW_SECONDS and its peak, the distinct wheels and sdists
+    visited so far and the last pinned file.
+    """
+
+    def __init__(self, label: str, publish: Callable[[dict[str, Any]], None]) -> None:
+        self.label = label
+        self.publish = publish
+        self.started_at = time.time()
+        self.last_round_at: float | None = None
+        self.last_pinned: str | None = None
+        self.round = 0
+        self.wheels = 0
+        self.sdists = 0
+        self.rate = 0.0
+        self.peak_rate = 0.0
+        self._samples: deque[tuple[float, int]] = deque([(self.started_at, 0)])
+        self._published_at = 0.0
+
+    def add_round(
+        self, resolution_round: dict[str, Any], round_count: int, wheels: int, sdists: int
+    ) -> None:
+        self.last_round_at = time.time()
+        if resolution_round.get("pinned"):
+            self.last_pinned = resolution_round["pinned"][-1]
+        self.round = round_count
+        self.wheels = wheels
+        self.sdists = sdists
+        self.update()
+
+    def update(self, force: bool = False) -> None:
+        now = time.time()
+        if not force and now - self._published_at < PUBLISH_SECONDS:
+            return
+        self._published_at = now
+
+        self._samples.append((now, self.round))
+        while len(self._samples) > 2 and now - self._samples[1][0] >= RATE_WINDOW_SECONDS:
+            self._samples.popleft()
+        window_start, window_round = self._samples[0]
+        if now > window_start:
+            self.rate = (self.round - window_round) / (now - window_start)
+        if now - window_start >= RATE_WINDOW_SECONDS:
+            self.peak_rate = max(self.peak_rate, self.rate)
+
+        self.publish(
+            {
+                "label": self.label,
+                "started_at": self.started_at,
+                "last_round_at": self.last_round_at,
+                "round": self.round,
+                "rate": self.rate,
+                "peak_rate": self.peak_rate,
+                "wheels": self.wheels,
+                "sdists": self.sdists,
+                "last_pinned": self.last_pinned,
+                "finished": False,
+            }
+        )
+
+
+def finished(label: str) -> dict[str, Any]:
+    """
+    The snapshot to publish once a scenario is done with every pip run.
+    """
+    return {"label": label, "finished": True}
+
+
+def stall_warning(snapshot: dict[str, Any], now: float) -> str | None:
+    since_round = now - (snapshot["last_round_at"] or snapshot["started_at"])
+    if since_round >= STALL_SECONDS:
+        return f"no round completed for {format_seconds(since_round)}"
+    peak_rate = snapshot["peak_rate"]
+    if peak_rate and snapshot["rate"] < peak_rate * COLLAPSED_RATE_FRACTION:
+        return (
+            f"throughput collapsed to {snapshot['rate']:.2f} rounds/s "
+            f"from a peak of {peak_rate:.1f} rounds/s"
+        )
+    return None
+
+
+def describe_progress(snapshot: dict[str, Any], now: float) -> str:
+    description = (
+        f"{snapshot['label']}: round {snapshot['round']}, "
+        f"{snapshot['rate']:.1f} rounds/s, "
+        f"{format_seconds(now - snapshot['started_at'])} elapsed, "
+        f"{snapshot['wheels']} wheels, {snapshot['sdists']} sdists"
+    )
+    if snapshot["last_pinned"]:
+        description += f", pinned {snapshot['last_pinned']}"
+    return description
+
+
+class LiveStdout:
+    """
+    Stands in for sys.stdout while the live view is drawn below the output,
+    clearing the view before anything else is written so it is redrawn
+    under it instead of over it.
+    """
+
+    def __init__(self, view: "ProgressView", stream: TextIO) -> None:
+        self.view = view
+        self.stream = stream
+
+    def write(self, text: str) -> int:
+        with self.view.lock:
+            self.view.clear()
+            return self.stream.write(text)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.stream, name)
+
+
+class ProgressView:
+    """
+    Shows the progress snapshots published to queue by every running
+    scenario, in this process or others with shared=True. On a terminal
+    one line per scenario is redrawn in place, otherwise each is logged
+    every LOG_SECONDS. Either way a warning is printed once when a
+    scenario's throughput collapses.
+    """
+
+    def __init__(self, shared: bool = False, stream: TextIO | None = None) -> None:
+        self.stream = stream or sys.stdout
+        self.live = self.stream.isatty()
+        self.manager = multiprocessing.Manager() if shared else None
+        self.queue: Any = self.manager.Queue() if self.manager else queue.SimpleQueue()
+        self.lock = threading.RLock()
+        self.snapshots: dict[str, dict[str, Any]] = {}
+        self.warned: set[str] = set()
+        self.drawn_lines = 0
+        self.logged_at = time.time()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self) -> Self:
+        if self.live:
+            sys.stdout = LiveStdout(self, self.stream)
+        self.thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.stopped.set()
+        self.thread.join()
+        with self.lock:
+            self.clear()
+        if self.live:
+            sys.stdout = self.stream
+        if self.manager is not None:
+            self.manager.shutdown()
+
+    def finish(self, label: str) -> None:
+        with self.lock:
+            self.snapshots.pop(label, None)
+            self.warned.discard(label)
+
+    def run(self) -> None:
+        while not self.stopped.wait(REFRESH_SECONDS):
+            self.refresh()
+
+    def drain(self) -> None:
+        while True:
+            try:
+                snapshot = self.queue.get_nowait()
+            except (queue.Empty, EOFError, OSError):
+                return
+            if snapshot["finished"]:
+                self.finish(snapshot["label"])
+            else:
+                self.snapshots[snapshot["label"]] = snapshot
+
+    def refresh(self) -> None:
+        with self.lock:
+            self.drain()
+            now = time.time()
+            warnings = []
+            for label, snapshot in self.snapshots.items():
+                warning = stall_warning(snapshot, now)
+                if warning is None:
+                    self.warned.discard(label)
+                elif label not in self.warned:
+                    self.warned.add(label)
+                    warnings.append(f"Warning: {label}: {warning}")
+
+            self.clear()
+            for warning in warnings:
+                self.stream.write(warning + "\n")
+            if self.live:
+                self.draw(now)
+            elif now - self.logged_at >= LOG_SECONDS:
+                self.logged_at = now
+                for snapshot in self.snapshots.values():
+                    self.stream.write(describe_progress(snapshot, now) + "\n")
+            self.stream.flush()
+
+    def draw(self, now: float) -> None:
+        width = shutil.get_terminal_size().columns
+        lines = [
+            describe_progress(snapshot, now)[: width - 1]
+            for snapshot in self.snapshots.values()
+        ]
+        for line in lines:
+            self.stream.write(line + "\n")
+        self.drawn_lines = len(lines)
+
+    def clear(self) -> None:
+        if self.drawn_lines:
+            self.stream.write(
+                CURSOR_UP.format(self.drawn_lines)
+                + f"\r{CLEAR_LINE}\n" * self.drawn_lines
+            )
+            self.stream.write(CURSOR_UP.format(self.drawn_lines))
+            self.drawn_lines = 0
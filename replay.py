@@ -0,0 +1,182 @@
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#   "compact_json",
+#   "inflection",
+#   "typer",
+#   "uv",
+# ]
+# ///
+
+import asyncio
+import gzip
+import json
+import os
+import statistics
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any
+
+import typer
+
+from compare import print_table
+from scenarios import (
+    RESOLUTION_RECORD_SUFFIX,
+    VENV_POOL_DIR,
+    VENV_POOL_SIZE,
+    ResolutionLines,
+    acquire_pooled_venv,
+    stream_process,
+)
+
+REPLAY_SHIM = Path(__file__).parent / "replay_shim.py"
+# Kept in step with RESULT_PREFIX in replay_shim.py
+REPLAY_RESULT_PREFIX = "ReplayResult "
+
+
+def read_record_header(record: Path) -> dict[str, Any]:
+    with gzip.open(record, "rt") as f:
+        record_json = json.load(f)
+    return {
+        key: record_json.get(key)
+        for key in ("version", "pip_version", "python_version", "max_rounds")
+    }
+
+
+def summary_of_record(record: Path) -> dict[str, Any] | None:
+    summary_path = record.with_name(
+        record.name.removesuffix(RESOLUTION_RECORD_SUFFIX) + ".json"
+    )
+    if not summary_path.exists():
+        return None
+    return json.load(summary_path.open())
+
+
+def run_replay(
+    python: Path, record: Path, repeat: int, max_rounds: int | None
+) -> tuple[ResolutionLines, dict[str, Any] | None, list[str]]:
+    """
+    Replay record with python, returns the rounds of the first replay, its
+    ReplayResult and stderr.
+    """
+    command = [str(python), "-W", "ignore", str(REPLAY_SHIM), str(record)]
+    command.extend(["--repeat", str(repeat)])
+    if max_rounds is not None:
+        command.extend(["--max-rounds", str(max_rounds)])
+
+    resolution_lines = ResolutionLines(keep_rounds=False)
+    replay_result = None
+    stderr_lines: list[str] = []
+
+    def on_stdout_line(line: str) -> bool:
+        nonlocal replay_result
+        if line.startswith(REPLAY_RESULT_PREFIX):
+            replay_result = json.loads(line[len(REPLAY_RESULT_PREFIX) :])
+        else:
+            resolution_lines.process_line(line)
+        return False
+
+    asyncio.run(
+        stream_process(
+            command,
+            cwd=None,
+            env={**os.environ, "PYTHONUNBUFFERED": "1"},
+            on_stdout_line=on_stdout_line,
+            on_stderr_line=stderr_lines.append,
+        )
+    )
+    return resolution_lines, replay_result, stderr_lines
+
+
+def main(
+    record: Path,
+    python: Path | None = None,
+    repeat: int = 1,
+    max_rounds: int | None = None,
+    venv_pool_size: int = VENV_POOL_SIZE,
+) -> None:
+    """
+    Re-resolve a scenario offline from the provider answers recorded by
+    scenarios.py --record-resolution, through the resolver of the pip that
+    recorded it or of --python, e.g. a pip checkout installed in a virtual
+    environment, and compare the rounds, pins and rejections to the
+    recorded summary. No network, metadata or builds are involved, so a
+    resolution takes seconds of CPU, --repeat N times it N times after the
+    replay the metrics are taken from.
+
+    --max-rounds defaults to the scenario's max_resolution_rounds.
+    """
+    if repeat < 1:
+        raise RuntimeError("--repeat must be at least 1")
+
+    header = read_record_header(record)
+    summary_json = summary_of_record(record)
+    if max_rounds is None and summary_json is not None:
+        max_rounds = summary_json["input"].get("max_resolution_rounds")
+
+    with ExitStack() as stack:
+        if python is None:
+            python = stack.enter_context(
+                acquire_pooled_venv(
+                    header["python_version"],
+                    f"pip=={header['pip_version']}",
+                    Path(VENV_POOL_DIR),
+                    venv_pool_size,
+                )
+            )
+            if python is None:
+                raise RuntimeError(
+                    f"No virtual environment with pip {header['pip_version']}, "
+                    "pass one with --python"
+                )
+
+        resolution_lines, replay_result, stderr_lines = run_replay(
+            python, record, repeat, max_rounds
+        )
+    if replay_result is None:
+        raise RuntimeError("Replay failed:\n" + "\n".join(stderr_lines))
+
+    replayed = resolution_lines.summary_metrics.as_dict([])
+    replayed.pop("install_info")
+    print(f"Record: {record} (pip {header['pip_version']})")
+    print(f"Outcome: {replay_result['outcome']}")
+    if replay_result["message"]:
+        print(f"\t{replay_result['message']}")
+
+    if summary_json is None:
+        recorded = {}
+        print("No summary next to the record, only the replay is shown")
+    else:
+        recorded = summary_json["summary"]
+    rows = [
+        [key, str(recorded.get(key, "")), str(value)] for key, value in replayed.items()
+    ]
+    print_table(["metric", "recorded", "replayed"], rows)
+
+    seconds = replay_result["seconds"]
+    if seconds:
+        replay_seconds = statistics.median(seconds)
+        line = f"Replay: {replay_seconds:.3f}s median of {len(seconds)}"
+        if summary_json is not None:
+            line += f", pip took {summary_json['timing']['wall_seconds']:.3f}s"
+        print(line)
+
+    if summary_json is not None and replay_result["resolution"] is not None:
+        installed = sorted(
+            info["file"] for info in recorded["install_info"] if "file" in info
+        )
+        if replay_result["resolution"] == installed:
+            print("Resolution: same files as recorded")
+        else:
+            print("Resolution: differs from recorded")
+            print_table(
+                ["", "files"],
+                [
+                    ["recorded", " ".join(installed)],
+                    ["replayed", " ".join(replay_result["resolution"])],
+                ],
+            )
+
+
+if __name__ == "__main__":
+    typer.run(main)
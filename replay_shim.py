@@ -0,0 +1,502 @@
+"""
+Records what pip's resolver provider answers during a pip run, and replays
+a record through the resolver of the pip it runs with, without network,
+metadata or builds, e.g. python replay_shim.py RECORD --repeat 100.
+
+reporter_shim.py --record PATH records while pip runs: the candidates each
+identifier's matches yielded, the dependencies of every candidate pip
+asked about, the root requirements and the provider's configuration.
+
+Replaying rebuilds pip's own requirement objects and runs pip's provider
+with only find_matches and get_dependencies answered from the record, so
+pip's preference and narrowing heuristics and resolvelib run as they are
+and changes to them can be measured in seconds. find_matches filters the
+recorded candidates the way pip filters an index's. When a resolution
+goes somewhere the recorded one never did it stops as Not Recorded.
+
+Replay prints the resolver's events like reporter_shim.py --events, then
+a ReplayResult line, for replay.py. Runs inside a virtual environment with
+pip, so only uses the standard library and pip.
+"""
+
+import argparse
+import gzip
+import json
+import sys
+import time
+
+from reporter_shim import candidate_file, candidate_info, event_reporter_class
+
+RECORD_VERSION = 1
+# Kept in step with REPLAY_RESULT_PREFIX in replay.py
+RESULT_PREFIX = "ReplayResult "
+SPECIFIER_REQUIREMENTS = ("SpecifierRequirement", "SpecifierWithoutExtrasRequirement")
+
+
+class NotRecorded(Exception):
+    """
+    The replayed resolution needs an answer the recorded one never asked for.
+    """
+
+
+class RoundLimit(Exception):
+    pass
+
+
+class ResolutionRecorder:
+    """
+    The provider's answers of one resolution. Candidates and requirements
+    are recorded once each, the same as pip compares them, and referred to
+    by their index.
+    """
+
+    def __init__(self):
+        self.header = {}
+        self.root = []
+        self.requirements = []
+        self.candidates = []
+        self.matches = {}
+        self.dependencies = {}
+        self.incomplete = set()
+        self._ids = {}
+        self._record_ids = {}
+        self._matched = set()
+        # Keeps recorded objects alive so their ids are not reused
+        self._objects = []
+
+    def _remember(self, value, table, record):
+        key = (table is self.candidates, json.dumps(record, sort_keys=True))
+        record_id = self._record_ids.get(key)
+        if record_id is None:
+            record_id = self._record_ids[key] = len(table)
+            table.append(record)
+        self._ids[id(value)] = record_id
+        self._objects.append(value)
+        return record_id
+
+    def candidate_id(self, candidate):
+        if id(candidate) in self._ids:
+            return self._ids[id(candidate)]
+        record = {
+            "kind": type(candidate).__name__,
+            "name": str(candidate.name),
+            "project_name": str(candidate.project_name),
+            "version": str(candidate.version),
+            "file": candidate_file(candidate),
+            "info": candidate_info(candidate),
+        }
+        base = getattr(candidate, "base", None)
+        if base is not None:
+            record["base"] = self.candidate_id(base)
+        return self._remember(candidate, self.candidates, record)
+
+    def requirement_id(self, requirement):
+        if id(requirement) in self._ids:
+            return self._ids[id(requirement)]
+        kind = type(requirement).__name__
+        record = {"kind": kind, "name": str(requirement.name)}
+        if kind in SPECIFIER_REQUIREMENTS:
+            _, ireq = requirement.get_candidate_lookup()
+            record["line"] = str(ireq.req)
+            record["extras"] = sorted(ireq.extras)
+        elif kind == "ExplicitRequirement":
+            record["candidate"] = self.candidate_id(requirement.candidate)
+        elif kind == "RequiresPythonRequirement":
+            record["specifier"] = str(requirement.specifier)
+            record["candidate"] = self.candidate_id(requirement._candidate)
+        elif kind != "UnsatisfiableRequirement":
+            record["text"] = str(requirement)
+        return self._remember(requirement, self.requirements, record)
+
+    def observe(self, identifier, candidate):
+        candidate_id = self.candidate_id(candidate)
+        if (identifier, candidate_id) not in self._matched:
+            self._matched.add((identifier, candidate_id))
+            self.matches.setdefault(identifier, []).append(candidate_id)
+
+    def write(self, path):
+        record = {
+            "version": RECORD_VERSION,
+            **self.header,
+            "root": self.root,
+            "requirements": self.requirements,
+            "candidates": self.candidates,
+            "matches": self.matches,
+            "dependencies": {str(c): ids for c, ids in self.dependencies.items()},
+            "incomplete": sorted(self.incomplete),
+        }
+        with gzip.open(path, "wt") as f:
+            json.dump(record, f, separators=(",", ":"))
+
+
+def install_recorder(recorder):
+    """
+    Record the answers of pip's provider into recorder, returns False when
+    pip's resolver is not laid out as expected.
+    """
+    try:
+        import pip
+        from pip._internal.resolution.resolvelib import resolver
+        from pip._internal.resolution.resolvelib.found_candidates import (
+            FoundCandidates,
+        )
+    except ImportError:
+        return False
+    if not hasattr(resolver, "PipProvider") or not hasattr(resolver, "RLResolver"):
+        return False
+
+    class RecordedMatches(FoundCandidates):
+        """
+        Wraps pip's lazy matches, observing each candidate as pip builds it.
+        Deriving from FoundCandidates keeps pip's refusal to index or size
+        them, and keeps them a Sequence, which resolvelib would otherwise
+        list up front.
+        """
+
+        def __init__(self, identifier, matches):
+            self.identifier = identifier
+            self.matches = matches
+            self._bool = None
+
+        def __iter__(self):
+            for candidate in self.matches:
+                recorder.observe(self.identifier, candidate)
+                yield candidate
+
+        def __bool__(self):
+            if self._bool is None:
+                self._bool = any(True for _ in self)
+            return self._bool
+
+    class RecordingProvider(resolver.PipProvider):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            recorder.header["provider"] = {
+                "constraints": {
+                    name: str(constraint.specifier)
+                    for name, constraint in getattr(self, "_constraints", {}).items()
+                },
+                "ignore_dependencies": getattr(self, "_ignore_dependencies", False),
+                "upgrade_strategy": getattr(self, "_upgrade_strategy", "to-satisfy-only"),
+                "user_requested": dict(getattr(self, "_user_requested", {})),
+            }
+            try:
+                prefs = self._factory._finder._candidate_prefs
+                recorder.header["allow_all_prereleases"] = prefs.allow_all_prereleases
+            except AttributeError:
+                recorder.header["allow_all_prereleases"] = False
+
+        def find_matches(self, identifier, requirements, incompatibilities):
+            matches = super().find_matches(identifier, requirements, incompatibilities)
+            if isinstance(matches, FoundCandidates):
+                return RecordedMatches(identifier, matches)
+            # Not lazy, so all of it is observed now
+            matches = list(matches)
+            for candidate in matches:
+                recorder.observe(identifier, candidate)
+            return matches
+
+        def get_dependencies(self, candidate):
+            # resolvelib stops taking dependencies at the first conflict, so
+            # they are recorded as they are taken
+            candidate_id = recorder.candidate_id(candidate)
+            recorded = recorder.dependencies.setdefault(candidate_id, [])
+            if len(recorded) == 0:
+                recorder.incomplete.add(candidate_id)
+            for position, requirement in enumerate(super().get_dependencies(candidate)):
+                if position == len(recorded):
+                    recorded.append(recorder.requirement_id(requirement))
+                yield requirement
+            recorder.incomplete.discard(candidate_id)
+
+    class RecordingResolver(resolver.RLResolver):
+        def resolve(self, requirements, max_rounds=100):
+            requirements = list(requirements)
+            recorder.root = [recorder.requirement_id(r) for r in requirements]
+            recorder.header["max_rounds"] = max_rounds
+            return super().resolve(requirements, max_rounds=max_rounds)
+
+    recorder.header["pip_version"] = pip.__version__
+    recorder.header["python_version"] = "{}.{}".format(*sys.version_info)
+    resolver.PipProvider = RecordingProvider
+    resolver.RLResolver = RecordingResolver
+    return True
+
+
+class ReplayCandidate:
+    """
+    A recorded candidate, with the attributes pip's provider and
+    requirements use of a candidate.
+    """
+
+    is_editable = False
+    is_installed = False
+    source_link = None
+
+    def __init__(self, record_id, recorded, version):
+        self.record_id = record_id
+        self.recorded = recorded
+        self.name = recorded["name"]
+        self.project_name = recorded["project_name"]
+        self.version = version
+
+    def format_for_error(self):
+        return f"{self.name} {self.version}"
+
+    def __repr__(self):
+        return f"ReplayCandidate({self.name!r}, {str(self.version)!r})"
+
+
+def load_replay(record):
+    """
+    The provider and root requirements replaying record with pip's own
+    provider and requirements.
+    """
+    from pip._internal.req.constructors import install_req_from_req_string
+    from pip._internal.resolution.resolvelib import requirements as pip_requirements
+    from pip._internal.resolution.resolvelib.base import Constraint
+    from pip._internal.resolution.resolvelib.provider import PipProvider
+    from pip._internal.utils.hashes import Hashes
+    from pip._vendor.packaging.specifiers import SpecifierSet
+    from pip._vendor.packaging.version import parse as parse_version
+
+    if record.get("version") != RECORD_VERSION or "max_rounds" not in record:
+        raise NotRecorded("the record is incomplete or of another version")
+
+    candidates = [
+        ReplayCandidate(i, recorded, parse_version(recorded["version"]))
+        for i, recorded in enumerate(record["candidates"])
+    ]
+    requirements = []
+    for recorded in record["requirements"]:
+        kind = recorded["kind"]
+        if kind in SPECIFIER_REQUIREMENTS:
+            ireq = install_req_from_req_string(recorded["line"])
+            ireq.extras = set(recorded["extras"])
+            requirement = getattr(pip_requirements, kind)(ireq)
+        elif kind == "ExplicitRequirement":
+            requirement = pip_requirements.ExplicitRequirement(
+                candidates[recorded["candidate"]]
+            )
+        elif kind == "RequiresPythonRequirement":
+            requirement = pip_requirements.RequiresPythonRequirement(
+                SpecifierSet(recorded["specifier"]), candidates[recorded["candidate"]]
+            )
+        elif kind == "UnsatisfiableRequirement":
+            requirement = pip_requirements.UnsatisfiableRequirement(recorded["name"])
+        else:
+            raise NotRecorded(f"a {kind} cannot be replayed: {recorded['text']}")
+        if requirement.name != recorded["name"]:
+            raise NotRecorded(
+                f"{recorded['name']} is {requirement.name} when rebuilt by this pip"
+            )
+        requirements.append(requirement)
+
+    # pip yields the best candidate of each version, newest first
+    pools = {
+        identifier: sorted(
+            (candidates[i] for i in candidate_ids),
+            key=lambda candidate: candidate.version,
+            reverse=True,
+        )
+        for identifier, candidate_ids in record["matches"].items()
+    }
+    extras_candidates = {
+        (candidate.name, candidate.recorded["base"]): candidate
+        for candidate in candidates
+        if "base" in candidate.recorded
+    }
+    dependencies = {
+        int(candidate_id): [requirements[i] for i in requirement_ids]
+        for candidate_id, requirement_ids in record["dependencies"].items()
+    }
+    incomplete = set(record["incomplete"])
+    provider_config = record["provider"]
+    constraints = {
+        name: Constraint(SpecifierSet(specifier), Hashes(), frozenset())
+        for name, specifier in provider_config["constraints"].items()
+    }
+    prereleases = True if record["allow_all_prereleases"] else None
+    # The candidates of an identifier a specifier allows, pip's resolver asks
+    # for the same ones over and over while backtracking
+    filtered = {}
+
+    class ReplayProvider(PipProvider):
+        def find_matches(self, identifier, requirements, incompatibilities):
+            # As pip's Factory.find_candidates over the recorded candidates
+            incompatible = set(map(id, incompatibilities.get(identifier, ())))
+            explicit = []
+            ireqs = []
+            for requirement in requirements[identifier]:
+                candidate, ireq = requirement.get_candidate_lookup()
+                if candidate is not None and candidate not in explicit:
+                    explicit.append(candidate)
+                if ireq is not None:
+                    ireqs.append(ireq)
+            name, extras, _ = identifier.partition("[")
+            if extras:
+                for requirement in requirements.get(name, ()):
+                    candidate, ireq = requirement.get_candidate_lookup()
+                    if candidate is not None:
+                        key = (identifier, getattr(candidate, "record_id", None))
+                        if key in extras_candidates:
+                            explicit.append(extras_candidates[key])
+                    if ireq is not None:
+                        ireqs.append(ireq)
+
+            if explicit:
+                return [
+                    candidate
+                    for candidate in explicit
+                    if id(candidate) not in incompatible
+                    and all(
+                        self.is_satisfied_by(requirement, candidate)
+                        for requirement in requirements[identifier]
+                    )
+                ]
+            if not ireqs:
+                return []
+
+            constraint = constraints.get(identifier) or constraints.get(name)
+            specifier = SpecifierSet() if constraint is None else constraint.specifier
+            for ireq in ireqs:
+                specifier &= ireq.req.specifier
+            key = (identifier, str(specifier))
+            allowed = filtered.get(key)
+            if allowed is None:
+                pool = pools.get(identifier, [])
+                versions = {
+                    id(version)
+                    for version in specifier.filter(
+                        (candidate.version for candidate in pool),
+                        prereleases=prereleases,
+                    )
+                }
+                allowed = filtered[key] = [
+                    candidate for candidate in pool if id(candidate.version) in versions
+                ]
+            return [
+                candidate for candidate in allowed if id(candidate) not in incompatible
+            ]
+
+        def get_dependencies(self, candidate):
+            recorded = dependencies.get(candidate.record_id)
+            if recorded is None:
+                raise NotRecorded(
+                    f"pip never asked for the dependencies of {candidate.format_for_error()}"
+                )
+            yield from recorded
+            if candidate.record_id in incomplete:
+                raise NotRecorded(
+                    f"pip only took some dependencies of {candidate.format_for_error()}"
+                )
+
+    provider = ReplayProvider(
+        factory=None,
+        constraints=constraints,
+        ignore_dependencies=provider_config["ignore_dependencies"],
+        upgrade_strategy=provider_config["upgrade_strategy"],
+        user_requested=provider_config["user_requested"],
+    )
+    return provider, [requirements[i] for i in record["root"]]
+
+
+def round_limited(base, max_rounds):
+    """
+    A reporter class, derived from base, stopping the resolution after
+    max_rounds rounds, counting the rounds that did anything like
+    scenarios.py does.
+    """
+
+    class RoundLimitedReporter(base):
+        rounds = 0
+        busy = False
+
+        def starting_round(self, index):
+            self.busy = False
+            super().starting_round(index)
+
+        def adding_requirement(self, requirement, parent):
+            self.busy = True
+            super().adding_requirement(requirement, parent)
+
+        def pinning(self, candidate):
+            self.busy = True
+            super().pinning(candidate)
+
+        def rejecting_candidate(self, criterion, candidate):
+            self.busy = True
+            super().rejecting_candidate(criterion, candidate)
+
+        def ending_round(self, index, state):
+            super().ending_round(index, state)
+            if self.busy:
+                self.rounds += 1
+            if max_rounds is not None and self.rounds >= max_rounds:
+                raise RoundLimit
+
+    return RoundLimitedReporter
+
+
+def replay(record_path, repeat=1, max_rounds=None):
+    """
+    Replay the record once printing its events, then repeat times without
+    to time it, and print the outcome and the durations.
+    """
+    from pip._vendor.resolvelib import (
+        BaseReporter,
+        ResolutionImpossible,
+        ResolutionTooDeep,
+        Resolver,
+    )
+
+    with gzip.open(record_path, "rt") as f:
+        record = json.load(f)
+
+    result = {"outcome": None, "message": None, "resolution": None, "seconds": []}
+    try:
+        provider, root = load_replay(record)
+    except NotRecorded as e:
+        provider = root = None
+        result["outcome"] = "Not Recorded"
+        result["message"] = str(e)
+
+    for iteration in range(repeat + 1 if provider is not None else 0):
+        base = event_reporter_class(BaseReporter) if iteration == 0 else BaseReporter
+        resolver = Resolver(provider, round_limited(base, max_rounds)())
+        started = time.perf_counter()
+        try:
+            resolution = resolver.resolve(root, max_rounds=record["max_rounds"])
+        except ResolutionImpossible:
+            result["outcome"] = "Resolution Impossible"
+        except (ResolutionTooDeep, RoundLimit):
+            result["outcome"] = "Resolution Too Deep"
+        except NotRecorded as e:
+            result["outcome"] = "Not Recorded"
+            result["message"] = str(e)
+            break
+        else:
+            result["outcome"] = "Resolved"
+            # As pip's report, which leaves out the Python candidate
+            result["resolution"] = sorted(
+                filename
+                for filename in map(candidate_file, resolution.mapping.values())
+                if filename is not None
+            )
+        if iteration > 0:
+            result["seconds"].append(round(time.perf_counter() - started, 4))
+
+    sys.stdout.write(RESULT_PREFIX + json.dumps(result) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("record")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--max-rounds", type=int)
+    args = parser.parse_args()
+    replay(args.record, args.repeat, args.max_rounds)
+
+
+if __name__ == "__main__":
+    main()
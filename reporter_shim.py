@@ -0,0 +1,230 @@
+"""
+Runs pip in process, e.g. python reporter_shim.py --events install ...
+
+--events makes pip's resolver report each event as a line of JSON on
+stdout instead of the reprs PIP_RESOLVER_DEBUG logs, so scenarios.py
+--reporter shim reads events without parsing reprs. If pip's resolver is
+not laid out as expected pip runs unchanged and its debug output is parsed
+as usual.
+
+--profile PATH runs pip under cProfile and writes its stats to PATH when
+pip exits or is terminated, for scenarios.py --profile.
+
+--record PATH records what pip's resolver provider answered to PATH when
+pip exits or is terminated, for replay_shim.py to replay, see
+scenarios.py --record-resolution.
+
+Runs inside the scenario's virtual environment, so only uses the standard
+library and pip.
+"""
+
+import cProfile
+import json
+import os
+import signal
+import sys
+from pathlib import PurePosixPath
+from urllib.parse import urlparse
+
+# Kept in step with REPORTER_EVENT_PREFIX in scenarios.py
+EVENT_PREFIX = "ReporterEvent "
+USER_REQUIREMENT = "<User Requirement>"
+SDIST_SUFFIXES = (".tar.gz", ".tar.bz2", ".tar.xz", ".tgz", ".tar", ".zip")
+
+
+def emit(event):
+    sys.stdout.write(EVENT_PREFIX + json.dumps(event, separators=(",", ":")) + "\n")
+    sys.stdout.flush()
+
+
+def candidate_class(candidate):
+    # Candidates replayed by replay_shim.py carry what was recorded of them
+    recorded = getattr(candidate, "recorded", None)
+    return recorded["kind"] if recorded is not None else type(candidate).__name__
+
+
+def candidate_file(candidate):
+    # The file name scenarios.py extracts from the candidate's repr, which
+    # only names a file for a LinkCandidate, or one wrapped in extras
+    if candidate is None:
+        return USER_REQUIREMENT
+    recorded = getattr(candidate, "recorded", None)
+    if recorded is not None:
+        return recorded["file"]
+    base = getattr(candidate, "base", candidate)
+    if type(base).__name__ != "LinkCandidate":
+        return None
+    return PurePosixPath(urlparse(base._link.url).path).name
+
+
+def candidate_info(candidate):
+    if candidate is None:
+        return None
+    recorded = getattr(candidate, "recorded", None)
+    if recorded is not None:
+        return recorded["info"]
+    if type(candidate).__name__ == "RequiresPythonCandidate":
+        return {"name": "python", "version": str(candidate.version), "kind": "python"}
+    filename = candidate_file(candidate) or ""
+    if filename.endswith(".whl"):
+        kind = "wheel"
+    elif filename.endswith(SDIST_SUFFIXES):
+        kind = "sdist"
+    else:
+        kind = "other"
+    info = {
+        "name": str(candidate.project_name),
+        "version": str(candidate.version),
+        "kind": kind,
+    }
+    extras = getattr(candidate, "extras", None)
+    if extras:
+        info["extras"] = sorted(extras)
+    return info
+
+
+def requirement_text(requirement):
+    # The argument of the requirement's repr
+    candidate = getattr(requirement, "candidate", None)
+    if candidate is not None:
+        return candidate_file(candidate)
+    kind = type(requirement).__name__
+    if kind == "RequiresPythonRequirement":
+        return str(requirement.specifier)
+    if kind == "UnsatisfiableRequirement":
+        return str(requirement.name)
+    return str(requirement)
+
+
+def event_reporter_class(base):
+    """
+    A resolvelib reporter class, derived from base, printing every event.
+    """
+
+    class EventReporter(base):
+        def starting(self):
+            emit({"event": "starting"})
+
+        def starting_round(self, index):
+            emit({"event": "starting_round", "index": index})
+
+        def ending_round(self, index, state):
+            emit({"event": "ending_round", "index": index})
+
+        def ending(self, state):
+            emit({"event": "ending"})
+
+        def adding_requirement(self, requirement, parent):
+            emit(
+                {
+                    "event": "adding_requirement",
+                    "requirement": requirement_text(requirement),
+                    "from": candidate_file(parent),
+                    "name": str(requirement.name),
+                    "parent": candidate_info(parent),
+                }
+            )
+
+        def rejecting_candidate(self, criterion, candidate):
+            emit(
+                {
+                    "event": "rejecting_candidate",
+                    "causes": [
+                        {
+                            "requirement": requirement_text(information.requirement),
+                            "from": candidate_file(information.parent),
+                        }
+                        for information in criterion.information
+                    ],
+                    "file": candidate_file(candidate),
+                    "candidate": candidate_info(candidate),
+                }
+            )
+
+        def pinning(self, candidate):
+            python = candidate_class(candidate) == "RequiresPythonCandidate"
+            emit(
+                {
+                    "event": "pinning",
+                    "file": "PythonCandidate" if python else candidate_file(candidate),
+                    "candidate": candidate_info(candidate),
+                }
+            )
+
+    return EventReporter
+
+
+def install_reporter():
+    try:
+        from pip._internal.resolution.resolvelib import resolver
+        from pip._vendor.resolvelib.reporters import BaseReporter
+    except ImportError:
+        return
+    if not hasattr(resolver, "PipDebuggingReporter"):
+        return
+
+    # pip picks this reporter when PIP_RESOLVER_DEBUG is set
+    resolver.PipDebuggingReporter = event_reporter_class(BaseReporter)
+
+
+def main():
+    args = sys.argv[1:]
+    events = False
+    profile_path = record_path = None
+    while args and args[0] in ("--events", "--profile", "--record"):
+        if args[0] == "--events":
+            events = True
+            args = args[1:]
+        elif args[0] == "--profile":
+            profile_path = args[1]
+            args = args[2:]
+        else:
+            record_path = args[1]
+            args = args[2:]
+
+    if events:
+        install_reporter()
+    recorder = None
+    if record_path is not None:
+        from replay_shim import ResolutionRecorder, install_recorder
+
+        recorder = ResolutionRecorder()
+        if not install_recorder(recorder):
+            recorder = None
+    import pip
+    from pip._internal.cli.main import main as pip_main
+
+    # So pip names itself python -m pip, as in scenarios.py's command
+    sys.argv = [os.path.join(os.path.dirname(pip.__file__), "__main__.py"), *args]
+
+    profiler = cProfile.Profile() if profile_path is not None else None
+
+    def finish():
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+        if recorder is not None:
+            recorder.write(record_path)
+
+    def finish_and_exit(signum, frame):
+        # Terminated by a budget, keep what ran until then
+        finish()
+        sys.stdout.flush()
+        os._exit(128 + signum)
+
+    if profiler is None and recorder is None:
+        return pip_main(args)
+
+    signal.signal(signal.SIGTERM, finish_and_exit)
+    try:
+        if profiler is not None:
+            return profiler.runcall(pip_main, args)
+        return pip_main(args)
+    finally:
+        # Not terminated halfway through writing
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        finish()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#   "typer",
+# ]
+# ///
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import typer
+
+RESULT_CACHE_DIR = ".result-cache"
+# gc leaves files without a valid entry alone until they are this old, they
+# may be the temporary file of a store still writing, or an object it has
+# yet to index
+ORPHAN_GRACE_SECONDS = 60 * 60
+
+# One entry per fingerprint, invalidated entries are kept as tombstones so
+# a summary written before fingerprints existed is not adopted again
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    fingerprint TEXT PRIMARY KEY,
+    toml_name TEXT NOT NULL,
+    scenario_name TEXT NOT NULL,
+    pip_name TEXT NOT NULL,
+    pip_sha256 TEXT NOT NULL,
+    harness_version INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    invalidated_at REAL
+);
+CREATE INDEX IF NOT EXISTS entries_scenario
+    ON entries (toml_name, scenario_name, pip_name);
+CREATE INDEX IF NOT EXISTS entries_last_used_at ON entries (last_used_at);
+"""
+
+app = typer.Typer()
+
+
+def scenario_fingerprint(
+    scenario_input: dict[str, Any],
+    pip_sha256: str,
+    harness_version: int,
+    reporter: str | None = None,
+) -> dict[str, Any]:
+    """
+    Identify a result by what produced it: the normalized scenario input,
+    the installed pip, the version of the harness that measured it and the
+    reporter it was read through, None for pip's own debug logging, which
+    leaves the fingerprints from before reporters unchanged.
+    """
+    fields = {
+        "input": scenario_input,
+        "pip_sha256": pip_sha256,
+        "harness_version": harness_version,
+    }
+    if reporter is not None:
+        fields["reporter"] = reporter
+    payload = json.dumps(fields, sort_keys=True, separators=(",", ":"))
+    return {
+        "key": hashlib.sha256(payload.encode()).hexdigest(),
+        "pip_sha256": pip_sha256,
+        "harness_version": harness_version,
+    }
+
+
+class ResultCache:
+    """
+    Content addressed store of summary files, objects are stored by
+    fingerprint and an SQLite index records what produced each one and
+    when it was last used.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.objects_dir = root / "objects"
+        self.index_path = root / "index.db"
+
+    def connect(self) -> sqlite3.Connection:
+        self.root.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.index_path, timeout=60)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def object_path(self, key: str) -> Path:
+        return self.objects_dir / key[:2] / f"{key}.json"
+
+    def lookup(self, key: str) -> bytes | None:
+        """
+        Return the cached summary for key, if it is valid, and mark it used.
+        """
+        conn = self.connect()
+        try:
+            with conn:
+                row = conn.execute(
+                    "SELECT 1 FROM entries WHERE fingerprint = ? "
+                    "AND invalidated_at IS NULL",
+                    (key,),
+                ).fetchone()
+                if row is None:
+                    return None
+                try:
+                    content = self.object_path(key).read_bytes()
+                except FileNotFoundError:
+                    return None
+                conn.execute(
+                    "UPDATE entries SET last_used_at = ? WHERE fingerprint = ?",
+                    (time.time(), key),
+                )
+        finally:
+            conn.close()
+        return content
+
+    def is_known(self, key: str) -> bool:
+        conn = self.connect()
+        try:
+            row = conn.execute(
+                "SELECT 1 FROM entries WHERE fingerprint = ?", (key,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return row is not None
+
+    def store(
+        self,
+        fingerprint: dict[str, Any],
+        toml_name: str,
+        scenario_name: str,
+        pip_name: str,
+        content: bytes,
+    ) -> None:
+        key = fingerprint["key"]
+        object_path = self.object_path(key)
+        object_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(
+            prefix=f".{object_path.name}.", dir=object_path.parent
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(temp_name, object_path)
+        finally:
+            Path(temp_name).unlink(missing_ok=True)
+
+        now = time.time()
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute(
+                    """
+                    INSERT INTO entries (
+                        fingerprint, toml_name, scenario_name, pip_name,
+                        pip_sha256, harness_version, created_at, last_used_at
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (fingerprint) DO UPDATE SET
+                        created_at = excluded.created_at,
+                        last_used_at = excluded.last_used_at,
+                        invalidated_at = NULL
+                    """,
+                    (
+                        key,
+                        toml_name,
+                        scenario_name,
+                        pip_name,
+                        fingerprint["pip_sha256"],
+                        fingerprint["harness_version"],
+                        now,
+                        now,
+                    ),
+                )
+        finally:
+            conn.close()
+
+    def invalidate(
+        self,
+        toml_name: str | None = None,
+        scenario_name: str | None = None,
+        pip_name: str | None = None,
+        harness_version_below: int | None = None,
+    ) -> int:
+        """
+        Invalidate every entry matching all of the given filters, so the
+        scenarios are run again, returning how many were invalidated.
+        """
+        conditions = ["invalidated_at IS NULL"]
+        parameters: list[Any] = []
+        for column, value in (
+            ("toml_name", toml_name),
+            ("scenario_name", scenario_name),
+            ("pip_name", pip_name),
+        ):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+        if harness_version_below is not None:
+            conditions.append("harness_version < ?")
+            parameters.append(harness_version_below)
+
+        conn = self.connect()
+        try:
+            with conn:
+                keys = [
+                    key
+                    for (key,) in conn.execute(
+                        f"SELECT fingerprint FROM entries WHERE {' AND '.join(conditions)}",
+                        parameters,
+                    )
+                ]
+                conn.executemany(
+                    "UPDATE entries SET invalidated_at = ? WHERE fingerprint = ?",
+                    [(time.time(), key) for key in keys],
+                )
+        finally:
+            conn.close()
+
+        for key in keys:
+            self.object_path(key).unlink(missing_ok=True)
+        return len(keys)
+
+    def gc(self, max_age_days: float) -> tuple[int, int]:
+        """
+        Remove entries, tombstones included, not used in max_age_days and
+        any object or temporary file without a valid entry that is older
+        than ORPHAN_GRACE_SECONDS. Returns the number of entries and objects
+        removed.
+        """
+        cutoff = time.time() - max_age_days * 24 * 60 * 60
+        conn = self.connect()
+        try:
+            with conn:
+                removed_entries = conn.execute(
+                    "DELETE FROM entries WHERE last_used_at < ?", (cutoff,)
+                ).rowcount
+                valid = {
+                    key
+                    for (key,) in conn.execute(
+                        "SELECT fingerprint FROM entries WHERE invalidated_at IS NULL"
+                    )
+                }
+        finally:
+            conn.close()
+
+        removed_objects = 0
+        orphaned_before = time.time() - ORPHAN_GRACE_SECONDS
+        if self.objects_dir.exists():
+            for object_path in self.objects_dir.glob("*/*"):
+                key = object_path.name.removesuffix(".json")
+                if key in valid:
+                    continue
+                try:
+                    if object_path.stat().st_mtime >= orphaned_before:
+                        continue
+                except FileNotFoundError:
+                    continue
+                object_path.unlink(missing_ok=True)
+                removed_objects += 1
+        return removed_entries, removed_objects
+
+
+@app.command()
+def invalidate(
+    toml_name: str | None = None,
+    scenario_name: str | None = None,
+    pip_name: str | None = None,
+    harness_version_below: int | None = None,
+    all: bool = False,
+    cache_dir: Path = Path(RESULT_CACHE_DIR),
+) -> None:
+    """
+    Invalidate cached results matching every given filter, e.g.
+    --pip-name 24.2 or --toml-name problematic --scenario-name sphinx,
+    so scenarios.py runs them again. --all invalidates everything
+    """
+    filters = (toml_name, scenario_name, pip_name, harness_version_below)
+    if all == any(value is not None for value in filters):
+        raise RuntimeError("Provide either --all or at least one filter")
+
+    count = ResultCache(cache_dir).invalidate(
+        toml_name, scenario_name, pip_name, harness_version_below
+    )
+    print(f"Invalidated {count} cached results")
+
+
+@app.command()
+def gc(max_age_days: float = 30.0, cache_dir: Path = Path(RESULT_CACHE_DIR)) -> None:
+    """
+    Remove cached results not used in --max-age-days and orphaned objects
+    """
+    removed_entries, removed_objects = ResultCache(cache_dir).gc(max_age_days)
+    print(f"Removed {removed_entries} index entries and {removed_objects} objects")
+
+
+if __name__ == "__main__":
+    app()
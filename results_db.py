@@ -0,0 +1,416 @@
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#   "typer",
+# ]
+# ///
+
+import json
+import sqlite3
+from collections.abc import Iterable
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+import typer
+
+RESULTS_DB = "results.db"
+SUMMARIES_DIR = "summaries"
+
+# Results are keyed by the summaries/<toml>/<scenario>/<pip>.json layout,
+# inputs and install_info mirror the summary JSON and metrics holds every
+# scalar value of the "summary", "timing" and "cache" blocks, one row each.
+# Scenarios run with --repeat also have a repeats row and timing_samples,
+# sdist_builds holds the per-sdist build table in the order pip built them
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    toml_name TEXT NOT NULL,
+    scenario_name TEXT NOT NULL,
+    pip_name TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    failure_reason TEXT,
+    recorded_at TEXT NOT NULL,
+    UNIQUE (toml_name, scenario_name, pip_name)
+);
+CREATE INDEX IF NOT EXISTS results_pip_name ON results (pip_name, toml_name);
+
+CREATE TABLE IF NOT EXISTS inputs (
+    result_id INTEGER PRIMARY KEY REFERENCES results (id) ON DELETE CASCADE,
+    python_version TEXT NOT NULL,
+    datetime TEXT NOT NULL,
+    platform_system TEXT NOT NULL,
+    requirements TEXT NOT NULL,
+    max_resolution_rounds INTEGER,
+    constraints TEXT,
+    project_name TEXT,
+    project_extras TEXT,
+    optional_dependencies TEXT,
+    budgets TEXT,
+    local_index TEXT
+);
+CREATE INDEX IF NOT EXISTS inputs_python_version ON inputs (python_version);
+
+CREATE TABLE IF NOT EXISTS metrics (
+    result_id INTEGER NOT NULL REFERENCES results (id) ON DELETE CASCADE,
+    section TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value NUMERIC,
+    PRIMARY KEY (result_id, section, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS metrics_name ON metrics (section, name, value);
+
+CREATE TABLE IF NOT EXISTS install_info (
+    result_id INTEGER NOT NULL REFERENCES results (id) ON DELETE CASCADE,
+    file TEXT,
+    hash TEXT,
+    url TEXT,
+    commit_id TEXT
+);
+CREATE INDEX IF NOT EXISTS install_info_result_id ON install_info (result_id);
+CREATE INDEX IF NOT EXISTS install_info_file ON install_info (file);
+
+CREATE TABLE IF NOT EXISTS repeats (
+    result_id INTEGER PRIMARY KEY REFERENCES results (id) ON DELETE CASCADE,
+    runs INTEGER NOT NULL,
+    warmup INTEGER NOT NULL,
+    nondeterministic TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS timing_samples (
+    result_id INTEGER NOT NULL REFERENCES results (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    run INTEGER NOT NULL,
+    value NUMERIC,
+    PRIMARY KEY (result_id, name, run)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sdist_builds (
+    result_id INTEGER NOT NULL REFERENCES results (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT,
+    version TEXT,
+    seconds REAL NOT NULL,
+    success INTEGER NOT NULL,
+    PRIMARY KEY (result_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sdist_builds_name ON sdist_builds (name, version);
+"""
+
+# Input keys stored as JSON text rather than plain columns
+JSON_INPUT_KEYS = (
+    "requirements",
+    "constraints",
+    "project_extras",
+    "optional_dependencies",
+    "budgets",
+)
+INPUT_KEYS = (
+    "python_version",
+    "datetime",
+    "platform_system",
+    "requirements",
+    "max_resolution_rounds",
+    "constraints",
+    "project_name",
+    "project_extras",
+    "optional_dependencies",
+    "budgets",
+    "local_index",
+)
+METRIC_SECTIONS = ("summary", "timing", "cache")
+
+
+def connect(path: Path) -> sqlite3.Connection:
+    """
+    Open the results database, creating the schema if needed. WAL mode and
+    a generous busy timeout let --jobs workers upsert concurrently.
+    """
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(SCHEMA)
+    # Databases created before an input key existed get its column added
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(inputs)")}
+    for key in INPUT_KEYS:
+        if key not in columns:
+            conn.execute(f"ALTER TABLE inputs ADD COLUMN {key} TEXT")
+    return conn
+
+
+def upsert_result(
+    conn: sqlite3.Connection,
+    toml_name: str,
+    scenario_name: str,
+    summary_json: dict[str, Any],
+) -> None:
+    """
+    Insert or replace the result of one scenario for one pip name, the
+    caller is responsible for committing.
+    """
+    scenario_input = summary_json["input"]
+    result = summary_json["result"]
+    (result_id,) = conn.execute(
+        """
+        INSERT INTO results
+            (toml_name, scenario_name, pip_name, success, failure_reason, recorded_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (toml_name, scenario_name, pip_name) DO UPDATE SET
+            success = excluded.success,
+            failure_reason = excluded.failure_reason,
+            recorded_at = excluded.recorded_at
+        RETURNING id
+        """,
+        (
+            toml_name,
+            scenario_name,
+            scenario_input["pip_version"],
+            result["success"],
+            result["failure_reason"],
+            datetime.now(UTC).isoformat(timespec="seconds"),
+        ),
+    ).fetchone()
+
+    for table in (
+        "inputs",
+        "metrics",
+        "install_info",
+        "repeats",
+        "timing_samples",
+        "sdist_builds",
+    ):
+        conn.execute(f"DELETE FROM {table} WHERE result_id = ?", (result_id,))
+
+    input_values = []
+    for key in INPUT_KEYS:
+        value = scenario_input.get(key)
+        if key in JSON_INPUT_KEYS and value is not None:
+            value = json.dumps(value)
+        input_values.append(value)
+    conn.execute(
+        f"INSERT INTO inputs (result_id, {', '.join(INPUT_KEYS)}) "
+        f"VALUES (?{', ?' * len(INPUT_KEYS)})",
+        (result_id, *input_values),
+    )
+
+    metric_rows = []
+    for section in METRIC_SECTIONS:
+        for name, value in (summary_json.get(section) or {}).items():
+            if value is None or isinstance(value, (int, float, str)):
+                metric_rows.append((result_id, section, name, value))
+    conn.executemany(
+        "INSERT INTO metrics (result_id, section, name, value) VALUES (?, ?, ?, ?)",
+        metric_rows,
+    )
+
+    conn.executemany(
+        "INSERT INTO install_info (result_id, file, hash, url, commit_id) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [
+            (
+                result_id,
+                info.get("file"),
+                info.get("hash"),
+                info.get("url"),
+                info.get("commit"),
+            )
+            for info in summary_json["summary"].get("install_info", [])
+        ],
+    )
+
+    if repeat := summary_json.get("repeat"):
+        conn.execute(
+            "INSERT INTO repeats (result_id, runs, warmup, nondeterministic) "
+            "VALUES (?, ?, ?, ?)",
+            (
+                result_id,
+                repeat["runs"],
+                repeat["warmup"],
+                json.dumps(repeat["nondeterministic"]),
+            ),
+        )
+    conn.executemany(
+        "INSERT INTO timing_samples (result_id, name, run, value) VALUES (?, ?, ?, ?)",
+        [
+            (result_id, name, run, value)
+            for name, samples in (summary_json.get("timing_samples") or {}).items()
+            for run, value in enumerate(samples)
+        ],
+    )
+    conn.executemany(
+        "INSERT INTO sdist_builds "
+        "(result_id, position, name, version, seconds, success) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (
+                result_id,
+                position,
+                build["name"],
+                build["version"],
+                build["seconds"],
+                build["success"],
+            )
+            for position, build in enumerate(summary_json.get("sdist_builds") or [])
+        ],
+    )
+
+
+def load_summaries(
+    conn: sqlite3.Connection, toml_name: str, pip_names: Iterable[str]
+) -> dict[str, dict[str, dict[str, Any]]]:
+    """
+    Return {scenario_name: {pip_name: summary_json}} for every stored result
+    of toml_name, shaped like the summary JSON files.
+    """
+    pip_names = list(pip_names)
+    placeholders = ", ".join("?" * len(pip_names))
+    rows = conn.execute(
+        f"""
+        SELECT r.id, r.scenario_name, r.pip_name, r.success, r.failure_reason,
+            {", ".join(f"i.{key}" for key in INPUT_KEYS)}
+        FROM results r JOIN inputs i ON i.result_id = r.id
+        WHERE r.toml_name = ? AND r.pip_name IN ({placeholders})
+        """,
+        (toml_name, *pip_names),
+    ).fetchall()
+
+    by_id: dict[int, dict[str, Any]] = {}
+    summaries: dict[str, dict[str, dict[str, Any]]] = {}
+    for result_id, scenario_name, pip_name, success, failure_reason, *values in rows:
+        scenario_input: dict[str, Any] = {"pip_version": pip_name}
+        for key, value in zip(INPUT_KEYS, values):
+            if key in JSON_INPUT_KEYS and value is not None:
+                value = json.loads(value)
+            scenario_input[key] = value
+        summary_json = {
+            "input": scenario_input,
+            "result": {"success": bool(success), "failure_reason": failure_reason},
+            "summary": {"install_info": []},
+            "timing": {},
+            "cache": {},
+            "sdist_builds": [],
+        }
+        by_id[result_id] = summary_json
+        summaries.setdefault(scenario_name, {})[pip_name] = summary_json
+
+    metric_rows = conn.execute(
+        f"""
+        SELECT m.result_id, m.section, m.name, m.value
+        FROM metrics m JOIN results r ON r.id = m.result_id
+        WHERE r.toml_name = ? AND r.pip_name IN ({placeholders})
+        """,
+        (toml_name, *pip_names),
+    )
+    for result_id, section, name, value in metric_rows:
+        by_id[result_id][section][name] = value
+
+    install_rows = conn.execute(
+        f"""
+        SELECT n.result_id, n.file, n.hash, n.url, n.commit_id
+        FROM install_info n JOIN results r ON r.id = n.result_id
+        WHERE r.toml_name = ? AND r.pip_name IN ({placeholders})
+        ORDER BY n.rowid
+        """,
+        (toml_name, *pip_names),
+    )
+    for result_id, file, hash, url, commit_id in install_rows:
+        install_info = by_id[result_id]["summary"]["install_info"]
+        if file is not None:
+            install_info.append({"file": file, "hash": hash})
+        else:
+            install_info.append({"url": url, "commit": commit_id})
+
+    repeat_rows = conn.execute(
+        f"""
+        SELECT p.result_id, p.runs, p.warmup, p.nondeterministic
+        FROM repeats p JOIN results r ON r.id = p.result_id
+        WHERE r.toml_name = ? AND r.pip_name IN ({placeholders})
+        """,
+        (toml_name, *pip_names),
+    )
+    for result_id, runs, warmup, nondeterministic in repeat_rows:
+        by_id[result_id]["repeat"] = {
+            "runs": runs,
+            "warmup": warmup,
+            "nondeterministic": json.loads(nondeterministic),
+        }
+        by_id[result_id]["timing_samples"] = {}
+
+    sample_rows = conn.execute(
+        f"""
+        SELECT s.result_id, s.name, s.value
+        FROM timing_samples s JOIN results r ON r.id = s.result_id
+        WHERE r.toml_name = ? AND r.pip_name IN ({placeholders})
+        ORDER BY s.result_id, s.name, s.run
+        """,
+        (toml_name, *pip_names),
+    )
+    for result_id, name, value in sample_rows:
+        by_id[result_id]["timing_samples"].setdefault(name, []).append(value)
+
+    build_rows = conn.execute(
+        f"""
+        SELECT b.result_id, b.name, b.version, b.seconds, b.success
+        FROM sdist_builds b JOIN results r ON r.id = b.result_id
+        WHERE r.toml_name = ? AND r.pip_name IN ({placeholders})
+        ORDER BY b.result_id, b.position
+        """,
+        (toml_name, *pip_names),
+    )
+    for result_id, name, version, seconds, success in build_rows:
+        by_id[result_id]["sdist_builds"].append(
+            {
+                "name": name,
+                "version": version,
+                "seconds": seconds,
+                "success": bool(success),
+            }
+        )
+
+    # Summaries written before timing, cache modes or sdist build timing
+    # have no such blocks
+    for summary_json in by_id.values():
+        if "sdist_build_seconds" not in summary_json["timing"]:
+            del summary_json["sdist_builds"]
+        for section in ("timing", "cache"):
+            if not summary_json[section]:
+                summary_json[section] = None
+
+    return summaries
+
+
+def import_summaries(conn: sqlite3.Connection, summaries_dir: Path) -> int:
+    """
+    Upsert every summaries/<toml>/<scenario>/<pip>.json file in a single
+    transaction, returning how many were imported.
+    """
+    count = 0
+    with conn:
+        for json_path in sorted(summaries_dir.glob("*/*/*.json")):
+            try:
+                summary_json = json.loads(json_path.read_text())
+            except json.JSONDecodeError:
+                print(f"Warning: skipping unreadable summary: {json_path}")
+                continue
+            upsert_result(
+                conn, json_path.parent.parent.name, json_path.parent.name, summary_json
+            )
+            count += 1
+    return count
+
+
+def main(db: Path = Path(RESULTS_DB), summaries_dir: Path = Path(SUMMARIES_DIR)) -> None:
+    """
+    Backfill the results database from the summary JSON files, e.g. after
+    pulling summaries recorded on another machine
+    """
+    conn = connect(db)
+    try:
+        count = import_summaries(conn, summaries_dir)
+    finally:
+        conn.close()
+    print(f"Imported {count} summaries into {db}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -9,29 +9,126 @@
 # ///
 
 import ast
+import asyncio
+import functools
+import hashlib
 import json
+import math
+import multiprocessing
 import os
 import platform
 import re
+import shutil
+import signal
 import subprocess
 import sys
 import tempfile
 import time
-import tomllib
+import traceback
+from array import array
 from collections import defaultdict
-from collections.abc import Generator
-from io import TextIOWrapper
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
 from pathlib import Path
-from typing import Any
+from typing import IO, Any
 from urllib.parse import urlparse
 
+try:
+    import fcntl
+except ImportError:
+    # Windows, where pooled virtual environments are not locked
+    fcntl = None
+
 import inflection
 import typer
 from compact_json import EolStyle, Formatter
 
-SCENARIOS_DIR = "scenarios"
-
+from budgets import WALL_BUDGET_EXCEEDED, RunBudget, load_scenarios
+from index_snapshot import INDEX_MODES, RECORD, serve_index_snapshot
+from profiles import PROFILE_SUFFIX, profile_summary
+from progress import ProgressTracker, ProgressView, finished
+from result_cache import RESULT_CACHE_DIR, ResultCache, scenario_fingerprint
+from results_db import RESULTS_DB, connect, upsert_result
+from stats import sample_stats
+from traces import (
+    TRACE_CODECS,
+    TRACE_SUFFIXES,
+    CompactRound,
+    StringTable,
+    TraceWriter,
+)
+from work_queue import (
+    historical_costs,
+    longest_first,
+    parse_shard,
+    run_worker,
+    serve_work_queue,
+    shard_pending,
+)
 
+SCENARIOS_DIR = "scenarios"
+# What a failing scenario raises: failed venvs and validation, which a
+# broken process pool also is (RuntimeError), file and process errors
+# (OSError) and pip output that cannot be parsed (ValueError)
+SCENARIO_ERRORS = (OSError, RuntimeError, ValueError)
+# Worker processes are spawned rather than forked, a fork would copy the
+# ProgressView's LiveStdout and its lock, possibly held by the redraw thread
+WORKER_CONTEXT = multiprocessing.get_context("spawn")
+
+# Longest single line of pip output that will be buffered, Reporter lines
+# for candidates with many requirements can be very long
+STREAM_LINE_LIMIT = 32 * 1024 * 1024
+
+# Pristine virtual environments, one per python version and pip requirement
+VENV_POOL_DIR = ".venv-pool"
+VENV_POOL_SIZE = 8
+STALE_VENV_BUILD_SECONDS = 24 * 60 * 60
+
+# Part of every result fingerprint, bump it whenever a change to parsing or
+# metric calculation changes what a summary would contain
+HARNESS_VERSION = 4
+
+GIT_COMMIT_RE = re.compile(r"[0-9a-f]{40}")
+
+# Which pip cache each run uses: the user's own pip configuration, a new
+# empty cache for every run, a cache per scenario and pip primed by an extra
+# discarded run, or one cache shared by every scenario
+USER_CACHE = "user"
+COLD_CACHE = "cold"
+WARM_CACHE = "warm"
+SHARED_CACHE = "shared"
+CACHE_MODES = (USER_CACHE, COLD_CACHE, WARM_CACHE, SHARED_CACHE)
+PIP_CACHE_DIR = ".pip-cache"
+# How the resolver's events are read: parsed from the reprs pip logs with
+# PIP_RESOLVER_DEBUG, or as JSON events printed by pip run through
+# reporter_shim.py, which replaces pip's debugging reporter in process
+TEXT_REPORTER = "text"
+SHIM_REPORTER = "shim"
+REPORTERS = (TEXT_REPORTER, SHIM_REPORTER)
+REPORTER_SHIM = Path(__file__).parent / "reporter_shim.py"
+# Provider answers recorded by --record-resolution, replayed by replay.py
+RESOLUTION_RECORD_SUFFIX = ".replay.json.gz"
+# pip keys its HTTP cache on URLs, so an index snapshot served for a kept
+# cache listens on a port derived from the cache directory
+STABLE_INDEX_PORTS = range(20_000, 40_000)
+
+
+# pip logs where each distribution comes from before building it, then
+# "<phase>: started" and "<phase>: finished with status '<status>'" lines
+SOURCE_LINE_PREFIXES = (
+    "Downloading ",
+    "Resuming download ",
+    "Using cached ",
+    "Processing ",
+)
+BUILD_PHASE_RE = re.compile(
+    r"\s+(?P<phase>\S.*?): (?:started|finished with status '(?P<status>[^']*)')"
+)
+SDIST_SUFFIXES = (".tar.gz", ".tar.bz2", ".tar.xz", ".tgz", ".tar", ".zip")
+
+
+@functools.lru_cache(maxsize=65_536)
 def extract_filename(url: str) -> str:
     # Remove text in parentheses
     url_no_suffix = re.sub(r"\s*\(.*?\)", "", url)
@@ -189,6 +286,105 @@ class RejectedAddedVisitor(ast.NodeVisitor):
             )
 
 
+# Regular expressions for the reprs pip's resolver debug output is made of,
+# lines with any other shape are parsed with the AST visitors above instead
+_STRING_PATTERN = r"'(?P<{name}>[^'\\]*)'"
+
+
+def _candidate_pattern(prefix: str) -> str:
+    # LinkCandidate('url') or ExtrasCandidate(base=LinkCandidate('url'), extras=...)
+    return (
+        rf"(?P<{prefix}_extras>ExtrasCandidate\(base=)?"
+        rf"LinkCandidate\({_STRING_PATTERN.format(name=f'{prefix}_url')}\)"
+        rf"(?({prefix}_extras), extras=frozenset\(\{{[^{{}}()]*\}}\)\))"
+    )
+
+
+_REQUIREMENT_PATTERN = (
+    rf"\w*Requirement\((?:{_STRING_PATTERN.format(name='requirement_text')}"
+    rf"|{_candidate_pattern('requirement')})\)"
+)
+_VIA_PATTERN = rf"(?:(?P<via_none>None)|{_candidate_pattern('via')})"
+
+ADDING_REQUIREMENT_RE = re.compile(
+    rf"Reporter\.adding_requirement\({_REQUIREMENT_PATTERN}, {_VIA_PATTERN}\)"
+)
+PINNING_RE = re.compile(rf"Reporter\.pinning\({_candidate_pattern('pinned')}\)")
+REJECTING_CANDIDATE_PREFIX = "Reporter.rejecting_candidate(Criterion("
+# Prefix of the JSON events printed by reporter_shim.py
+REPORTER_EVENT_PREFIX = "ReporterEvent "
+# Resolver events timed from the event before them, the time before adding
+# a candidate's requirements is mostly its metadata download or sdist build
+TIMED_EVENTS = ("adding_requirement", "pinning", "rejecting_candidate")
+CRITERION_PAIR_RE = re.compile(rf"\({_REQUIREMENT_PATTERN}, via={_VIA_PATTERN}\)")
+REJECTED_CANDIDATE_RE = re.compile(rf"\), {_candidate_pattern('rejected')}\)")
+
+
+def _requirement_via_pair(match: re.Match[str]) -> dict[str, str] | None:
+    requirement_text = match["requirement_text"]
+    if requirement_text is None:
+        requirement_text = extract_filename(match["requirement_url"])
+    if match["via_none"] is not None:
+        via_filename = "<User Requirement>"
+    else:
+        via_filename = extract_filename(match["via_url"])
+
+    # The AST visitors drop pairs with an empty side, leave those to them
+    if not requirement_text or not via_filename:
+        return None
+    return {"requirement": requirement_text, "from": via_filename}
+
+
+def parse_adding_requirement(line: str) -> dict[str, str] | None:
+    """
+    Parse a Reporter.adding_requirement line without building an AST,
+    returns None if the line is not of a recognised shape.
+    """
+    match = ADDING_REQUIREMENT_RE.fullmatch(line)
+    if match is None:
+        return None
+    return _requirement_via_pair(match)
+
+
+def parse_pinning(line: str) -> str | None:
+    """
+    Parse a Reporter.pinning line without building an AST, returns None if
+    the line is not of a recognised shape.
+    """
+    match = PINNING_RE.fullmatch(line)
+    if match is None:
+        return None
+    return extract_filename(match["pinned_url"]) or None
+
+
+def parse_rejecting_candidate(line: str) -> list[dict[str, str]] | None:
+    """
+    Parse a Reporter.rejecting_candidate line without building an AST,
+    returns None if the line is not of a recognised shape.
+    """
+    if not line.startswith(REJECTING_CANDIDATE_PREFIX):
+        return None
+
+    candidates: list[dict[str, str]] = []
+    position = len(REJECTING_CANDIDATE_PREFIX)
+    while True:
+        match = CRITERION_PAIR_RE.match(line, position)
+        if match is None:
+            return None
+        candidate = _requirement_via_pair(match)
+        if candidate is None:
+            return None
+        candidates.append(candidate)
+        position = match.end()
+        if not line.startswith(", ", position):
+            break
+        position += 2
+
+    if REJECTED_CANDIDATE_RE.fullmatch(line, position) is None:
+        return None
+    return candidates
+
+
 class ReporterLines:
     def __init__(self) -> None:
         self._report_output = False
@@ -210,12 +406,294 @@ class ReporterLines:
             return
 
 
-class ResolutionLines:
+class DownloadLines:
+    """
+    Count the distributions and metadata files pip took from its HTTP cache
+    and those it had to download.
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def process_line(self, line: str) -> None:
+        line = line.lstrip()
+        if line.startswith("Using cached "):
+            self.hits += 1
+        elif line.startswith(("Downloading ", "Resuming download ")):
+            self.misses += 1
+
+
+class SdistBuildLines:
+    """
+    Time every sdist pip builds to prepare its metadata, from the first
+    build phase, e.g. "Installing build dependencies: started", to the last
+    one finishing, attributed to the sdist pip last downloaded or processed.
+    """
+
     def __init__(self) -> None:
+        self.builds: list[dict[str, Any]] = []
+        self._source: str | None = None
+        self._build: dict[str, Any] | None = None
+
+    def _end_build(self) -> None:
+        if self._build is not None:
+            self.builds.append(self._build)
+            self._build = None
+
+    def process_line(self, line: str) -> None:
+        stripped = line.lstrip()
+        if stripped.startswith(SOURCE_LINE_PREFIXES):
+            self._end_build()
+            self._source = stripped.split(" ", 1)[1]
+            return
+        if stripped.startswith("Collecting "):
+            self._end_build()
+            self._source = None
+            return
+
+        match = BUILD_PHASE_RE.fullmatch(line)
+        if match is None:
+            return
+        now = time.perf_counter()
+        if self._build is None:
+            name, version = sdist_name_version(self._source)
+            self._build = {
+                "name": name,
+                "version": version,
+                "started_at": now,
+                "ended_at": None,
+                "success": True,
+            }
+        if match["status"] is not None:
+            self._build["ended_at"] = now
+            if match["status"] != "done":
+                self._build["success"] = False
+        else:
+            self._build["ended_at"] = None
+
+    def as_list(self) -> list[dict[str, Any]]:
+        """
+        The builds in the order pip ran them, a build still running when pip
+        exited, e.g. when terminated by a budget, did not succeed.
+        """
+        self._end_build()
+        now = time.perf_counter()
+        for build in self.builds:
+            if build["ended_at"] is None:
+                build["ended_at"] = now
+                build["success"] = False
+        return [
+            {
+                "name": build["name"],
+                "version": build["version"],
+                "seconds": round(build["ended_at"] - build["started_at"], 3),
+                "success": build["success"],
+            }
+            for build in self.builds
+        ]
+
+
+def sdist_name_version(source: str | None) -> tuple[str | None, str | None]:
+    """
+    Name and version of the sdist in a "Downloading", "Using cached" or
+    "Processing" line, a local directory only has a name.
+    """
+    if source is None:
+        return None, None
+    filename = extract_filename(source)
+    if not filename.endswith(SDIST_SUFFIXES):
+        return filename, None
+    stem = filename.removesuffix(
+        next(suffix for suffix in SDIST_SUFFIXES if filename.endswith(suffix))
+    )
+    name, _, version = stem.rpartition("-")
+    if not name:
+        return stem, None
+    return name, version
+
+
+def percentile(sorted_values: list[float], percent: float) -> float | None:
+    """
+    Nearest rank percentile of already sorted values.
+    """
+    if not sorted_values:
+        return None
+    rank = math.ceil(percent / 100 * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+
+class ResolutionLines:
+    def __init__(
+        self,
+        fast_parse: bool = True,
+        keep_rounds: bool = True,
+        on_round: Callable[[dict[str, Any], float, float], None] | None = None,
+    ) -> None:
+        """
+        Completed rounds are kept in resolution_rounds as CompactRounds
+        interned in strings, with keep_rounds=False they are only passed to
+        on_round, as (round, started, ended) with times relative to
+        started_at, and folded into summary_metrics, so memory does not grow
+        with rounds.
+        """
         self._resolution_step: dict[str, Any] = {}
-        self.resolution_rounds: list[dict[str, Any]] = []
+        self.strings = StringTable()
+        self.resolution_rounds: list[CompactRound] = []
+        self.round_count = 0
+        self.summary_metrics = SummaryMetrics()
+        self.fast_parse = fast_parse
+        self.keep_rounds = keep_rounds
+        self.on_round = on_round
+
+        # time.perf_counter() of when lines were seen, started_at is when
+        # pip was started, just after this was created
+        self.started_at = time.perf_counter()
+        self._round_started_at: float | None = None
+        self.first_round_at: float | None = None
+        self.first_pin_at: float | None = None
+        self._round_durations = array("d")
+        self._rejection_round_seconds = 0.0
+        self._last_event_at: float | None = None
+        self._event_gaps = {event: array("d") for event in TIMED_EVENTS}
+
+    def latency_metrics(self) -> dict[str, Any]:
+        """
+        Latency breakdown of the resolution relative to when pip started.
+        """
+
+        def offset(timestamp: float | None) -> float | None:
+            if timestamp is None:
+                return None
+            return round(timestamp - self.started_at, 3)
+
+        def distribution(name: str, durations: array) -> dict[str, float | None]:
+            sorted_durations = sorted(durations)
+            values = {
+                "p50": percentile(sorted_durations, 50),
+                "p95": percentile(sorted_durations, 95),
+                "max": sorted_durations[-1] if sorted_durations else None,
+            }
+            return {
+                f"{name}_{statistic}_seconds": None if value is None else round(value, 4)
+                for statistic, value in values.items()
+            }
+
+        total_duration = sum(self._round_durations)
+        metrics = {
+            "time_to_first_round_seconds": offset(self.first_round_at),
+            "time_to_first_pin_seconds": offset(self.first_pin_at),
+            **distribution("round_duration", self._round_durations),
+            "rejection_round_time_share": (
+                round(self._rejection_round_seconds / total_duration, 4)
+                if total_duration
+                else None
+            ),
+        }
+        for event, gaps in self._event_gaps.items():
+            metrics.update(distribution(f"{event}_latency", gaps))
+        return metrics
+
+    def _complete_round(self, resolution_round: dict[str, Any]) -> None:
+        ended_at = time.perf_counter()
+        started_at = self._round_started_at or ended_at
+        self._round_durations.append(ended_at - started_at)
+        if "rejected" in resolution_round:
+            self._rejection_round_seconds += ended_at - started_at
+
+        self.round_count += 1
+        compact_round = CompactRound.from_dict(resolution_round, self.strings)
+        self.summary_metrics.add_compact_round(compact_round, self.strings)
+        if self.on_round is not None:
+            self.on_round(
+                resolution_round,
+                started_at - self.started_at,
+                ended_at - self.started_at,
+            )
+        if self.keep_rounds:
+            self.resolution_rounds.append(compact_round)
+
+    def round_dicts(self) -> list[dict[str, Any]]:
+        return [r.to_dict(self.strings) for r in self.resolution_rounds]
+
+    def _parse_adding_requirement(self, line: str) -> list[dict[str, str]]:
+        if self.fast_parse:
+            candidate = parse_adding_requirement(line)
+            if candidate is not None:
+                return [candidate]
+        tree = ast.parse(line, mode="eval")
+        requirements_visitor = RejectedAddedVisitor()
+        requirements_visitor.visit(tree)
+        return requirements_visitor.candidates
+
+    def _parse_pinning(self, line: str) -> str | None:
+        if self.fast_parse:
+            pinned_file = parse_pinning(line)
+            if pinned_file is not None:
+                return pinned_file
+        tree = ast.parse(line, mode="eval")
+        pinning_visitor = PinningVisitor()
+        pinning_visitor.visit(tree)
+        return pinning_visitor.pinned_file
+
+    def _parse_rejecting_candidate(self, line: str) -> list[dict[str, str]]:
+        if self.fast_parse:
+            candidates = parse_rejecting_candidate(line)
+            if candidates is not None:
+                return candidates
+        rejecting_visitor = RejectedAddedVisitor()
+        tree = ast.parse(line.replace("via=", ""), mode="eval")
+        rejecting_visitor.visit(tree)
+        return rejecting_visitor.candidates
+
+    def _time_event(self, event: str) -> None:
+        now = time.perf_counter()
+        if self._last_event_at is not None:
+            self._event_gaps[event].append(now - self._last_event_at)
+        self._last_event_at = now
+
+    def _start_round(self) -> None:
+        self._resolution_step = {}
+        self._round_started_at = self._last_event_at = time.perf_counter()
+        if self.first_round_at is None:
+            self.first_round_at = self._round_started_at
+
+    def _end_round(self) -> None:
+        self._last_event_at = time.perf_counter()
+        if self._resolution_step:
+            if "rejected" in self._resolution_step:
+                for requirement, froms in self._resolution_step["rejected"].items():
+                    self._resolution_step["rejected"][requirement] = sorted(froms)
+            self._complete_round(self._resolution_step)
+
+    def _add_requirement(self, candidate: dict[str, str]) -> None:
+        self._time_event("adding_requirement")
+        if "added" not in self._resolution_step:
+            self._resolution_step["added"] = defaultdict(list)
+        self._resolution_step["added"][candidate["from"]].append(candidate["requirement"])
+
+    def _pin(self, pinned_file: str) -> None:
+        self._time_event("pinning")
+        if self.first_pin_at is None:
+            self.first_pin_at = self._last_event_at
+        if "pinned" not in self._resolution_step:
+            self._resolution_step["pinned"] = []
+        self._resolution_step["pinned"].append(pinned_file)
+
+    def _reject(self, candidates: list[dict[str, str]]) -> None:
+        self._time_event("rejecting_candidate")
+        if "rejected" not in self._resolution_step:
+            self._resolution_step["rejected"] = defaultdict(set)
+        for candidate in candidates:
+            self._resolution_step["rejected"][candidate["requirement"]].add(
+                candidate["from"]
+            )
 
     def process_line(self, line: str):
+        if line.startswith(REPORTER_EVENT_PREFIX):
+            self.process_event(json.loads(line[len(REPORTER_EVENT_PREFIX) :]))
+            return
+
         if not line.startswith("Reporter."):
             return
 
@@ -223,84 +701,280 @@ class ResolutionLines:
             return
 
         if line.startswith("Reporter.starting_round("):
-            self._resolution_step = {}
+            self._start_round()
             return
 
         if line.startswith("Reporter.ending_round"):
-            if self._resolution_step:
-                if "rejected" in self._resolution_step:
-                    for requirement, froms in self._resolution_step["rejected"].items():
-                        self._resolution_step["rejected"][requirement] = sorted(froms)
-                self.resolution_rounds.append(self._resolution_step)
+            self._end_round()
             return
 
         if line.startswith("Reporter.ending("):
             return
 
         if line.startswith("Reporter.adding_requirement("):
-            tree = ast.parse(line, mode="eval")
-            requirements_visitor = RejectedAddedVisitor()
-            requirements_visitor.visit(tree)
-            if len(requirements_visitor.candidates) == 1:
-                if "added" not in self._resolution_step:
-                    self._resolution_step["added"] = defaultdict(list)
-
-                self._resolution_step["added"][
-                    requirements_visitor.candidates[0]["from"]
-                ].append(requirements_visitor.candidates[0]["requirement"])
+            candidates = self._parse_adding_requirement(line)
+            if len(candidates) == 1:
+                self._add_requirement(candidates[0])
             else:
                 raise ValueError(f"Unknown requirement {line}")
             return
 
         if line.startswith("Reporter.pinning("):
-            if "pinned" not in self._resolution_step:
-                self._resolution_step["pinned"] = []
-
             if "RequiresPythonCandidate" in line:
-                self._resolution_step["pinned"].append("PythonCandidate")
+                self._pin("PythonCandidate")
                 return
 
-            tree = ast.parse(line, mode="eval")
-            pinning_visitor = PinningVisitor()
-            pinning_visitor.visit(tree)
-            if pinning_visitor.pinned_file:
-                self._resolution_step["pinned"].append(pinning_visitor.pinned_file)
+            pinned_file = self._parse_pinning(line)
+            if pinned_file:
+                self._pin(pinned_file)
             else:
                 raise ValueError(f"Unknown pinning {line}")
             return
 
         if line.startswith("Reporter.rejecting_candidate("):
-            rejecting_visitor = RejectedAddedVisitor()
-            tree = ast.parse(line.replace("via=", ""), mode="eval")
-            rejecting_visitor.visit(tree)
-            if rejecting_visitor.candidates:
-                if "rejected" not in self._resolution_step:
-                    self._resolution_step["rejected"] = defaultdict(set)
-
-                for candidate in rejecting_visitor.candidates:
-                    self._resolution_step["rejected"][candidate["requirement"]].add(
-                        candidate["from"]
-                    )
+            candidates = self._parse_rejecting_candidate(line)
+            if candidates:
+                self._reject(candidates)
             else:
                 raise ValueError(f"Unknown rejection {line}")
             return
 
         raise ValueError(f"Unknown Report action: {line}")
 
+    def process_event(self, event: dict[str, Any]) -> None:
+        """
+        Process an event reported by reporter_shim.py, which carries the
+        same file names and requirements the Reporter lines are parsed into.
+        """
+        action = event["event"]
+        if action in ("starting", "ending"):
+            return
 
-def tail_file(file: TextIOWrapper) -> Generator[str | None, None, None]:
-    partial_line = ""
-    while True:
-        line = file.readline()
-        if line:
-            if line.endswith("\n"):
-                yield partial_line + line.rstrip("\n")
-                partial_line = ""
+        if action == "starting_round":
+            self._start_round()
+            return
+
+        if action == "ending_round":
+            self._end_round()
+            return
+
+        if action == "adding_requirement":
+            if event["requirement"] and event["from"]:
+                self._add_requirement(event)
             else:
-                partial_line += line
-                yield None
+                raise ValueError(f"Unknown requirement {event}")
+            return
+
+        if action == "pinning":
+            if event["file"]:
+                self._pin(event["file"])
+            else:
+                raise ValueError(f"Unknown pinning {event}")
+            return
+
+        if action == "rejecting_candidate":
+            candidates = [
+                cause
+                for cause in event["causes"]
+                if cause["requirement"] and cause["from"]
+            ]
+            if candidates:
+                self._reject(candidates)
+            else:
+                raise ValueError(f"Unknown rejection {event}")
+            return
+
+        raise ValueError(f"Unknown Report action: {event}")
+
+
+async def open_pipe_reader(pipe: Any) -> asyncio.StreamReader:
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=STREAM_LINE_LIMIT, loop=loop)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    return reader
+
+
+async def spawn_process(
+    command: list[str], cwd: str | None, env: dict[str, str]
+) -> tuple[Any, asyncio.StreamReader, asyncio.StreamReader, asyncio.Future]:
+    """
+    Start command with piped stdout and stderr, returns the process, its
+    stdout and stderr readers and a future for its exit. Where os.wait4 is
+    available the future resolves to the child's resource usage.
+    """
+    if hasattr(os, "wait4"):
+        # Reap the child ourselves, asyncio's child watcher would otherwise
+        # reap it first and its resource usage would be lost. In its own
+        # process group so the builds it spawns are terminated with it, and
+        # started off the event loop as Popen blocks until the child execs
+        loop = asyncio.get_running_loop()
+        process = await loop.run_in_executor(
+            None,
+            functools.partial(
+                subprocess.Popen,
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=cwd,
+                env=env,
+                start_new_session=True,
+            ),
+        )
+        stdout = await open_pipe_reader(process.stdout)
+        stderr = await open_pipe_reader(process.stderr)
+
+        def wait4() -> Any:
+            _, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            return rusage
+
+        exited = loop.run_in_executor(None, wait4)
+        return process, stdout, stderr, exited
+
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+        env=env,
+        limit=STREAM_LINE_LIMIT,
+    )
+    assert process.stdout is not None
+    assert process.stderr is not None
+    return process, process.stdout, process.stderr, asyncio.ensure_future(process.wait())
+
+
+def signal_process(process: Any, sig: int) -> None:
+    """
+    Send sig to the process group of a process started by spawn_process,
+    or where there are no process groups to the process alone.
+    """
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, sig)
+        elif sig == signal.SIGTERM:
+            process.terminate()
         else:
-            yield None
+            process.kill()
+    except ProcessLookupError:
+        pass
+
+
+async def terminate_process(process: Any, exited: asyncio.Future) -> None:
+    signal_process(process, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(asyncio.shield(exited), 5)
+    except TimeoutError:
+        signal_process(process, getattr(signal, "SIGKILL", signal.SIGTERM))
+
+
+def process_timing(wall_seconds: float, rusage: Any) -> dict[str, Any]:
+    """
+    Timing block of the summary, CPU times include the build backends and
+    other subprocesses pip waited on.
+    """
+    timing: dict[str, Any] = {
+        "wall_seconds": round(wall_seconds, 3),
+        "user_cpu_seconds": None,
+        "system_cpu_seconds": None,
+        "max_rss_bytes": None,
+    }
+    if hasattr(rusage, "ru_utime"):
+        # ru_maxrss is in kilobytes everywhere but macOS
+        max_rss_scale = 1 if sys.platform == "darwin" else 1024
+        timing["user_cpu_seconds"] = round(rusage.ru_utime, 3)
+        timing["system_cpu_seconds"] = round(rusage.ru_stime, 3)
+        timing["max_rss_bytes"] = rusage.ru_maxrss * max_rss_scale
+    return timing
+
+
+async def stream_process(
+    command: list[str],
+    cwd: str | None,
+    env: dict[str, str],
+    on_stdout_line: Callable[[str], bool],
+    on_stderr_line: Callable[[str], None],
+    timeout: float | None = None,
+) -> tuple[bool, bool, dict[str, Any]]:
+    """
+    Run command and feed each line of stdout and stderr to the callbacks as
+    soon as it arrives. If on_stdout_line returns True, or the process is
+    still running after timeout seconds, the process is terminated and the
+    rest of its stdout is ignored.
+
+    Returns whether on_stdout_line terminated the process, whether it timed
+    out and its timing.
+    """
+    start = time.perf_counter()
+    process, stdout, stderr, exited = await spawn_process(command, cwd, env)
+    terminated = False
+    timed_out = False
+
+    async def read_stdout(stream: asyncio.StreamReader) -> None:
+        nonlocal terminated
+        try:
+            async for raw_line in stream:
+                if on_stdout_line(raw_line.decode(errors="replace").rstrip("\r\n")):
+                    terminated = True
+                    await terminate_process(process, exited)
+                    return
+        except BaseException:
+            # Nothing drains the pipe any more, pip would block writing to it
+            await terminate_process(process, exited)
+            raise
+
+    async def read_stderr(stream: asyncio.StreamReader) -> None:
+        try:
+            async for raw_line in stream:
+                on_stderr_line(raw_line.decode(errors="replace").rstrip("\r\n"))
+        except BaseException:
+            await terminate_process(process, exited)
+            raise
+
+    readers = [
+        asyncio.create_task(read_stdout(stdout)),
+        asyncio.create_task(read_stderr(stderr)),
+    ]
+    deadline = None if timeout is None else start + timeout
+    waiting = {exited, *readers}
+    try:
+        # Woken by a reader finishing too, a reader that failed has
+        # terminated the process and its error is raised once it exited
+        while not exited.done():
+            remaining = None
+            if deadline is not None:
+                remaining = max(deadline - time.perf_counter(), 0)
+            done, waiting = await asyncio.wait(
+                waiting, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                timed_out = not terminated
+                await terminate_process(process, exited)
+                break
+        rusage = await exited
+    except BaseException:
+        # Interrupted, e.g. by Ctrl+C which no longer reaches the new session
+        signal_process(process, getattr(signal, "SIGKILL", signal.SIGTERM))
+        raise
+    timing = process_timing(time.perf_counter() - start, rusage)
+
+    # Build backends spawned by pip can briefly outlive it and hold the
+    # pipes open, don't wait on them forever once pip itself has exited
+    _, still_reading = await asyncio.wait(readers, timeout=5)
+    for reader in still_reading:
+        reader.cancel()
+    for reader in readers:
+        if not reader.cancelled() and reader.exception() is not None:
+            raise reader.exception()
+
+    return terminated, timed_out, timing
+
+
+def venv_python_path(venv_dir: Path) -> Path:
+    if os.name != "nt":
+        return venv_dir / "bin" / "python"
+    else:
+        return venv_dir / "Scripts" / "python.exe"
 
 
 def create_virtualenv(venv_dir: Path, python_version: str) -> Path:
@@ -309,14 +983,261 @@ def create_virtualenv(venv_dir: Path, python_version: str) -> Path:
     Returns the path to the python executable in the virtual environment.
     """
     create_venv_cmd = ["uv", "venv", "--python", python_version, str(venv_dir)]
-    result = subprocess.run(create_venv_cmd, capture_output=True, text=True)
+    result = subprocess.run(create_venv_cmd, capture_output=True, text=True, check=False)
     if result.returncode != 0:
         print(f"Error creating venv: {result.stderr}")
         raise RuntimeError("Virtual environment creation failed")
-    if os.name != "nt":
-        return venv_dir / "bin" / "python"
-    else:
-        return venv_dir / "Scripts" / "python.exe"
+    return venv_python_path(venv_dir)
+
+
+def install_pip(venv_python: Path, pip_requirement: str) -> bool:
+    """
+    Install pip_requirement into the virtual environment of venv_python.
+    Returns whether the install succeeded.
+    """
+    install_pip_cmd = [
+        sys.executable,
+        "-m",
+        "uv",
+        "pip",
+        "install",
+        "--python",
+        str(venv_python),
+        pip_requirement,
+    ]
+    result_install_pip = subprocess.run(
+        install_pip_cmd, capture_output=True, text=True, check=False
+    )
+    if result_install_pip.returncode != 0:
+        print(f"Error installing pip: {result_install_pip.stderr}")
+        return False
+    return True
+
+
+def venv_manifest_digest(venv_dir: Path) -> str:
+    """
+    Digest of the relative path and size of every file in a virtual
+    environment, bytecode caches are ignored as running pip writes them.
+    """
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(venv_dir):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        for name in sorted(files):
+            path = Path(root) / name
+            relative_path = path.relative_to(venv_dir).as_posix()
+            digest.update(f"{relative_path}\0{path.lstat().st_size}\0".encode())
+    return digest.hexdigest()
+
+
+def pooled_venv_is_valid(
+    entry_dir: Path, python_version: str, pip_requirement: str
+) -> bool:
+    try:
+        metadata = json.loads((entry_dir / "pool.json").read_text())
+    except (OSError, json.JSONDecodeError):
+        return False
+    venv_dir = entry_dir / "venv"
+    return (
+        metadata.get("python_version") == python_version
+        and metadata.get("pip_requirement") == pip_requirement
+        and venv_python_path(venv_dir).exists()
+        and metadata.get("manifest") == venv_manifest_digest(venv_dir)
+    )
+
+
+def build_pooled_venv(
+    pool_dir: Path, entry_dir: Path, python_version: str, pip_requirement: str
+) -> bool:
+    """
+    Build a pool entry in a temporary directory and rename it into place,
+    so concurrent workers never see a half built virtual environment.
+    """
+    pool_dir.mkdir(parents=True, exist_ok=True)
+    build_dir = Path(tempfile.mkdtemp(prefix=f".{entry_dir.name}-", dir=pool_dir))
+    try:
+        venv_dir = build_dir / "venv"
+        venv_python = create_virtualenv(venv_dir, python_version)
+        if not install_pip(venv_python, pip_requirement):
+            return False
+        metadata = {
+            "python_version": python_version,
+            "pip_requirement": pip_requirement,
+            "manifest": venv_manifest_digest(venv_dir),
+        }
+        (build_dir / "pool.json").write_text(json.dumps(metadata, indent=1))
+        try:
+            os.rename(build_dir, entry_dir)
+        except OSError:
+            # Another worker built this entry first
+            pass
+        return True
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+
+def lock_pool_entry(lock_file: IO[str], exclusive: bool, wait: bool = True) -> bool:
+    """
+    flock a pool entry's lock file, shared while scenarios run from the
+    entry and exclusive to rebuild or evict it. Returns False when wait is
+    not set and the lock is held elsewhere. Entries are not locked where
+    there is no fcntl, i.e. on Windows.
+    """
+    if fcntl is None:
+        return True
+    operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+    try:
+        fcntl.flock(lock_file, operation if wait else operation | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def pool_entry_lock_path(entry_dir: Path) -> Path:
+    # Next to the entry rather than in it, so it outlives the entry being
+    # removed and renamed into place, and is never removed itself as a
+    # worker waiting on it would then hold a lock on a removed file
+    return entry_dir.with_name(f"{entry_dir.name}.lock")
+
+
+def evict_pooled_venvs(pool_dir: Path, max_entries: int, keep: Path) -> None:
+    """
+    Remove the least recently used pool entries beyond max_entries that no
+    scenario is running from, and build directories left behind by crashed
+    runs.
+    """
+    entries = []
+    for entry_dir in pool_dir.iterdir():
+        if not entry_dir.is_dir():
+            continue
+        if entry_dir.name.startswith("."):
+            if time.time() - entry_dir.stat().st_mtime > STALE_VENV_BUILD_SECONDS:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            continue
+        last_used = entry_dir / "last_used"
+        try:
+            entries.append((last_used.stat().st_mtime, entry_dir))
+        except FileNotFoundError:
+            entries.append((0.0, entry_dir))
+
+    entries.sort(reverse=True)
+    for _, entry_dir in entries[max_entries:]:
+        if entry_dir == keep:
+            continue
+        with pool_entry_lock_path(entry_dir).open("a") as lock_file:
+            if lock_pool_entry(lock_file, exclusive=True, wait=False):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+
+
+def rebuild_pooled_venv(
+    pool_dir: Path, entry_dir: Path, python_version: str, pip_requirement: str
+) -> bool:
+    """
+    Replace an invalid pool entry, called with its lock held exclusively.
+    Returns whether the entry is valid afterwards.
+    """
+    # Another worker may have rebuilt it while this one waited for the lock
+    if pooled_venv_is_valid(entry_dir, python_version, pip_requirement):
+        return True
+    shutil.rmtree(entry_dir, ignore_errors=True)
+    if not build_pooled_venv(pool_dir, entry_dir, python_version, pip_requirement):
+        return False
+    if not pooled_venv_is_valid(entry_dir, python_version, pip_requirement):
+        print(f"Error: pooled venv {entry_dir} failed its integrity check")
+        return False
+    return True
+
+
+@contextmanager
+def acquire_pooled_venv(
+    python_version: str,
+    pip_requirement: str,
+    pool_dir: Path,
+    max_entries: int = VENV_POOL_SIZE,
+) -> Iterator[Path | None]:
+    """
+    Yield the python executable of a pristine pooled virtual environment
+    with pip_requirement installed, building it if needed, or None if it
+    could not be built. Scenarios only run pip with --dry-run
+    --ignore-installed so the environment is reused in place rather than
+    copied, it is locked until the with block exits so no other worker
+    evicts or rebuilds it meanwhile.
+    """
+    key = hashlib.sha256(f"{python_version}\0{pip_requirement}".encode()).hexdigest()
+    entry_dir = pool_dir / key[:16]
+    pool_dir.mkdir(parents=True, exist_ok=True)
+    with pool_entry_lock_path(entry_dir).open("a") as lock_file:
+        lock_pool_entry(lock_file, exclusive=False)
+        if not pooled_venv_is_valid(entry_dir, python_version, pip_requirement):
+            # Waits for the scenarios still running from the old entry
+            lock_pool_entry(lock_file, exclusive=True)
+            if not rebuild_pooled_venv(
+                pool_dir, entry_dir, python_version, pip_requirement
+            ):
+                yield None
+                return
+            lock_pool_entry(lock_file, exclusive=False)
+
+        (entry_dir / "last_used").touch()
+        evict_pooled_venvs(pool_dir, max_entries, keep=entry_dir)
+        yield venv_python_path(entry_dir / "venv")
+
+
+def stable_index_port(cache_dir: Path) -> int:
+    digest = hashlib.sha256(str(cache_dir.resolve()).encode()).digest()
+    offset = int.from_bytes(digest[:4]) % len(STABLE_INDEX_PORTS)
+    return STABLE_INDEX_PORTS[offset]
+
+
+def installed_pip_sha256(venv_python: Path) -> str | None:
+    """
+    Hash of the file hashes pip's RECORD lists for its own package, which
+    identifies the pip build whether it came from PyPI or a git commit.
+    Scripts and bytecode are left out as they depend on the venv's path.
+    """
+    result = subprocess.run(
+        [
+            str(venv_python),
+            "-c",
+            "import importlib.metadata as m; print(m.distribution('pip').read_text('RECORD'))",
+        ],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        print(f"Error reading pip's RECORD: {result.stderr}")
+        return None
+    entries = sorted(
+        line
+        for line in result.stdout.splitlines()
+        if line.startswith("pip/") and "__pycache__" not in line
+    )
+    return hashlib.sha256("\n".join(entries).encode()).hexdigest()
+
+
+@functools.cache
+def resolve_pip_sha256(
+    python_version: str,
+    pip_requirement: str,
+    venv_pool_dir: Path | None = None,
+    venv_pool_size: int = VENV_POOL_SIZE,
+) -> str | None:
+    """
+    Install pip_requirement, from the pool when enabled, and return the
+    installed_pip_sha256 of it. Cached as every scenario of a python
+    version shares the result.
+    """
+    if venv_pool_dir is not None:
+        with acquire_pooled_venv(
+            python_version, pip_requirement, venv_pool_dir, venv_pool_size
+        ) as venv_python:
+            return installed_pip_sha256(venv_python) if venv_python else None
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        venv_python = create_virtualenv(Path(temp_dir) / ".venv", python_version)
+        if not install_pip(venv_python, pip_requirement):
+            return None
+        return installed_pip_sha256(venv_python)
 
 
 def create_project_dir(
@@ -377,14 +1298,42 @@ def install_requirements(
     project_name: str | None = None,
     project_extras: list[str] | None = None,
     optional_dependencies: dict[str, list[str]] | None = None,
-) -> tuple[ReporterLines, ResolutionLines, str, bool]:
-    # Build the base command
+    log_dir: Path | None = None,
+    index_url: str | None = None,
+    on_round: Callable[[dict[str, Any], float, float], None] | None = None,
+    cache_dir: Path | None = None,
+    budgets: dict[str, Any] | None = None,
+    progress: ProgressTracker | None = None,
+    reporter: str = TEXT_REPORTER,
+    profile_path: Path | None = None,
+    record_path: Path | None = None,
+) -> tuple[
+    ReporterLines,
+    ResolutionLines,
+    DownloadLines,
+    SdistBuildLines,
+    str,
+    str | None,
+    dict[str, Any],
+]:
+    # Build the base command, pip is run through reporter_shim.py to replace
+    # its reporter, to profile it or to record its resolution
+    shim_options = []
+    if reporter == SHIM_REPORTER:
+        shim_options.append("--events")
+    if profile_path is not None:
+        shim_options.extend(["--profile", str(profile_path)])
+    if record_path is not None:
+        shim_options.extend(["--record", str(record_path)])
+    if shim_options:
+        pip_command = [str(REPORTER_SHIM), *shim_options]
+    else:
+        pip_command = ["-m", "pip"]
     command_install = [
         str(venv_python),
         "-W",
         "ignore",
-        "-m",
-        "pip",
+        *pip_command,
         "install",
         "--dry-run",
         "--ignore-installed",
@@ -397,6 +1346,21 @@ def install_requirements(
         "-",
     ]
 
+    # Unbuffered so lines, and the times they are seen, arrive as pip prints them
+    env = {"PIP_RESOLVER_DEBUG": "1", **os.environ, "PYTHONUNBUFFERED": "1"}
+    if index_url is not None:
+        # Only the given index, so results don't depend on the user's config,
+        # trusted as pip only uses its HTTP cache for https and trusted hosts
+        command_install.extend(["--index-url", index_url])
+        if index_netloc := urlparse(index_url).netloc:
+            command_install.extend(["--trusted-host", index_netloc])
+        env.pop("PIP_EXTRA_INDEX_URL", None)
+        env.pop("PIP_FIND_LINKS", None)
+    if cache_dir is not None:
+        # A managed cache, so results don't depend on the user's cache
+        env["PIP_CACHE_DIR"] = str(cache_dir)
+        env.pop("PIP_NO_CACHE_DIR", None)
+
     # Add constraints file if provided
     if constraints and len(constraints) > 0:
         constraints_file = os.path.join(temp_dir, "constraints.txt")
@@ -418,68 +1382,78 @@ def install_requirements(
         # Standard requirements install
         project_dir = None
         command_install.extend(requirements)
-    stdout_path = os.path.join(temp_dir, "stdout.txt")
-    stderr_path = os.path.join(temp_dir, "stderr.txt")
     stderr_lines: list[str] = []
     report_lines = ReporterLines()
-    resolution_lines = ResolutionLines()
-    resolution_too_deep = False
-
-    with open(stdout_path, "w") as out, open(stderr_path, "w") as err:
-        process = subprocess.Popen(
-            command_install,
-            stdout=out,
-            stderr=err,
-            text=True,
-            cwd=str(project_dir) if project_dir else None,
-            env={"PIP_RESOLVER_DEBUG": "1", **os.environ},
+    download_lines = DownloadLines()
+    sdist_build_lines = SdistBuildLines()
+    run_budget = RunBudget(budgets)
+    termination_reason = None
+
+    def on_resolution_round(
+        resolution_round: dict[str, Any], started: float, ended: float
+    ) -> None:
+        run_budget.add_round(resolution_round)
+        if progress is not None:
+            progress.add_round(
+                resolution_round,
+                resolution_lines.round_count,
+                len(resolution_lines.summary_metrics.wheels),
+                len(resolution_lines.summary_metrics.sdists),
+            )
+        if on_round is not None:
+            on_round(resolution_round, started, ended)
+
+    resolution_lines = ResolutionLines(keep_rounds=False, on_round=on_resolution_round)
+
+    with ExitStack() as stack:
+        stdout_log = stderr_log = None
+        if log_dir is not None:
+            log_dir.mkdir(exist_ok=True, parents=True)
+            stdout_log = stack.enter_context(open(log_dir / "stdout.txt", "w"))
+            stderr_log = stack.enter_context(open(log_dir / "stderr.txt", "w"))
+
+        def on_stdout_line(line: str) -> bool:
+            nonlocal termination_reason
+            if stdout_log is not None:
+                stdout_log.write(line + "\n")
+            resolution_lines.process_line(line)
+            report_lines.process_line(line)
+            download_lines.process_line(line)
+            sdist_build_lines.process_line(line)
+            run_budget.process_line(line)
+            if progress is not None:
+                progress.update()
+            if (
+                max_resolution_rounds is not None
+                and resolution_lines.round_count >= max_resolution_rounds
+            ):
+                termination_reason = "Resolution Too Deep"
+            else:
+                termination_reason = run_budget.exceeded
+            return termination_reason is not None
+
+        def on_stderr_line(line: str) -> None:
+            if stderr_log is not None:
+                stderr_log.write(line + "\n")
+            stderr_lines.append(line)
+
+        _, timed_out, timing = asyncio.run(
+            stream_process(
+                command_install,
+                cwd=str(project_dir) if project_dir else None,
+                env=env,
+                on_stdout_line=on_stdout_line,
+                on_stderr_line=on_stderr_line,
+                timeout=run_budget.max_wall_seconds,
+            )
         )
-        with open(stdout_path, "r") as stdout_tail, open(stderr_path, "r") as stderr_tail:
-            stdout_gen = tail_file(stdout_tail)
-            stderr_gen = tail_file(stderr_tail)
-            while process.poll() is None and not resolution_too_deep:
-                stdout_line = next(stdout_gen, None)
-                if stdout_line:
-                    resolution_lines.process_line(stdout_line)
-                    report_lines.process_line(stdout_line)
-                    if (
-                        max_resolution_rounds is not None
-                        and len(resolution_lines.resolution_rounds)
-                        >= max_resolution_rounds
-                    ):
-                        resolution_too_deep = True
-                        try:
-                            process.terminate()
-                            process.wait(5)
-                        except subprocess.TimeoutExpired:
-                            process.kill()
-                        continue
-                stderr_line = next(stderr_gen, None)
-                if stderr_line:
-                    stderr_lines.append(stderr_line)
-                if stdout_line is None and stderr_line is None:
-                    time.sleep(0.1)
-            # Consume remaining lines
-            for stdout_line in stdout_gen:
-                if stdout_line:
-                    resolution_lines.process_line(stdout_line)
-                    report_lines.process_line(stdout_line)
-                    # Check again for max resolution rounds in case we're processing remaining lines
-                    if (
-                        max_resolution_rounds is not None
-                        and len(resolution_lines.resolution_rounds)
-                        >= max_resolution_rounds
-                        and not resolution_too_deep
-                    ):
-                        resolution_too_deep = True
-                        break
-                else:
-                    break
-            for stderr_line in stderr_gen:
-                if stderr_line:
-                    stderr_lines.append(stderr_line)
-                else:
-                    break
+        if timed_out:
+            termination_reason = WALL_BUDGET_EXCEEDED
+
+    timing.update(resolution_lines.latency_metrics())
+    timing["sdist_build_seconds"] = round(
+        sum((build["seconds"] for build in sdist_build_lines.as_list()), 0.0), 3
+    )
 
     # Clean up stderr lines
     stderr_clean = []
@@ -499,55 +1473,239 @@ def install_requirements(
         if "Please use pip<24.1" in line:
             metadata_warning = False
 
-    return report_lines, resolution_lines, "\n".join(stderr_clean), resolution_too_deep
+    return (
+        report_lines,
+        resolution_lines,
+        download_lines,
+        sdist_build_lines,
+        "\n".join(stderr_clean),
+        termination_reason,
+        timing,
+    )
 
 
-def calculate_summary_metrics(
-    resolution_rounds: list[dict[str, Any]], install_info: list[dict[str, str]]
-) -> dict[str, Any]:
+class SummaryMetrics:
     """
-    Calculate summary metrics from resolution rounds and install info.
+    Summary metrics accumulated one resolution round at a time.
     """
-    wheels: set[str] = set()
-    sdists: set[str] = set()
-    visited_packages = 0
-    visited_requirements = 0
-    rejected_requirements = 0
-    number_pinned = 0
-    number_rounds = len(resolution_rounds)
 
-    for resolution_round in resolution_rounds:
+    def __init__(self) -> None:
+        self.wheels: set[str] = set()
+        self.sdists: set[str] = set()
+        self.visited_packages = 0
+        self.visited_requirements = 0
+        self.rejected_requirements = 0
+        self.number_pinned = 0
+        self.number_rounds = 0
+
+    def add_round(self, resolution_round: dict[str, Any]) -> None:
+        self.number_rounds += 1
         if "pinned" in resolution_round:
-            number_pinned += len(resolution_round["pinned"])
+            self.number_pinned += len(resolution_round["pinned"])
         if "added" in resolution_round:
-            visited_packages += len(resolution_round["added"])
-            wheels.update(w for w in resolution_round["added"] if w.endswith(".whl"))
-            sdists.update(s for s in resolution_round["added"] if not s.endswith(".whl"))
+            self.visited_packages += len(resolution_round["added"])
+            self.wheels.update(w for w in resolution_round["added"] if w.endswith(".whl"))
+            self.sdists.update(
+                s for s in resolution_round["added"] if not s.endswith(".whl")
+            )
             for added_requirements in resolution_round["added"].values():
-                visited_requirements += len(added_requirements)
+                self.visited_requirements += len(added_requirements)
         if "rejected" in resolution_round:
-            rejected_requirements += len(resolution_round["rejected"])
+            self.rejected_requirements += len(resolution_round["rejected"])
+
+    def add_compact_round(
+        self, compact_round: CompactRound, strings: StringTable
+    ) -> None:
+        """
+        Same as add_round for a round interned in strings, without turning
+        it back into dicts.
+        """
+        self.number_rounds += 1
+        self.number_pinned += len(compact_round.pinned)
+        self.visited_packages += compact_round.added_count
+        self.rejected_requirements += compact_round.rejected_count
+        added = compact_round.added
+        index = 0
+        while index < len(added):
+            from_file = strings[added[index]]
+            if from_file.endswith(".whl"):
+                self.wheels.add(from_file)
+            else:
+                self.sdists.add(from_file)
+            self.visited_requirements += added[index + 1]
+            index += 2 + added[index + 1]
+
+    def as_dict(self, install_info: list[dict[str, str]]) -> dict[str, Any]:
+        return {
+            "distinct_wheels_visited": len(self.wheels),
+            "distinct_sdists_visited": len(self.sdists),
+            "total_visited_packages": self.visited_packages,
+            "total_visited_requirements": self.visited_requirements,
+            "total_rejected_requirements": self.rejected_requirements,
+            "total_pinned_packages": self.number_pinned,
+            "total_rounds": self.number_rounds,
+            "install_info": sorted(
+                install_info,
+                key=lambda x: (
+                    x.get("file", ""),
+                    x.get("url", ""),
+                    x.get("hash", ""),
+                    x.get("commit", ""),
+                ),
+            ),
+        }
+
+
+def calculate_summary_metrics(
+    resolution_rounds: Iterable[dict[str, Any]] | Iterable[CompactRound],
+    install_info: list[dict[str, str]],
+    strings: StringTable | None = None,
+) -> dict[str, Any]:
+    """
+    Calculate summary metrics from resolution rounds and install info, the
+    rounds are CompactRounds interned in strings when it is given.
+    """
+    summary_metrics = SummaryMetrics()
+    for resolution_round in resolution_rounds:
+        if strings is not None:
+            summary_metrics.add_compact_round(resolution_round, strings)
+        else:
+            summary_metrics.add_round(resolution_round)
+    return summary_metrics.as_dict(install_info)
+
+
+def run_result(
+    report_lines: ReporterLines,
+    resolution_lines: ResolutionLines,
+    stderr: str,
+    termination_reason: str | None,
+) -> tuple[dict[str, Any], dict[str, Any]]:
+    """
+    Return the "result" and "summary" blocks of one pip run, a run that was
+    terminated early fails with termination_reason and the metrics of the
+    rounds completed before it was.
+    """
+    # Handle success/failure status based on stderr and resolution flag
+    success = True
+    failure_reason = None
+    if stderr:
+        success = False
+        if "subprocess-exited-with-error" in stderr:
+            failure_reason = "Build Failure"
+        elif "ResolutionTooDeep" in stderr or "resolution-too-deep" in stderr:
+            failure_reason = "Resolution Too Deep"
+        elif "ResolutionImpossible" in stderr:
+            failure_reason = "Resolution Impossible"
+        else:
+            failure_reason = stderr
+    if termination_reason is not None:
+        success = False
+        failure_reason = termination_reason
+
+    # Grab install information from report
+    install_info: list[dict[str, str]] = []
+    if report_lines.reporter_lines:
+        report_json = json.loads("\n".join(report_lines.reporter_lines))
+        for report_install in report_json["install"]:
+            download_info = report_install["download_info"]
+            if "archive_info" in download_info:
+                install_info.append(
+                    {
+                        "file": extract_filename(download_info["url"]),
+                        "hash": extract_filename(download_info["archive_info"]["hash"]),
+                    }
+                )
+            elif "vcs_info" in download_info:
+                install_info.append(
+                    {
+                        "url": download_info["url"],
+                        "commit": download_info["vcs_info"]["commit_id"],
+                    }
+                )
+            else:
+                raise ValueError(f"Unknown download info format: {download_info}")
+
+    # Summary metrics were accumulated round by round as pip ran
+    summary_metrics = resolution_lines.summary_metrics.as_dict(install_info)
+
+    return {"success": success, "failure_reason": failure_reason}, summary_metrics
+
+
+def repeat_summary(
+    runs: list[tuple[dict[str, Any], dict[str, Any], dict[str, Any]]], warmup: int
+) -> dict[str, Any]:
+    """
+    Summarize repeated runs of a scenario: the per-run timing samples, their
+    median, MAD and bootstrap confidence interval, and which result and
+    summary values, that should be deterministic, differed between runs.
+    """
+    first_result, first_summary, _ = runs[0]
+    nondeterministic = [
+        key
+        for key in first_result
+        if any(r[key] != first_result[key] for r, _, _ in runs)
+    ]
+    nondeterministic.extend(
+        key
+        for key in first_summary
+        if any(summary[key] != first_summary[key] for _, summary, _ in runs)
+    )
+
+    timing_samples: dict[str, list[float]] = {}
+    for key in runs[0][2]:
+        samples = [timing.get(key) for _, _, timing in runs]
+        if all(isinstance(sample, (int, float)) for sample in samples):
+            timing_samples[key] = samples
 
     return {
-        "distinct_wheels_visited": len(wheels),
-        "distinct_sdists_visited": len(sdists),
-        "total_visited_packages": visited_packages,
-        "total_visited_requirements": visited_requirements,
-        "total_rejected_requirements": rejected_requirements,
-        "total_pinned_packages": number_pinned,
-        "total_rounds": number_rounds,
-        "install_info": sorted(
-            install_info,
-            key=lambda x: (
-                x.get("file", ""),
-                x.get("url", ""),
-                x.get("hash", ""),
-                x.get("commit", ""),
-            ),
-        ),
+        "repeat": {
+            "runs": len(runs),
+            "warmup": warmup,
+            "nondeterministic": nondeterministic,
+        },
+        "timing_samples": timing_samples,
+        "timing_stats": {
+            key: {name: round(value, 6) for name, value in sample_stats(samples).items()}
+            for key, samples in timing_samples.items()
+        },
     }
 
 
+def atomic_dump(formatter: Formatter, obj: Any, path: Path) -> None:
+    """
+    Write JSON to a temporary file next to path and then rename it into
+    place, so a crashed or killed run never leaves a truncated file behind.
+    """
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        formatter.dump(obj, output_file=str(temp_path), newline_at_eof=True)
+        os.replace(temp_path, path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+def record_result(
+    results_db: Path | None, summary_path: Path, summary_json: dict[str, Any]
+) -> None:
+    """
+    Keep the results database in step with the summary files, which stay
+    the source of truth.
+    """
+    if results_db is None:
+        return
+    conn = connect(results_db)
+    try:
+        with conn:
+            upsert_result(
+                conn,
+                summary_path.parent.parent.name,
+                summary_path.parent.name,
+                summary_json,
+            )
+    finally:
+        conn.close()
+
+
 def process_scenario(
     pip_name: str,
     pip_requirement: str,
@@ -562,112 +1720,280 @@ def process_scenario(
     project_name: str | None = None,
     project_extras: list[str] | None = None,
     optional_dependencies: dict[str, list[str]] | None = None,
-):
-    with tempfile.TemporaryDirectory() as temp_dir:
-        # Create virtual environment using the helper
-        venv_dir = Path(temp_dir) / ".venv"
-        venv_python = create_virtualenv(venv_dir, python_version)
-
-        # Install pip in the virtual environment
-        install_pip_cmd = [
-            sys.executable,
-            "-m",
-            "uv",
-            "pip",
-            "install",
-            "--python",
-            str(venv_python),
-            pip_requirement,
-        ]
-        result_install_pip = subprocess.run(
-            install_pip_cmd, capture_output=True, text=True
-        )
-        if result_install_pip.returncode != 0:
-            print(f"Error installing pip: {result_install_pip.stderr}")
-            return
-
-        # Install requirements using the helper
-        report_lines, resolution_lines, stderr, resolution_too_deep = (
-            install_requirements(
-                venv_python,
-                datetime,
-                requirements,
-                temp_dir,
-                max_resolution_rounds,
-                constraints,
-                project_name,
-                project_extras,
-                optional_dependencies,
+    budgets: dict[str, Any] | None = None,
+    local_index: str | None = None,
+    local_index_dir: Path | None = None,
+    log_dir: Path | None = None,
+    venv_pool_dir: Path | None = None,
+    venv_pool_size: int = VENV_POOL_SIZE,
+    index_snapshot_dir: Path | None = None,
+    index_snapshot_mode: str = RECORD,
+    output_codec: str = "none",
+    results_db: Path | None = None,
+    repeat: int = 1,
+    warmup: int = 0,
+    fingerprint: dict[str, Any] | None = None,
+    result_cache_dir: Path | None = None,
+    cache_mode: str = USER_CACHE,
+    pip_cache_dir: Path = Path(PIP_CACHE_DIR),
+    progress_queue: Any = None,
+    reporter: str = TEXT_REPORTER,
+    profile: bool = False,
+    record_resolution: bool = False,
+) -> bool:
+    """
+    Run a scenario and write its summary to summary_path, returns False
+    without writing one when its virtual environment or pip could not be
+    set up.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir, ExitStack() as venv_stack:
+        if venv_pool_dir is not None:
+            venv_python = venv_stack.enter_context(
+                acquire_pooled_venv(
+                    python_version, pip_requirement, venv_pool_dir, venv_pool_size
+                )
             )
-        )
+            if venv_python is None:
+                return False
+        else:
+            # Create virtual environment using the helper
+            venv_dir = Path(temp_dir) / ".venv"
+            venv_python = create_virtualenv(venv_dir, python_version)
 
-        # Handle success/failure status based on stderr and resolution flag
-        success = True
-        failure_reason = None
-        if stderr:
-            success = False
-            if "subprocess-exited-with-error" in stderr:
-                failure_reason = "Build Failure"
-            elif "ResolutionTooDeep" in stderr or "resolution-too-deep" in stderr:
-                failure_reason = "Resolution Too Deep"
-            elif "ResolutionImpossible" in stderr:
-                failure_reason = "Resolution Impossible"
-            else:
-                failure_reason = stderr
-        if resolution_too_deep:
-            success = False
-            failure_reason = "Resolution Too Deep"
+            # Install pip in the virtual environment
+            if not install_pip(venv_python, pip_requirement):
+                return False
 
-        # Grab install information from report
-        install_info: list[dict[str, str]] = []
-        if report_lines.reporter_lines:
-            report_json = json.loads("\n".join(report_lines.reporter_lines))
-            for report_install in report_json["install"]:
-                download_info = report_install["download_info"]
-                if "archive_info" in download_info:
-                    install_info.append(
-                        {
-                            "file": extract_filename(download_info["url"]),
-                            "hash": extract_filename(
-                                download_info["archive_info"]["hash"]
-                            ),
-                        }
+        scenario_input = {
+            "pip_version": pip_name,
+            "python_version": python_version,
+            "datetime": datetime,
+            "platform_system": platform_system,
+            "requirements": requirements,
+            "max_resolution_rounds": max_resolution_rounds,
+            "constraints": constraints,
+            "project_name": project_name,
+            "project_extras": project_extras,
+            "optional_dependencies": optional_dependencies,
+            "budgets": budgets,
+            "local_index": local_index,
+        }
+
+        with ExitStack() as stack:
+            # Optionally stream the detailed trace to disk round by round
+            trace_writer = None
+            if output_path is not None:
+                trace_writer = stack.enter_context(TraceWriter(output_path, output_codec))
+                trace_writer.write({"input": scenario_input})
+
+            # A warm cache that was never primed is primed by an extra
+            # warmup run, unless there already is one
+            cache_dir = None
+            primed_marker = None
+            if cache_mode == WARM_CACHE:
+                warm_key = hashlib.sha256(
+                    json.dumps(scenario_input, sort_keys=True).encode()
+                ).hexdigest()
+                cache_dir = pip_cache_dir / WARM_CACHE / warm_key[:16]
+                primed_marker = cache_dir / "primed"
+                if not primed_marker.exists():
+                    warmup = max(warmup, 1)
+            elif cache_mode == SHARED_CACHE:
+                cache_dir = pip_cache_dir / SHARED_CACHE
+
+            # Install requirements using the helper, optionally against a
+            # local snapshot of the index instead of the live index. A cache
+            # kept between invocations needs the same index URLs every time
+            index_url = None
+            if local_index_dir is not None:
+                # A scenario with its own index, e.g. a synthetic one
+                index_url = local_index_dir.resolve().as_uri() + "/"
+            elif index_snapshot_dir is not None:
+                port = 0 if cache_dir is None else stable_index_port(cache_dir)
+                try:
+                    index_url = stack.enter_context(
+                        serve_index_snapshot(
+                            index_snapshot_dir,
+                            index_snapshot_mode,
+                            uploaded_prior_to=datetime,
+                            port=port,
+                        )
+                    )
+                except OSError:
+                    print(
+                        f"Warning: index port {port} is in use, "
+                        f"the {cache_mode} pip cache will miss"
                     )
-                elif "vcs_info" in download_info:
-                    install_info.append(
-                        {
-                            "url": download_info["url"],
-                            "commit": download_info["vcs_info"]["commit_id"],
-                        }
+                    index_url = stack.enter_context(
+                        serve_index_snapshot(
+                            index_snapshot_dir,
+                            index_snapshot_mode,
+                            uploaded_prior_to=datetime,
+                        )
                     )
-                else:
-                    raise ValueError(f"Unknown download info format: {download_info}")
 
-        # Calculate summary metrics
-        summary_metrics = calculate_summary_metrics(
-            resolution_lines.resolution_rounds, install_info
-        )
+            # Warmup runs are discarded, e.g. to fill pip's HTTP cache
+            runs = []
+            for run in range(warmup + repeat):
+                # Only the first measured run is logged and traced
+                first_measured = run == warmup
+                run_dir = Path(temp_dir) / f"run-{run}"
+                run_dir.mkdir()
+                if cache_mode == COLD_CACHE:
+                    cache_dir = run_dir / "pip-cache"
+                progress = None
+                if progress_queue is not None:
+                    progress = ProgressTracker(
+                        scenario_label(summary_path), progress_queue.put
+                    )
+                (
+                    report_lines,
+                    resolution_lines,
+                    download_lines,
+                    sdist_build_lines,
+                    stderr,
+                    termination_reason,
+                    timing,
+                ) = install_requirements(
+                    venv_python,
+                    datetime,
+                    requirements,
+                    str(run_dir),
+                    max_resolution_rounds,
+                    constraints,
+                    project_name,
+                    project_extras,
+                    optional_dependencies,
+                    log_dir if first_measured else None,
+                    index_url,
+                    trace_writer.write_round
+                    if trace_writer is not None and first_measured
+                    else None,
+                    cache_dir,
+                    budgets,
+                    progress,
+                    reporter,
+                )
+                if run < warmup:
+                    continue
+                if first_measured:
+                    cache = {
+                        "mode": cache_mode,
+                        "hits": download_lines.hits,
+                        "misses": download_lines.misses,
+                    }
+                    sdist_builds = sdist_build_lines.as_list()
+                result, summary_metrics = run_result(
+                    report_lines, resolution_lines, stderr, termination_reason
+                )
+                runs.append((result, summary_metrics, timing))
+
+            # cProfile and recording slow pip down, so the profile and the
+            # record are taken from an extra run whose results are
+            # discarded, kept next to the summary
+            profile_json = None
+            if profile or record_resolution:
+                run_dir = Path(temp_dir) / "run-profile"
+                run_dir.mkdir()
+                if cache_mode == COLD_CACHE:
+                    cache_dir = run_dir / "pip-cache"
+                run_profile_path = run_dir / f"pip{PROFILE_SUFFIX}"
+                run_record_path = run_dir / f"pip{RESOLUTION_RECORD_SUFFIX}"
+                label = "(profile)" if profile else "(record)"
+                progress = None
+                if progress_queue is not None:
+                    progress = ProgressTracker(
+                        f"{scenario_label(summary_path)} {label}",
+                        progress_queue.put,
+                    )
+                install_requirements(
+                    venv_python,
+                    datetime,
+                    requirements,
+                    str(run_dir),
+                    max_resolution_rounds,
+                    constraints,
+                    project_name,
+                    project_extras,
+                    optional_dependencies,
+                    None,
+                    index_url,
+                    None,
+                    cache_dir,
+                    budgets,
+                    progress,
+                    reporter,
+                    run_profile_path if profile else None,
+                    run_record_path if record_resolution else None,
+                )
+                if progress_queue is not None:
+                    progress_queue.put(
+                        finished(f"{scenario_label(summary_path)} {label}")
+                    )
+                if profile:
+                    if run_profile_path.exists():
+                        profile_path = summary_path.with_suffix(PROFILE_SUFFIX)
+                        shutil.move(run_profile_path, profile_path)
+                        profile_json = profile_summary(profile_path)
+                    else:
+                        print(f"Warning: pip wrote no profile for {summary_path}")
+                if record_resolution:
+                    if run_record_path.exists():
+                        shutil.move(
+                            run_record_path,
+                            summary_path.with_suffix(RESOLUTION_RECORD_SUFFIX),
+                        )
+                    else:
+                        print(
+                            f"Warning: pip wrote no resolution record for {summary_path}"
+                        )
+
+            result, summary_metrics, timing = runs[0]
+            if primed_marker is not None:
+                primed_marker.parent.mkdir(parents=True, exist_ok=True)
+                primed_marker.touch()
+
+            # Build summary JSON output
+            summary_json = {
+                "input": scenario_input,
+                "result": result,
+                "summary": summary_metrics,
+                "timing": timing,
+                "cache": cache,
+                "sdist_builds": sdist_builds,
+            }
+            if fingerprint is not None:
+                summary_json["fingerprint"] = fingerprint
+            if reporter != TEXT_REPORTER:
+                # pip formats no reprs for it, so timings are not comparable
+                summary_json["reporter"] = reporter
+            if profile_json is not None:
+                summary_json["profile"] = profile_json
+            if repeat > 1:
+                summary_json.update(repeat_summary(runs, warmup))
+                # Medians stand in for the single run timing where sampled
+                summary_json["timing"] = {
+                    key: summary_json["timing_stats"][key]["median"]
+                    if key in summary_json["timing_stats"]
+                    else value
+                    for key, value in timing.items()
+                }
+                nondeterministic = summary_json["repeat"]["nondeterministic"]
+                if nondeterministic:
+                    print(
+                        f"Warning: {', '.join(nondeterministic)} differed across "
+                        f"repeats of {summary_path}"
+                    )
 
-        # Build summary JSON output
-        summary_json = {
-            "input": {
-                "pip_version": pip_name,
-                "python_version": python_version,
-                "datetime": datetime,
-                "platform_system": platform_system,
-                "requirements": requirements,
-                "max_resolution_rounds": max_resolution_rounds,
-                "constraints": constraints,
-                "project_name": project_name,
-                "project_extras": project_extras,
-                "optional_dependencies": optional_dependencies,
-            },
-            "result": {
-                "success": success,
-                "failure_reason": failure_reason,
-            },
-            "summary": summary_metrics,
-        }
+            if trace_writer is not None:
+                trace_writer.write(
+                    {
+                        "result": result,
+                        "summary": summary_metrics,
+                        "timing": timing,
+                        "sdist_builds": sdist_builds,
+                    }
+                )
 
         formatter = Formatter()
         formatter.indent_spaces = 1
@@ -680,26 +2006,150 @@ def process_scenario(
         formatter.json_eol_style = EolStyle.LF
 
         # Always write summary file
-        formatter.dump(summary_json, output_file=str(summary_path), newline_at_eof=True)
+        atomic_dump(formatter, summary_json, summary_path)
+
+        record_result(results_db, summary_path, summary_json)
+        if result_cache_dir is not None and fingerprint is not None:
+            ResultCache(result_cache_dir).store(
+                fingerprint,
+                summary_path.parent.parent.name,
+                summary_path.parent.name,
+                pip_name,
+                summary_path.read_bytes(),
+            )
+        return True
 
-        # Optionally write detailed output file if requested
-        if output_path is not None:
-            output_json = {
-                **summary_json,
-                "resolution_rounds": resolution_lines.resolution_rounds,
-            }
-            formatter.dump(output_json, output_file=str(output_path), newline_at_eof=True)
 
+def runs_satisfy(
+    summary_json: dict[str, Any],
+    repeat: int,
+    cache_mode: str,
+    profile: bool = False,
+    reporter: str = TEXT_REPORTER,
+) -> bool:
+    """
+    Whether summary_json was run at least repeat times with cache_mode and
+    reporter, and profiled if profile is set, summaries from before these
+    options count as one run with the user's cache and the text reporter.
+    """
+    runs = (summary_json.get("repeat") or {}).get("runs", 1)
+    mode = (summary_json.get("cache") or {}).get("mode", USER_CACHE)
+    profiled = not profile or "profile" in summary_json
+    same_reporter = summary_json.get("reporter", TEXT_REPORTER) == reporter
+    return runs >= repeat and mode == cache_mode and profiled and same_reporter
+
+
+def summary_is_current(
+    existing_json: dict[str, Any],
+    expected_input: dict[str, Any],
+    repeat: int,
+    cache_mode: str = USER_CACHE,
+    profile: bool = False,
+    reporter: str = TEXT_REPORTER,
+) -> bool:
+    existing_input = existing_json["input"]
+    # Treat missing keys in existing input as None
+    # so old summaries without new fields still match
+    normalized = {k: existing_input.get(k) for k in expected_input}
+    return normalized == expected_input and runs_satisfy(
+        existing_json, repeat, cache_mode, profile, reporter
+    )
+
+
+def names_exact_build(pip_name: str, pip_requirement: str) -> bool:
+    """
+    Whether pip_name alone pins the pip that pip_requirement installs, a
+    release or a full commit, unlike a branch or tag that can move.
+    """
+    if pip_requirement == f"pip=={pip_name}":
+        return True
+    _, _, ref = pip_name.rpartition("@")
+    return bool(GIT_COMMIT_RE.fullmatch(ref)) and pip_requirement.endswith(f"@{ref}")
 
-def process_toml_file(
-    toml_file: Path, pip_name: str, pip_requirement: str, include_output: bool = False
-) -> None:
+
+def restore_cached_summary(
+    cache: ResultCache,
+    fingerprint: dict[str, Any],
+    summary_path: Path,
+    existing_json: dict[str, Any] | None,
+    expected_input: dict[str, Any],
+    repeat: int,
+    cache_mode: str = USER_CACHE,
+    results_db: Path | None = None,
+    profile: bool = False,
+    reporter: str = TEXT_REPORTER,
+    adopt_legacy: bool = True,
+) -> bool:
+    """
+    Bring summary_path up to date from the result cache, returning whether
+    the scenario can be skipped. With adopt_legacy a summary from before
+    fingerprints that matches expected_input is adopted into the cache the
+    first time it is seen, but not again once invalidated.
+    """
+    toml_name = summary_path.parent.parent.name
+    scenario_name = summary_path.parent.name
+    cached = cache.lookup(fingerprint["key"])
+    if cached is not None:
+        cached_json = json.loads(cached)
+        if not runs_satisfy(cached_json, repeat, cache_mode, profile, reporter):
+            return False
+        if cached_json != existing_json:
+            temp_path = summary_path.with_name(f".{summary_path.name}.{os.getpid()}.tmp")
+            try:
+                temp_path.write_bytes(cached)
+                os.replace(temp_path, summary_path)
+            finally:
+                temp_path.unlink(missing_ok=True)
+            record_result(results_db, summary_path, cached_json)
+        return True
+
+    if (
+        adopt_legacy
+        and existing_json is not None
+        and "fingerprint" not in existing_json
+        and summary_is_current(
+            existing_json, expected_input, repeat, cache_mode, profile, reporter
+        )
+        and not cache.is_known(fingerprint["key"])
+    ):
+        cache.store(
+            fingerprint,
+            toml_name,
+            scenario_name,
+            existing_json["input"]["pip_version"],
+            summary_path.read_bytes(),
+        )
+        return True
+    return False
+
+
+def pending_scenarios(
+    toml_file: Path,
+    pip_name: str,
+    pip_requirement: str,
+    include_output: bool = False,
+    include_logs: bool = False,
+    run_options: dict[str, Any] | None = None,
+    output_codec: str = "none",
+) -> list[dict[str, Any]]:
+    """
+    Return the process_scenario keyword arguments for every scenario in
+    toml_file that runs on this platform and has no up to date summary,
+    run_options are passed through to process_scenario unchanged.
+    """
+    run_options = run_options or {}
+    repeat = run_options.get("repeat", 1)
+    cache_mode = run_options.get("cache_mode", USER_CACHE)
+    profile = run_options.get("profile", False)
+    reporter = run_options.get("reporter", TEXT_REPORTER)
+    record_resolution = run_options.get("record_resolution", False)
+    result_cache_dir = run_options.get("result_cache_dir")
     local_platform_system = platform.system()
 
     print(f"Running scenarios for system platform: {local_platform_system}")
-    with open(toml_file, "rb") as f:
-        scenarios = tomllib.load(f)
+    scenarios = load_scenarios(toml_file)
 
+    pending: list[dict[str, Any]] = []
     for scenario_name, scenario in scenarios.items():
         python_version: str = scenario["python_version"]
         platform_system: str = scenario["platform_system"]
@@ -712,6 +2162,8 @@ def process_toml_file(
         optional_dependencies: dict[str, list[str]] | None = scenario.get(
             "optional_dependencies"
         )
+        budgets: dict[str, Any] | None = scenario["budgets"]
+        local_index: str | None = scenario.get("local_index")
 
         if platform_system != local_platform_system:
             continue
@@ -728,8 +2180,11 @@ def process_toml_file(
                 Path("output")
                 / Path(toml_file.name).stem
                 / scenario_name
-                / f"{pip_name}.json"
+                / f"{pip_name}{TRACE_SUFFIXES[output_codec]}"
             )
+        log_dir = None
+        if include_logs:
+            log_dir = Path("logs") / Path(toml_file.name).stem / scenario_name / pip_name
 
         expected_input = {
             "pip_version": pip_name,
@@ -742,84 +2197,498 @@ def process_toml_file(
             "project_name": project_name,
             "project_extras": project_extras,
             "optional_dependencies": optional_dependencies,
+            "budgets": budgets,
+            "local_index": local_index,
         }
 
+        existing_json = None
         if summary_path.exists():
             try:
                 existing_json = json.load(summary_path.open())
             except json.JSONDecodeError:
+                # Left over from an older, non-atomic run
                 os.remove(summary_path)
-                summary_path.touch()
-            else:
-                existing_input = existing_json["input"]
-                # Treat missing keys in existing input as None
-                # so old summaries without new fields still match
-                normalized = {k: existing_input.get(k) for k in expected_input}
-                if normalized == expected_input:
-                    continue
         else:
             summary_path.parent.mkdir(exist_ok=True, parents=True)
-            summary_path.touch()
+
+        # With the result cache a scenario is only skipped when the exact
+        # same input, pip build and harness version produced a result
+        fingerprint = None
+        if result_cache_dir is not None:
+            pip_sha256 = resolve_pip_sha256(
+                python_version,
+                pip_requirement,
+                run_options.get("venv_pool_dir"),
+                run_options.get("venv_pool_size", VENV_POOL_SIZE),
+            )
+            if pip_sha256 is not None:
+                fingerprint = scenario_fingerprint(
+                    expected_input,
+                    pip_sha256,
+                    HARNESS_VERSION,
+                    None if reporter == TEXT_REPORTER else reporter,
+                )
+
+        # A record is only taken by running the scenario
+        record_missing = (
+            record_resolution
+            and not summary_path.with_suffix(RESOLUTION_RECORD_SUFFIX).exists()
+        )
+        if not record_missing and fingerprint is not None:
+            if restore_cached_summary(
+                ResultCache(result_cache_dir),
+                fingerprint,
+                summary_path,
+                existing_json,
+                expected_input,
+                repeat,
+                cache_mode,
+                run_options.get("results_db"),
+                profile,
+                reporter,
+                # Nothing shows which commit a branch's summary was run at
+                names_exact_build(pip_name, pip_requirement),
+            ):
+                continue
+        elif (
+            not record_missing
+            and existing_json is not None
+            and summary_is_current(
+                existing_json, expected_input, repeat, cache_mode, profile, reporter
+            )
+        ):
+            continue
 
         if output_path is not None:
             output_path.parent.mkdir(exist_ok=True, parents=True)
 
+        pending.append(
+            {
+                "scenario_name": scenario_name,
+                "pip_name": pip_name,
+                "pip_requirement": pip_requirement,
+                "datetime": datetime,
+                "python_version": python_version,
+                "platform_system": platform_system,
+                "requirements": requirements,
+                "summary_path": summary_path,
+                "output_path": output_path,
+                "max_resolution_rounds": max_resolution_rounds,
+                "constraints": constraints,
+                "project_name": project_name,
+                "project_extras": project_extras,
+                "optional_dependencies": optional_dependencies,
+                "budgets": budgets,
+                "local_index": local_index,
+                "local_index_dir": (
+                    toml_file.parent / local_index if local_index else None
+                ),
+                "log_dir": log_dir,
+                "output_codec": output_codec,
+                "fingerprint": fingerprint,
+                **run_options,
+            }
+        )
+
+    return pending
+
+
+def scenario_label(summary_path: Path) -> str:
+    return f"{summary_path.parent.parent.name}/{summary_path.parent.name}"
+
+
+def run_scenario(scenario_name: str, progress_queue: Any = None, **kwargs: Any) -> str:
+    """
+    Run a single pending scenario, used directly and as the worker
+    function of the --jobs process pool. Its progress is published to
+    progress_queue when given, e.g. a ProgressView's queue. Raises
+    RuntimeError when no summary was written, as pip could not be set up.
+    """
+    try:
+        if not process_scenario(**kwargs, progress_queue=progress_queue):
+            raise RuntimeError(
+                f"Could not set up pip {kwargs['pip_requirement']} for {scenario_name}"
+            )
+    finally:
+        if progress_queue is not None:
+            progress_queue.put(finished(scenario_label(kwargs["summary_path"])))
+    return scenario_name
+
+
+def describe_scenario(kwargs: dict[str, Any]) -> str:
+    return (
+        f"{kwargs['scenario_name']!r}: (Pip Version: {kwargs['pip_name']}, "
+        f"Python: {kwargs['python_version']}, Date: {kwargs['datetime']})"
+    )
+
+
+def report_scenario(kwargs: dict[str, Any], outcome: Callable[[], Any]) -> None:
+    """
+    Call outcome, which runs the scenario of kwargs or waits for it, and
+    report whether it finished. A scenario failing with one of
+    SCENARIO_ERRORS is reported with its traceback and the sweep carries on.
+    """
+    try:
+        outcome()
+    except SCENARIO_ERRORS as e:
+        # A worker's traceback comes along with the exception
         print(
-            f"Processing {scenario_name!r}: (Pip Version: {pip_name}, Python: {python_version}, Date: {datetime})"
+            f"Error processing {describe_scenario(kwargs)}:\n"
+            + "".join(traceback.format_exception(e))
         )
-        process_scenario(
-            pip_name=pip_name,
-            pip_requirement=pip_requirement,
-            datetime=datetime,
-            python_version=python_version,
-            platform_system=platform_system,
-            requirements=requirements,
-            summary_path=summary_path,
-            output_path=output_path,
-            max_resolution_rounds=max_resolution_rounds,
-            constraints=constraints,
-            project_name=project_name,
-            project_extras=project_extras,
-            optional_dependencies=optional_dependencies,
+    else:
+        print(f"Finished {describe_scenario(kwargs)}")
+
+
+def process_toml_file(
+    toml_file: Path,
+    pip_name: str,
+    pip_requirement: str,
+    include_output: bool = False,
+    include_logs: bool = False,
+    run_options: dict[str, Any] | None = None,
+    output_codec: str = "none",
+    progress_queue: Any = None,
+) -> None:
+    for kwargs in pending_scenarios(
+        toml_file,
+        pip_name,
+        pip_requirement,
+        include_output,
+        include_logs,
+        run_options,
+        output_codec,
+    ):
+        print(f"Processing {describe_scenario(kwargs)}")
+        report_scenario(
+            kwargs,
+            functools.partial(run_scenario, **kwargs, progress_queue=progress_queue),
+        )
+
+
+def run_parallel(
+    pending: list[dict[str, Any]], jobs: int, progress_queue: Any = None
+) -> None:
+    """
+    Run pending scenarios across a pool of worker processes, each scenario
+    still gets its own temporary directory and virtual environment.
+    """
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=WORKER_CONTEXT) as executor:
+        futures = {}
+        for kwargs in pending:
+            print(f"Queued {describe_scenario(kwargs)}")
+            future = executor.submit(
+                run_scenario, **kwargs, progress_queue=progress_queue
+            )
+            futures[future] = kwargs
+
+        try:
+            for future in as_completed(futures):
+                report_scenario(futures[future], future.result)
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+
+def run_queued_scenario(kwargs: dict[str, Any]) -> Path:
+    # Only the coordinator's pending_scenarios created these
+    for path in (kwargs["summary_path"], kwargs["output_path"]):
+        if path is not None:
+            path.parent.mkdir(exist_ok=True, parents=True)
+    print(f"Processing {describe_scenario(kwargs)}")
+    # Raises rather than leave an older summary to be reported as this run's
+    run_scenario(**kwargs)
+    return kwargs["summary_path"]
+
+
+def work_from_queue(url: str) -> int:
+    """
+    Run scenarios handed out by a --coordinator until it has none left,
+    used directly and as the worker function of the --jobs process pool.
+    """
+    return run_worker(url, run_queued_scenario, SCENARIO_ERRORS)
+
+
+def store_reported_result(
+    kwargs: dict[str, Any], summary: str | None, error: str | None
+) -> None:
+    """
+    Write the summary a worker reported back for a scenario into
+    summaries/ and the results database, as if it had run here.
+    """
+    if summary is None:
+        print(f"Error processing {describe_scenario(kwargs)}:\n{error}")
+        return
+    summary_path: Path = kwargs["summary_path"]
+    summary_path.parent.mkdir(exist_ok=True, parents=True)
+    temp_path = summary_path.with_name(f".{summary_path.name}.{os.getpid()}.tmp")
+    try:
+        temp_path.write_text(summary)
+        os.replace(temp_path, summary_path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+    record_result(kwargs.get("results_db"), summary_path, json.loads(summary))
+    print(f"Finished {describe_scenario(kwargs)}")
+
+
+def run_workers(url: str, jobs: int) -> None:
+    if jobs == 1:
+        work_from_queue(url)
+        return
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=WORKER_CONTEXT) as executor:
+        for future in as_completed([executor.submit(work_from_queue, url)] * jobs):
+            future.result()
+
+
+def resolve_git_commit(github_repo: str, git_ref: str) -> str:
+    """
+    Resolve a branch or tag of github_repo to the commit it points at,
+    anything else, e.g. an abbreviated commit, is returned unchanged.
+    """
+    if GIT_COMMIT_RE.fullmatch(git_ref):
+        return git_ref
+
+    result = subprocess.run(
+        ["git", "ls-remote", f"https://github.com/{github_repo}.git", git_ref],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"Could not resolve {git_ref} in {github_repo}: {result.stderr}"
         )
 
+    refs = {}
+    for line in result.stdout.splitlines():
+        commit, ref = line.split("\t", 1)
+        refs[ref] = commit
+    # Prefer the commit an annotated tag points at over the tag object
+    for ref in (
+        f"refs/tags/{git_ref}^{{}}",
+        f"refs/heads/{git_ref}",
+        f"refs/tags/{git_ref}",
+        git_ref,
+    ):
+        if ref in refs:
+            return refs[ref]
+    return git_ref
+
 
 def main(
     pip_version: str | None = None,
     github_repo: str | None = None,
     git_commit: str | None = None,
     include_output: bool = False,
+    include_logs: bool = False,
+    jobs: int = 1,
+    venv_pool: bool = True,
+    venv_pool_size: int = VENV_POOL_SIZE,
+    index_snapshot: Path | None = None,
+    index_mode: str = RECORD,
+    output_codec: str = "none",
+    results_db: bool = True,
+    repeat: int = 1,
+    warmup: int = 0,
+    result_cache: bool = True,
+    cache_mode: str = USER_CACHE,
+    scenarios_dir: Path = Path(SCENARIOS_DIR),
+    shard: str | None = None,
+    coordinator: str | None = None,
+    worker: str | None = None,
+    progress: bool = True,
+    reporter: str = TEXT_REPORTER,
+    profile: bool = False,
+    record_resolution: bool = False,
 ) -> None:
     """
-    Pass in either a pip version or a github branch and git commit
+    Pass in either a pip version or a github branch and git commit,
+    use --jobs to run scenarios in parallel worker processes and
+    --include-logs to keep pip's raw stdout and stderr under logs/.
+    --include-output streams each resolution trace to output/ as JSON Lines,
+    compressed with --output-codec gzip or zstd, or in the binary format
+    with interned strings of --output-codec compact.
+
+    With --index-snapshot pip uses a local index backed by that directory,
+    --index-mode record fetches and stores anything missing from PyPI and
+    --index-mode replay only serves what was recorded.
+
+    Every result is also upserted into results.db unless --no-results-db
+    is given, results_db.py backfills it from existing summaries.
+
+    --repeat N runs each scenario N times after --warmup K discarded runs
+    and records every timing sample with its median, MAD and confidence
+    interval, and which deterministic metrics differed between runs.
+
+    A scenario is skipped when the result cache already holds a result for
+    the same input, pip build and harness version, use --no-result-cache to
+    only compare the summary's input instead. result_cache.py invalidates
+    and garbage collects cached results.
+
+    --cache-mode cold gives every pip run a new empty cache, warm a cache
+    per scenario primed by an extra run and shared one cache for every
+    scenario, all under .pip-cache/. The default, user, leaves pip's cache
+    configuration alone.
+
+    --scenarios-dir runs the TOML files of another directory, e.g. the
+    synthetic scenarios written by synthetic.py.
+
+    Pending scenarios are run longest first by their past wall time or
+    rounds in summaries/. --shard i/n only runs the i-th of n shards
+    balanced by that cost, e.g. for a CI matrix. --coordinator HOST:PORT
+    hands the pending scenarios out to workers started with
+    --worker http://HOST:PORT, with --jobs worker processes, on any host
+    with the same checkout, and writes their results to summaries/.
+
+    While scenarios run their current round, rounds per second, wheels and
+    sdists visited and last pinned file are shown live, or logged every
+    30 seconds when stdout is not a terminal, with a warning when a
+    scenario's throughput collapses. --no-progress turns this off.
+
+    --reporter shim runs pip through reporter_shim.py, which reports the
+    resolver's events as JSON instead of the debug reprs parsed by default.
+
+    --profile runs each scenario once more under cProfile, keeps the stats
+    next to its summary as .pstats and lists the top functions by
+    cumulative and self time in the summary, profile_diff.py compares two.
+
+    --record-resolution runs each scenario once more recording every answer
+    of pip's resolver provider next to its summary as .replay.json.gz,
+    replay.py re-resolves it offline in seconds.
     """
+    if worker is not None:
+        if jobs < 1:
+            raise RuntimeError("--jobs must be at least 1")
+        run_workers(worker, jobs)
+        return
+
     pip_requirement = None
     if pip_version:
         pip_name = pip_version
         pip_requirement = f"pip=={pip_version}"
     elif github_repo and git_commit:
         pip_name = f"{github_repo.replace('/', '#')}@{git_commit}"
-        pip_requirement = f"pip @ git+https://github.com/{github_repo}.git@{git_commit}"
+        # Pin branches and tags to their commit so a moved ref is a new pip
+        resolved_commit = resolve_git_commit(github_repo, git_commit)
+        pip_requirement = (
+            f"pip @ git+https://github.com/{github_repo}.git@{resolved_commit}"
+        )
     else:
         raise RuntimeError(
             "Provide either a pip version or a github branch and git commit"
         )
 
-    scenarios_path = Path(SCENARIOS_DIR)
+    if jobs < 1:
+        raise RuntimeError("--jobs must be at least 1")
+
+    if repeat < 1 or warmup < 0:
+        raise RuntimeError("--repeat must be at least 1 and --warmup at least 0")
+
+    if output_codec not in TRACE_CODECS:
+        raise RuntimeError(f"--output-codec must be one of: {', '.join(TRACE_CODECS)}")
+
+    if index_mode not in INDEX_MODES:
+        raise RuntimeError(f"--index-mode must be one of: {', '.join(INDEX_MODES)}")
+
+    if cache_mode not in CACHE_MODES:
+        raise RuntimeError(f"--cache-mode must be one of: {', '.join(CACHE_MODES)}")
+
+    if reporter not in REPORTERS:
+        raise RuntimeError(f"--reporter must be one of: {', '.join(REPORTERS)}")
+
+    shard_index = shard_count = None
+    if shard is not None:
+        shard_index, shard_count = parse_shard(shard)
+
+    run_options: dict[str, Any] = {}
+    if index_snapshot is not None:
+        run_options["index_snapshot_dir"] = index_snapshot
+        run_options["index_snapshot_mode"] = index_mode
+    if venv_pool:
+        run_options["venv_pool_dir"] = Path(VENV_POOL_DIR)
+        run_options["venv_pool_size"] = venv_pool_size
+    if results_db:
+        run_options["results_db"] = Path(RESULTS_DB)
+    if repeat > 1 or warmup:
+        run_options["repeat"] = repeat
+        run_options["warmup"] = warmup
+    if result_cache:
+        run_options["result_cache_dir"] = Path(RESULT_CACHE_DIR)
+    if cache_mode != USER_CACHE:
+        run_options["cache_mode"] = cache_mode
+    if reporter != TEXT_REPORTER:
+        run_options["reporter"] = reporter
+    if profile:
+        run_options["profile"] = True
+    if record_resolution:
+        run_options["record_resolution"] = True
+
+    scenarios_path = scenarios_dir
     if not scenarios_path.exists() or not scenarios_path.is_dir():
-        print(f"Error: The directory '{SCENARIOS_DIR}' does not exist")
+        print(f"Error: The directory '{scenarios_dir}' does not exist")
         return
 
     # Loop through each TOML file in the scenarios directory
+    if jobs == 1 and shard is None and coordinator is None:
+        with ExitStack() as stack:
+            progress_queue = None
+            if progress:
+                progress_queue = stack.enter_context(ProgressView()).queue
+            for toml_file in scenarios_path.glob("*.toml"):
+                print(f"\n--- Processing file: {toml_file.name[:-5]} ---")
+                process_toml_file(
+                    toml_file=toml_file,
+                    pip_name=pip_name,
+                    pip_requirement=pip_requirement,
+                    include_output=include_output,
+                    include_logs=include_logs,
+                    run_options=run_options,
+                    output_codec=output_codec,
+                    progress_queue=progress_queue,
+                )
+        return
+
+    pending: list[dict[str, Any]] = []
     for toml_file in scenarios_path.glob("*.toml"):
-        print(f"\n--- Processing file: {toml_file.name[:-5]} ---")
-        process_toml_file(
-            toml_file=toml_file,
-            pip_name=pip_name,
-            pip_requirement=pip_requirement,
-            include_output=include_output,
+        print(f"\n--- Collecting file: {toml_file.name[:-5]} ---")
+        pending.extend(
+            pending_scenarios(
+                toml_file=toml_file,
+                pip_name=pip_name,
+                pip_requirement=pip_requirement,
+                include_output=include_output,
+                include_logs=include_logs,
+                run_options=run_options,
+                output_codec=output_codec,
+            )
         )
 
+    costs = historical_costs(Path("summaries"), pip_name)
+    if shard_index is not None and shard_count is not None:
+        pending = shard_pending(pending, costs, shard_index, shard_count)
+    else:
+        pending = [kwargs for _, kwargs in longest_first(pending, costs)]
+
+    if coordinator is not None:
+        serve_work_queue(coordinator, pending, store_reported_result)
+        return
+
+    with ExitStack() as stack:
+        progress_queue = None
+        if progress:
+            progress_queue = stack.enter_context(ProgressView(shared=jobs > 1)).queue
+        if jobs == 1:
+            for kwargs in pending:
+                print(f"Processing {describe_scenario(kwargs)}")
+                report_scenario(
+                    kwargs,
+                    functools.partial(
+                        run_scenario, **kwargs, progress_queue=progress_queue
+                    ),
+                )
+        else:
+            run_parallel(pending, jobs, progress_queue)
+
 
 if __name__ == "__main__":
     typer.run(main)
@@ -0,0 +1,108 @@
+import math
+import random
+from collections import Counter
+from collections.abc import Sequence
+from functools import cache
+from statistics import median
+
+BOOTSTRAP_RESAMPLES = 10_000
+# Largest sample sizes for which Mann-Whitney U uses the exact distribution
+EXACT_MANN_WHITNEY_SIZE = 20
+
+
+def median_absolute_deviation(values: Sequence[float]) -> float:
+    center = median(values)
+    return median([abs(value - center) for value in values])
+
+
+def bootstrap_ci(
+    values: Sequence[float],
+    confidence: float = 0.95,
+    resamples: int = BOOTSTRAP_RESAMPLES,
+    seed: int = 0,
+) -> tuple[float, float]:
+    """
+    Percentile bootstrap confidence interval of the median, seeded so the
+    same samples always give the same interval.
+    """
+    rng = random.Random(seed)
+    size = len(values)
+    medians = sorted(median(rng.choices(values, k=size)) for _ in range(resamples))
+    tail = (1 - confidence) / 2
+    low = medians[int(tail * (resamples - 1))]
+    high = medians[math.ceil((1 - tail) * (resamples - 1))]
+    return low, high
+
+
+def sample_stats(values: Sequence[float]) -> dict[str, float]:
+    ci_low, ci_high = bootstrap_ci(values)
+    return {
+        "median": median(values),
+        "mad": median_absolute_deviation(values),
+        "ci_low": ci_low,
+        "ci_high": ci_high,
+    }
+
+
+@cache
+def _u_counts(size_1: int, size_2: int) -> tuple[int, ...]:
+    """
+    Number of orderings of the two samples giving each value of U when
+    there are no ties, counts[u] for u in 0..size_1 * size_2.
+    """
+    if size_1 == 0 or size_2 == 0:
+        return (1,)
+    # The largest value either ends with a value from sample 1, which is
+    # above all of sample 2 and adds size_2 to U, or with one from sample 2
+    counts = [0] * (size_1 * size_2 + 1)
+    for u, count in enumerate(_u_counts(size_1 - 1, size_2)):
+        counts[u + size_2] += count
+    for u, count in enumerate(_u_counts(size_1, size_2 - 1)):
+        counts[u] += count
+    return tuple(counts)
+
+
+def mann_whitney_u(sample_1: Sequence[float], sample_2: Sequence[float]) -> float:
+    """
+    Two sided p-value of the Mann-Whitney U test that the two samples come
+    from the same distribution. Uses the exact distribution for small
+    samples without ties and the tie corrected normal approximation
+    otherwise.
+    """
+    size_1 = len(sample_1)
+    size_2 = len(sample_2)
+    if not size_1 or not size_2:
+        raise ValueError("Mann-Whitney U needs two non-empty samples")
+
+    # Midranks, so tied values share the average of their ranks
+    combined = sorted([*sample_1, *sample_2])
+    ties = Counter(combined)
+    ranks: dict[float, float] = {}
+    position = 0
+    for value in sorted(ties):
+        count = ties[value]
+        ranks[value] = position + (count + 1) / 2
+        position += count
+    u_1 = sum(ranks[value] for value in sample_1) - size_1 * (size_1 + 1) / 2
+
+    has_ties = len(ties) < len(combined)
+    if (
+        not has_ties
+        and size_1 <= EXACT_MANN_WHITNEY_SIZE
+        and size_2 <= EXACT_MANN_WHITNEY_SIZE
+    ):
+        counts = _u_counts(size_1, size_2)
+        total = sum(counts)
+        u = int(u_1)
+        lower = sum(counts[: u + 1]) / total
+        upper = sum(counts[u:]) / total
+        return min(1.0, 2 * min(lower, upper))
+
+    size = size_1 + size_2
+    mean = size_1 * size_2 / 2
+    tie_term = sum(count**3 - count for count in ties.values()) / (size * (size - 1))
+    variance = size_1 * size_2 / 12 * ((size + 1) - tie_term)
+    if variance <= 0:
+        return 1.0
+    z = max(abs(u_1 - mean) - 0.5, 0) / math.sqrt(variance)
+    return math.erfc(z / math.sqrt(2))
@@ -0,0 +1,320 @@
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#   "typer",
+# ]
+# ///
+
+import base64
+import hashlib
+import html
+import io
+import itertools
+import json
+import platform
+import random
+import shutil
+import zipfile
+from pathlib import Path
+from typing import Any
+
+import typer
+
+from budgets import load_scenarios
+from compare import load_toml_summaries, print_table
+from results_db import connect
+
+SYNTHETIC_DIR = "synthetic"
+SYNTHETIC_DATETIME = "2025-01-01 00:00:00"
+# Fixed so the same parameters always give byte for byte identical wheels
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+# Parameters generate can sweep, in the order scenarios are sorted by
+SWEPT_PARAMETERS = ("packages", "versions", "fan_out", "conflict_density", "traps")
+
+app = typer.Typer()
+
+
+def project_name(index: int, width: int) -> str:
+    return f"syn-p{index:0{width}d}"
+
+
+def trap_name(trap: int, level: int | str) -> str:
+    return f"syn-trap{trap}-{level}"
+
+
+def generate_ecosystem(
+    packages: int,
+    versions: int,
+    fan_out: int,
+    conflict_density: float,
+    traps: int,
+    trap_depth: int,
+    roots: int,
+    seed: int,
+) -> tuple[dict[str, dict[str, list[str]]], list[str]]:
+    """
+    Generate {project: {version: [requirement, ...]}} and the top level
+    requirements. Projects only depend on projects after them, so there are
+    no cycles, and every 1.0 only has >=1.0 requirements, so there always
+    is a solution. Newer versions constrain their dependencies with a lower
+    bound, or with probability conflict_density an upper bound, which
+    conflict with each other and force backtracking.
+
+    Each trap is a chain of trap_depth projects the newest version of a
+    top level project depends on, whose last link requires a version of a
+    sink project that does not exist, so the whole chain is backtracked.
+    """
+    if packages < 1 or versions < 1 or roots < 1 or roots > packages:
+        raise RuntimeError("Need at least 1 package and version, and 1 to N roots")
+    if not 0 <= conflict_density <= 1:
+        raise RuntimeError("--conflict-density must be between 0 and 1")
+    if traps and trap_depth < 1:
+        raise RuntimeError("--trap-depth must be at least 1 with traps")
+
+    rng = random.Random(
+        f"{seed}-{packages}-{versions}-{fan_out}-{conflict_density}-{traps}-{trap_depth}"
+    )
+    width = len(str(packages - 1))
+    ecosystem: dict[str, dict[str, list[str]]] = {}
+    for index in range(packages):
+        name = project_name(index, width)
+        ecosystem[name] = {}
+        later = range(index + 1, packages)
+        for version in range(1, versions + 1):
+            requirements = []
+            for dependency in sorted(rng.sample(later, min(fan_out, len(later)))):
+                dependency_name = project_name(dependency, width)
+                if version == 1:
+                    bound = ">=1.0"
+                elif rng.random() < conflict_density:
+                    bound = f"<{rng.randint(2, versions)}.0"
+                else:
+                    bound = f">={rng.randint(1, versions)}.0"
+                requirements.append(f"{dependency_name}{bound}")
+            ecosystem[name][f"{version}.0"] = requirements
+
+    for trap in range(traps):
+        root = project_name(trap % roots, width)
+        ecosystem[root][f"{versions}.0"].append(f"{trap_name(trap, 0)}>=1.0")
+        for level in range(trap_depth):
+            if level + 1 < trap_depth:
+                requirement = f"{trap_name(trap, level + 1)}>=1.0"
+            else:
+                requirement = f"{trap_name(trap, 'sink')}<1.0"
+            ecosystem[trap_name(trap, level)] = {
+                f"{version}.0": [requirement] for version in range(1, versions + 1)
+            }
+        ecosystem[trap_name(trap, "sink")] = {"1.0": []}
+
+    return ecosystem, [project_name(index, width) for index in range(roots)]
+
+
+def record_hash(content: bytes) -> str:
+    digest = hashlib.sha256(content).digest()
+    return "sha256=" + base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def build_wheel(
+    name: str, version: str, requirements: list[str]
+) -> tuple[str, bytes, bytes]:
+    """
+    Build a pure Python wheel with no code, only metadata. Returns its
+    filename, its content and its METADATA file for PEP 658.
+    """
+    distribution = name.replace("-", "_")
+    dist_info = f"{distribution}-{version}.dist-info"
+    metadata = "".join(
+        [
+            "Metadata-Version: 2.1\n",
+            f"Name: {name}\n",
+            f"Version: {version}\n",
+            *(f"Requires-Dist: {requirement}\n" for requirement in requirements),
+        ]
+    ).encode()
+    files = {
+        f"{dist_info}/METADATA": metadata,
+        f"{dist_info}/WHEEL": (
+            b"Wheel-Version: 1.0\nGenerator: synthetic.py\n"
+            b"Root-Is-Purelib: true\nTag: py3-none-any\n"
+        ),
+    }
+    record = "".join(
+        f"{path},{record_hash(content)},{len(content)}\n"
+        for path, content in files.items()
+    )
+    files[f"{dist_info}/RECORD"] = (record + f"{dist_info}/RECORD,,\n").encode()
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as wheel:
+        for path, content in files.items():
+            info = zipfile.ZipInfo(path, ZIP_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            wheel.writestr(info, content)
+    return f"{distribution}-{version}-py3-none-any.whl", buffer.getvalue(), metadata
+
+
+def write_index(ecosystem: dict[str, dict[str, list[str]]], index_dir: Path) -> None:
+    """
+    Write every project's wheels to index_dir/files and a PEP 503 simple
+    index with PEP 658 metadata files to index_dir/simple.
+    """
+    shutil.rmtree(index_dir, ignore_errors=True)
+    files_dir = index_dir / "files"
+    simple_dir = index_dir / "simple"
+    files_dir.mkdir(parents=True)
+
+    project_links = []
+    for name, project_versions in sorted(ecosystem.items()):
+        anchors = []
+        for version, requirements in project_versions.items():
+            filename, content, metadata = build_wheel(name, version, requirements)
+            (files_dir / filename).write_bytes(content)
+            (files_dir / f"{filename}.metadata").write_bytes(metadata)
+            metadata_hash = f"sha256={hashlib.sha256(metadata).hexdigest()}"
+            anchors.append(
+                f'<a href="../../files/{filename}#sha256='
+                f'{hashlib.sha256(content).hexdigest()}" '
+                f'data-dist-info-metadata="{metadata_hash}" '
+                f'data-core-metadata="{metadata_hash}">{filename}</a><br>'
+            )
+        project_dir = simple_dir / name
+        project_dir.mkdir(parents=True)
+        (project_dir / "index.html").write_text(
+            "<!DOCTYPE html>\n<html><body>\n" + "\n".join(anchors) + "\n</body></html>\n"
+        )
+        project_links.append(f'<a href="{name}/">{html.escape(name)}</a><br>')
+
+    (simple_dir / "index.html").write_text(
+        "<!DOCTYPE html>\n<html><body>\n"
+        + "\n".join(project_links)
+        + "\n</body></html>\n"
+    )
+
+
+def scenario_name(parameters: dict[str, Any]) -> str:
+    return (
+        "n{packages}-v{versions}-f{fan_out}-c{conflict_density}"
+        "-t{traps}x{trap_depth}-r{roots}-s{seed}"
+    ).format(**parameters)
+
+
+def toml_value(value: Any) -> str:
+    # JSON strings, numbers and lists of strings are valid TOML
+    return json.dumps(value)
+
+
+@app.command()
+def generate(
+    name: str = "synthetic",
+    packages: list[int] | None = None,
+    versions: list[int] | None = None,
+    fan_out: list[int] | None = None,
+    conflict_density: list[float] | None = None,
+    traps: list[int] | None = None,
+    trap_depth: int = 3,
+    roots: int = 1,
+    seed: int = 0,
+    python_version: str = "3.12",
+    platform_system: str = platform.system(),
+    output_dir: Path = Path(SYNTHETIC_DIR),
+) -> None:
+    """
+    Generate one synthetic ecosystem per combination of the given
+    parameters, each repeatable to sweep it, e.g. --packages 100
+    --packages 1000, by default 50 packages of 5 versions, a fan out of 3,
+    a conflict density of 0.1 and no traps. Each is written as wheels and
+    a local PEP 503/658 index under OUTPUT_DIR/NAME/, with a scenario using
+    it in OUTPUT_DIR/NAME.toml, run them with
+    scenarios.py --scenarios-dir OUTPUT_DIR
+    """
+    sweeps = (
+        packages or [50],
+        versions or [5],
+        fan_out or [3],
+        conflict_density or [0.1],
+        traps or [0],
+    )
+    toml_lines = [
+        "# Generated by synthetic.py, every scenario resolves against its own",
+        "# local index so it runs offline",
+    ]
+    for values in itertools.product(*sweeps):
+        parameters = dict(
+            zip(SWEPT_PARAMETERS, values),
+            trap_depth=trap_depth,
+            roots=roots,
+            seed=seed,
+        )
+        ecosystem, requirements = generate_ecosystem(**parameters)
+        scenario = scenario_name(parameters)
+        write_index(ecosystem, output_dir / name / scenario)
+        distributions = sum(len(v) for v in ecosystem.values())
+        print(f"Wrote {scenario}: {len(ecosystem)} projects, {distributions} wheels")
+
+        toml_lines.extend(
+            [
+                "",
+                f"[{toml_value(scenario)}]",
+                f"python_version = {toml_value(python_version)}",
+                f"platform_system = {toml_value(platform_system)}",
+                f"datetime = {toml_value(SYNTHETIC_DATETIME)}",
+                f"requirements = {toml_value(requirements)}",
+                f"local_index = {toml_value(f'{name}/{scenario}/simple')}",
+                "synthetic = { "
+                + ", ".join(f"{k} = {toml_value(v)}" for k, v in parameters.items())
+                + " }",
+            ]
+        )
+
+    toml_file = output_dir / f"{name}.toml"
+    toml_file.write_text("\n".join(toml_lines) + "\n")
+    print(f"Wrote {toml_file}")
+
+
+@app.command()
+def curve(
+    pip_name: list[str],
+    name: str = "synthetic",
+    output_dir: Path = Path(SYNTHETIC_DIR),
+    results_db: Path | None = None,
+) -> None:
+    """
+    Print the rounds and wall time of each generated scenario against its
+    parameters for every PIP_NAME, as used in summaries/, to see how the
+    resolver scales.
+    """
+    conn = connect(results_db) if results_db is not None else None
+    toml_file = output_dir / f"{name}.toml"
+    summaries = load_toml_summaries(toml_file, pip_name, conn)
+
+    parameters = {
+        scenario: values["synthetic"]
+        for scenario, values in load_scenarios(toml_file).items()
+    }
+
+    header = [*SWEPT_PARAMETERS]
+    for pip in pip_name:
+        header.extend([f"{pip} rounds", f"{pip} wall"])
+    rows = []
+    for scenario, values in sorted(
+        parameters.items(), key=lambda item: [item[1][k] for k in SWEPT_PARAMETERS]
+    ):
+        row = [str(values[k]) for k in SWEPT_PARAMETERS]
+        for pip in pip_name:
+            summary_json = summaries.get(scenario, {}).get(pip)
+            if summary_json is None:
+                row.extend(["-", "-"])
+                continue
+            rounds = str(summary_json["summary"]["total_rounds"])
+            if not summary_json["result"]["success"]:
+                rounds += " (failed)"
+            wall = (summary_json.get("timing") or {}).get("wall_seconds")
+            row.extend([rounds, "-" if wall is None else f"{wall:.2f}s"])
+        rows.append(row)
+    print_table(header, rows, indent="")
+
+
+if __name__ == "__main__":
+    app()
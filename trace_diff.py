@@ -0,0 +1,264 @@
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#   "typer",
+# ]
+# ///
+
+import hashlib
+import itertools
+import json
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+
+import typer
+
+from hotspots import file_project
+from traces import read_trace_rounds
+
+# Gaps between anchors needing more edits than this are not aligned any
+# further, Myers' diff is O((N + M) * D) time and O(D^2) memory
+MAX_MYERS_EDITS = 2_000
+# Most pinned projects listed when describing a run of unique rounds
+MAX_PROJECTS_LISTED = 3
+
+
+def round_signature(resolution_round: dict[str, Any]) -> int:
+    """
+    64 bit hash of a round's content, two rounds with the same signature
+    pinned, added and rejected the same things.
+    """
+    content = json.dumps(resolution_round, sort_keys=True, separators=(",", ":"))
+    return int.from_bytes(hashlib.blake2b(content.encode(), digest_size=8).digest())
+
+
+def read_signatures(path: Path) -> tuple[array, list[list[str]]]:
+    """
+    The signature of every round of a trace, and what each round pinned to
+    describe it by.
+    """
+    signatures = array("Q")
+    pinned = []
+    for resolution_round in read_trace_rounds(path):
+        signatures.append(round_signature(resolution_round))
+        pinned.append(resolution_round.get("pinned", []))
+    return signatures, pinned
+
+
+def longest_increasing_subsequence(values: Sequence[int]) -> list[int]:
+    """
+    Indexes into values of a longest strictly increasing subsequence, by
+    patience sorting in O(n log n).
+    """
+    tails: list[int] = []
+    tail_indexes: list[int] = []
+    previous = [-1] * len(values)
+    for index, value in enumerate(values):
+        position = bisect_left(tails, value)
+        if position:
+            previous[index] = tail_indexes[position - 1]
+        if position == len(tails):
+            tails.append(value)
+            tail_indexes.append(index)
+        else:
+            tails[position] = value
+            tail_indexes[position] = index
+
+    result = []
+    index = tail_indexes[-1] if tail_indexes else -1
+    while index != -1:
+        result.append(index)
+        index = previous[index]
+    return result[::-1]
+
+
+def myers_matches(
+    a: Sequence[int], b: Sequence[int], max_edits: int
+) -> list[tuple[int, int]] | None:
+    """
+    Matching index pairs of a shortest edit script between a and b by
+    Myers' greedy algorithm, or None if it needs more than max_edits edits.
+    """
+    n = len(a)
+    m = len(b)
+    v = {1: 0}
+    trace = []
+    for d in range(min(n + m, max_edits) + 1):
+        trace.append(v.copy())
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                return myers_backtrack(trace, n, m)
+    return None
+
+
+def myers_backtrack(trace: list[dict[int, int]], n: int, m: int) -> list[tuple[int, int]]:
+    matches = []
+    x = n
+    y = m
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v.get(k - 1, -1) < v.get(k + 1, -1)):
+            previous_k = k + 1
+        else:
+            previous_k = k - 1
+        previous_x = v.get(previous_k, 0) if d else 0
+        previous_y = previous_x - previous_k if d else 0
+        while x > previous_x and y > previous_y:
+            x -= 1
+            y -= 1
+            matches.append((x, y))
+        x = previous_x
+        y = previous_y
+    return matches[::-1]
+
+
+def align(
+    a: Sequence[int], b: Sequence[int], max_edits: int = MAX_MYERS_EDITS
+) -> list[tuple[int, int]]:
+    """
+    Matching index pairs aligning a with b. Common prefixes and suffixes
+    are matched first, then rounds unique to both sides anchor the
+    alignment (patience diff) and only the gaps between anchors are diffed
+    with Myers' algorithm, so long traces align in near linear time.
+    """
+    matches = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        a_lo, a_hi, b_lo, b_hi = stack.pop()
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            matches.append((a_lo, b_lo))
+            a_lo += 1
+            b_lo += 1
+        while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+            a_hi -= 1
+            b_hi -= 1
+            matches.append((a_hi, b_hi))
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+
+        counts_a = Counter(a[a_lo:a_hi])
+        counts_b = Counter(b[b_lo:b_hi])
+        b_positions = {
+            b[j]: j
+            for j in range(b_lo, b_hi)
+            if counts_b[b[j]] == 1 and counts_a[b[j]] == 1
+        }
+        unique = [
+            (i, b_positions[a[i]]) for i in range(a_lo, a_hi) if a[i] in b_positions
+        ]
+        anchors = [
+            unique[index]
+            for index in longest_increasing_subsequence([j for _, j in unique])
+        ]
+        if anchors:
+            matches.extend(anchors)
+            bounds = [(a_lo - 1, b_lo - 1), *anchors, (a_hi, b_hi)]
+            for (i_1, j_1), (i_2, j_2) in itertools.pairwise(bounds):
+                stack.append((i_1 + 1, i_2, j_1 + 1, j_2))
+            continue
+
+        gap_matches = myers_matches(a[a_lo:a_hi], b[b_lo:b_hi], max_edits)
+        for i, j in gap_matches or []:
+            matches.append((a_lo + i, b_lo + j))
+    return sorted(matches)
+
+
+def hunks(
+    matches: list[tuple[int, int]], size_a: int, size_b: int
+) -> list[tuple[int, int, int, int]]:
+    """
+    The (a_lo, a_hi, b_lo, b_hi) ranges of rounds between matches, where
+    the traces differ.
+    """
+    result = []
+    previous_a = previous_b = -1
+    for i, j in [*matches, (size_a, size_b)]:
+        if i > previous_a + 1 or j > previous_b + 1:
+            result.append((previous_a + 1, i, previous_b + 1, j))
+        previous_a = i
+        previous_b = j
+    return result
+
+
+def describe_rounds(pinned: list[list[str]], lo: int, hi: int) -> str:
+    if lo == hi:
+        return "no rounds"
+    projects = Counter(
+        file_project(filename)
+        for round_pinned in pinned[lo:hi]
+        for filename in round_pinned
+    )
+    if hi - lo == 1:
+        description = f"round {hi}"
+    else:
+        description = f"rounds {lo + 1}-{hi} ({hi - lo})"
+    if projects:
+        listed = ", ".join(
+            f"{project} x{count}"
+            for project, count in projects.most_common(MAX_PROJECTS_LISTED)
+        )
+        description += f" pinning {listed}"
+    return description
+
+
+def main(trace_1: Path, trace_2: Path, max_hunks: int = 20) -> None:
+    """
+    Align the resolution rounds of two traces written by scenarios.py
+    --include-output, e.g. the same scenario with two pip versions, and
+    report where they first diverge, the rounds they share and the rounds
+    unique to each
+    """
+    signatures_1, pinned_1 = read_signatures(trace_1)
+    signatures_2, pinned_2 = read_signatures(trace_2)
+    print(f"1: {trace_1} ({len(signatures_1)} rounds)")
+    print(f"2: {trace_2} ({len(signatures_2)} rounds)")
+
+    prefix = 0
+    for signature_1, signature_2 in zip(signatures_1, signatures_2):
+        if signature_1 != signature_2:
+            break
+        prefix += 1
+    if prefix == len(signatures_1) == len(signatures_2):
+        print("The traces have identical rounds")
+        return
+
+    print(f"Common prefix: {prefix} rounds, first divergent round: {prefix + 1}")
+    for label, pinned in (("1", pinned_1), ("2", pinned_2)):
+        if prefix < len(pinned):
+            print(f"\t{label}: pinned {', '.join(pinned[prefix]) or 'nothing'}")
+        else:
+            print(f"\t{label}: finished")
+
+    matches = align(signatures_1, signatures_2)
+    print(
+        f"Aligned rounds: {len(matches)}, only in 1: "
+        f"{len(signatures_1) - len(matches)}, only in 2: "
+        f"{len(signatures_2) - len(matches)}"
+    )
+
+    differences = hunks(matches, len(signatures_1), len(signatures_2))
+    print(f"Differences ({len(differences)}):")
+    for a_lo, a_hi, b_lo, b_hi in differences[:max_hunks]:
+        print(f"\t1: {describe_rounds(pinned_1, a_lo, a_hi)}")
+        print(f"\t2: {describe_rounds(pinned_2, b_lo, b_hi)}")
+        print()
+    if len(differences) > max_hunks:
+        print(f"\t... and {len(differences) - max_hunks} more")
+
+
+if __name__ == "__main__":
+    typer.run(main)
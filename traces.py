@@ -0,0 +1,379 @@
+import gzip
+import itertools
+import json
+import math
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from types import TracebackType
+from typing import IO, Any, Self
+
+# Resolution traces are JSON Lines, the first record holds the scenario
+# "input", then one {"round": ..., "timing": [started, ended]} record per
+# resolution round as it completes, and the last record holds "result",
+# "summary" and "timing" once pip has finished. The compact codec holds the
+# same records in a binary format with every string interned
+TRACE_SUFFIXES = {
+    "none": ".jsonl",
+    "gzip": ".jsonl.gz",
+    "zstd": ".jsonl.zst",
+    "compact": ".ctrace",
+}
+TRACE_CODECS = tuple(TRACE_SUFFIXES)
+
+# The compact codec is binary: a magic line, then records of a one byte
+# kind, a little endian uint32 payload length and the payload. Every string
+# is written once as a string record and rounds refer to strings by their
+# index, rounds are the timing as two doubles (NaN if unknown) and uint32s,
+# and any other record is JSON
+COMPACT_MAGIC = b"PIPTRACE-COMPACT 1\n"
+STRING_RECORD = b"S"
+ROUND_RECORD = b"R"
+JSON_RECORD = b"J"
+RECORD_HEADER = struct.Struct("<cI")
+ROUND_TIMING = struct.Struct("<dd")
+
+ROUND_KEYS = ("added", "pinned", "rejected")
+# Every order the keys of a round can be in, so a round's order is kept
+KEY_ORDERS = [
+    order
+    for length in range(len(ROUND_KEYS) + 1)
+    for order in itertools.permutations(ROUND_KEYS, length)
+]
+KEY_ORDER_INDEXES = {order: index for index, order in enumerate(KEY_ORDERS)}
+# Number of uint32s before a compact round's arrays
+ROUND_HEADER_SIZE = 6
+
+
+class StringTable:
+    """
+    Interns strings as consecutive integer ids.
+    """
+
+    __slots__ = ("ids", "strings")
+
+    def __init__(self) -> None:
+        self.ids: dict[str, int] = {}
+        self.strings: list[str] = []
+
+    def intern(self, string: str) -> int:
+        string_id = self.ids.get(string)
+        if string_id is None:
+            string_id = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def __getitem__(self, string_id: int) -> str:
+        return self.strings[string_id]
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+
+def id_groups(values: array) -> Iterator[tuple[int, array]]:
+    """
+    Yield the (key, ids) of a flattened array of key, count, ids... groups.
+    """
+    index = 0
+    while index < len(values):
+        count = values[index + 1]
+        yield values[index], values[index + 2 : index + 2 + count]
+        index += 2 + count
+
+
+def flatten_groups(
+    groups: Iterable[tuple[str, Iterable[str]]], strings: StringTable
+) -> array:
+    values = array("I")
+    for key, members in groups:
+        member_ids = [strings.intern(member) for member in members]
+        values.append(strings.intern(key))
+        values.append(len(member_ids))
+        values.extend(member_ids)
+    return values
+
+
+class CompactRound:
+    """
+    A resolution round as arrays of ids interned in a StringTable instead of
+    dicts of strings: pinned holds the pinned files, added holds groups of
+    from file, number of requirements and requirements, and rejected groups
+    of requirement, number of from files and from files.
+    """
+
+    __slots__ = (
+        "added",
+        "added_count",
+        "key_order",
+        "pinned",
+        "rejected",
+        "rejected_count",
+    )
+
+    def __init__(
+        self,
+        key_order: int,
+        pinned: array,
+        added: array,
+        added_count: int,
+        rejected: array,
+        rejected_count: int,
+    ) -> None:
+        self.key_order = key_order
+        self.pinned = pinned
+        self.added = added
+        self.added_count = added_count
+        self.rejected = rejected
+        self.rejected_count = rejected_count
+
+    @classmethod
+    def from_dict(
+        cls, resolution_round: dict[str, Any], strings: StringTable
+    ) -> "CompactRound":
+        key_order = KEY_ORDER_INDEXES.get(tuple(resolution_round))
+        if key_order is None:
+            raise ValueError(f"Unknown resolution round keys: {list(resolution_round)}")
+        added = resolution_round.get("added", {})
+        rejected = resolution_round.get("rejected", {})
+        return cls(
+            key_order,
+            array("I", [strings.intern(f) for f in resolution_round.get("pinned", ())]),
+            flatten_groups(added.items(), strings),
+            len(added),
+            flatten_groups(rejected.items(), strings),
+            len(rejected),
+        )
+
+    def to_dict(self, strings: StringTable) -> dict[str, Any]:
+        resolution_round: dict[str, Any] = {}
+        for key in KEY_ORDERS[self.key_order]:
+            if key == "pinned":
+                resolution_round[key] = [strings[i] for i in self.pinned]
+            else:
+                resolution_round[key] = {
+                    strings[group_id]: [strings[i] for i in ids]
+                    for group_id, ids in id_groups(getattr(self, key))
+                }
+        return resolution_round
+
+    def to_bytes(self) -> bytes:
+        values = array(
+            "I",
+            [
+                self.key_order,
+                len(self.pinned),
+                self.added_count,
+                len(self.added),
+                self.rejected_count,
+                len(self.rejected),
+            ],
+        )
+        values.extend(self.pinned)
+        values.extend(self.added)
+        values.extend(self.rejected)
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CompactRound":
+        values = array("I")
+        values.frombytes(data)
+        if sys.byteorder == "big":
+            values.byteswap()
+        key_order, pinned, added_count, added, rejected_count, rejected = values[
+            :ROUND_HEADER_SIZE
+        ]
+        start = ROUND_HEADER_SIZE
+        return cls(
+            key_order,
+            values[start : start + pinned],
+            values[start + pinned : start + pinned + added],
+            added_count,
+            values[start + pinned + added : start + pinned + added + rejected],
+            rejected_count,
+        )
+
+
+def trace_codec(path: Path) -> str:
+    """
+    Codec of a trace file by its suffix, the compact codec is binary and
+    is read with read_compact_trace rather than open_trace.
+    """
+    for codec, suffix in TRACE_SUFFIXES.items():
+        if codec != "none" and path.name.endswith(suffix):
+            return codec
+    return "none"
+
+
+def open_trace(path: Path, mode: str, codec: str) -> IO[str]:
+    """
+    Open a trace file in text mode with the given compression codec, zstd
+    uses compression.zstd on Python 3.14+ and the zstandard package before.
+    """
+    if codec == "gzip":
+        return gzip.open(path, mode, encoding="utf-8")
+    if codec == "zstd":
+        try:
+            from compression import zstd
+        except ImportError:
+            try:
+                import zstandard as zstd
+            except ImportError:
+                raise RuntimeError(
+                    "The zstd codec needs Python 3.14+ or the zstandard package"
+                ) from None
+        return zstd.open(path, mode, encoding="utf-8")
+    if codec == "none":
+        return open(path, mode, encoding="utf-8")
+    raise ValueError(f"Unknown trace codec: {codec}")
+
+
+class TraceWriter:
+    """
+    Write a trace record by record to a temporary file that is renamed to
+    path on a clean close, so only the open file buffers are held in memory
+    and an interrupted run never leaves a truncated trace behind.
+    """
+
+    def __init__(self, path: Path, codec: str = "none") -> None:
+        self.path = path
+        self.temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        self.strings: StringTable | None = None
+        # Held open until __exit__ closes it
+        self.file = self._open(codec)
+        if codec == "compact":
+            self.strings = StringTable()
+            self.file.write(COMPACT_MAGIC)
+
+    def _open(self, codec: str) -> IO[Any]:
+        if codec == "compact":
+            return open(self.temp_path, "wb")
+        return open_trace(self.temp_path, "wt", codec)
+
+    def write(self, record: dict[str, Any]) -> None:
+        if self.strings is not None:
+            self._write_compact(record, self.strings)
+            return
+        self.file.write(json.dumps(record, separators=(",", ":")))
+        self.file.write("\n")
+
+    def _write_compact_record(self, kind: bytes, payload: bytes) -> None:
+        self.file.write(RECORD_HEADER.pack(kind, len(payload)))
+        self.file.write(payload)
+
+    def _write_compact(self, record: dict[str, Any], strings: StringTable) -> None:
+        timing = record.get("timing")
+        if (
+            tuple(record) != ("round", "timing")
+            or tuple(record["round"]) not in KEY_ORDER_INDEXES
+            or (timing is not None and len(timing) != 2)
+        ):
+            payload = json.dumps(record, separators=(",", ":")).encode()
+            self._write_compact_record(JSON_RECORD, payload)
+            return
+
+        known_strings = len(strings)
+        compact_round = CompactRound.from_dict(record["round"], strings)
+        for string in strings.strings[known_strings:]:
+            self._write_compact_record(STRING_RECORD, string.encode())
+        started, ended = timing if timing is not None else (math.nan, math.nan)
+        self._write_compact_record(
+            ROUND_RECORD, ROUND_TIMING.pack(started, ended) + compact_round.to_bytes()
+        )
+
+    def write_round(
+        self, resolution_round: dict[str, Any], started: float, ended: float
+    ) -> None:
+        self.write(
+            {"round": resolution_round, "timing": [round(started, 4), round(ended, 4)]}
+        )
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.temp_path, self.path)
+        else:
+            self.temp_path.unlink(missing_ok=True)
+
+
+def read_compact_trace(
+    path: Path, strings: StringTable
+) -> Iterator[dict[str, Any] | tuple[CompactRound, list[float] | None]]:
+    """
+    Yield the records of a compact trace, rounds as (round, timing) with
+    the round's ids interned in strings, and any other record as a dict.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(COMPACT_MAGIC)) != COMPACT_MAGIC:
+            raise RuntimeError(f"Not a compact trace: {path}")
+        while header := f.read(RECORD_HEADER.size):
+            if len(header) != RECORD_HEADER.size:
+                raise RuntimeError(f"Truncated compact trace: {path}")
+            kind, length = RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) != length:
+                raise RuntimeError(f"Truncated compact trace: {path}")
+            if kind == STRING_RECORD:
+                strings.intern(payload.decode())
+            elif kind == ROUND_RECORD:
+                started, ended = ROUND_TIMING.unpack_from(payload)
+                timing = None if math.isnan(started) else [started, ended]
+                yield CompactRound.from_bytes(payload[ROUND_TIMING.size :]), timing
+            elif kind == JSON_RECORD:
+                yield json.loads(payload)
+            else:
+                raise RuntimeError(f"Unknown record kind {kind!r} in {path}")
+
+
+def read_trace(path: Path) -> Iterator[dict[str, Any]]:
+    """
+    Yield the records of a trace, traces written before output was
+    streamed (a single JSON document) are yielded as the same records.
+    """
+    if path.name.endswith(TRACE_SUFFIXES["compact"]):
+        strings = StringTable()
+        for record in read_compact_trace(path, strings):
+            if isinstance(record, tuple):
+                compact_round, timing = record
+                yield {"round": compact_round.to_dict(strings), "timing": timing}
+            else:
+                yield record
+        return
+
+    if path.suffix == ".json":
+        with open(path, encoding="utf-8") as f:
+            output_json = json.load(f)
+        round_timings = output_json.get("round_timings") or []
+        yield {"input": output_json["input"]}
+        for index, resolution_round in enumerate(output_json["resolution_rounds"]):
+            timing = round_timings[index] if index < len(round_timings) else None
+            yield {"round": resolution_round, "timing": timing}
+        yield {
+            "result": output_json["result"],
+            "summary": output_json["summary"],
+            "timing": output_json.get("timing"),
+        }
+        return
+
+    with open_trace(path, "rt", trace_codec(path)) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_trace_rounds(path: Path) -> Iterator[dict[str, Any]]:
+    for record in read_trace(path):
+        if "round" in record:
+            yield record["round"]
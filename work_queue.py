@@ -0,0 +1,345 @@
+import json
+import re
+import statistics
+import threading
+import time
+import traceback
+import urllib.error
+import urllib.request
+from collections import deque
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+SHARD_RE = re.compile(r"(\d+)/(\d+)")
+# Used to estimate the cost of scenarios that only have a round count while
+# no summary has both a round count and a wall time
+DEFAULT_SECONDS_PER_ROUND = 0.5
+# A task not reported back within this long, e.g. because its worker died,
+# is handed out again
+LEASE_SECONDS = 6 * 60 * 60
+# How long a worker waits before asking again while every remaining task
+# is leased to another worker
+POLL_SECONDS = 10
+# A coordinator shutting down between requests resets the connection rather
+# than refusing it
+COORDINATOR_GONE = (urllib.error.URLError, ConnectionError)
+
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    """
+    Parse "i/n" into the 1-based shard index and shard count.
+    """
+    match = SHARD_RE.fullmatch(shard.strip())
+    if match is None or not 1 <= int(match[1]) <= int(match[2]):
+        raise RuntimeError(f"--shard must be i/n with 1 <= i <= n, e.g. 2/4: {shard}")
+    return int(match[1]), int(match[2])
+
+
+def historical_costs(summaries_dir: Path, pip_name: str) -> dict[tuple[str, str], float]:
+    """
+    Estimated seconds to run each (toml name, scenario name) from existing
+    summaries: the wall time of pip_name's summary, else the median wall
+    time of other pips', else the round count times the median seconds per
+    round of summaries that have both.
+    """
+    wall_seconds: dict[tuple[str, str], dict[str, float]] = {}
+    rounds: dict[tuple[str, str], dict[str, int]] = {}
+    seconds_per_round = []
+    for path in summaries_dir.glob("*/*/*.json"):
+        try:
+            summary_json = json.loads(path.read_bytes())
+        except (OSError, json.JSONDecodeError):
+            continue
+        key = (path.parent.parent.name, path.parent.name)
+        wall = (summary_json.get("timing") or {}).get("wall_seconds")
+        total_rounds = (summary_json.get("summary") or {}).get("total_rounds")
+        if wall is not None:
+            wall_seconds.setdefault(key, {})[path.stem] = wall
+        if total_rounds is not None:
+            rounds.setdefault(key, {})[path.stem] = total_rounds
+        if wall is not None and total_rounds:
+            seconds_per_round.append(wall / total_rounds)
+
+    per_round = (
+        statistics.median(seconds_per_round)
+        if seconds_per_round
+        else DEFAULT_SECONDS_PER_ROUND
+    )
+    costs = {}
+    for key in wall_seconds.keys() | rounds.keys():
+        walls = wall_seconds.get(key, {})
+        key_rounds = rounds.get(key, {})
+        if pip_name in walls:
+            costs[key] = walls[pip_name]
+        elif walls:
+            costs[key] = statistics.median(walls.values())
+        elif pip_name in key_rounds:
+            costs[key] = key_rounds[pip_name] * per_round
+        else:
+            costs[key] = statistics.median(key_rounds.values()) * per_round
+    return costs
+
+
+def scenario_key(kwargs: dict[str, Any]) -> tuple[str, str]:
+    summary_path = Path(kwargs["summary_path"])
+    return summary_path.parent.parent.name, summary_path.parent.name
+
+
+def longest_first(
+    pending: list[dict[str, Any]], costs: dict[tuple[str, str], float]
+) -> list[tuple[float, dict[str, Any]]]:
+    """
+    Pending scenarios with their estimated cost, most expensive first. A
+    scenario without history is assumed to be as expensive as the most
+    expensive known one, so it is not left for last.
+    """
+    unknown_cost = max(costs.values(), default=0.0)
+    with_costs = [
+        (costs.get(scenario_key(kwargs), unknown_cost), kwargs) for kwargs in pending
+    ]
+    return sorted(with_costs, key=lambda item: (-item[0], scenario_key(item[1])))
+
+
+def shard_pending(
+    pending: list[dict[str, Any]],
+    costs: dict[tuple[str, str], float],
+    shard_index: int,
+    shard_count: int,
+) -> list[dict[str, Any]]:
+    """
+    The pending scenarios of one shard. Scenarios are assigned longest
+    first to the shard with the least estimated cost so far, then the
+    fewest scenarios, so every shard computes the same assignment from the
+    same summaries and shards finish at about the same time.
+    """
+    loads = [0.0] * shard_count
+    counts = [0] * shard_count
+    shard = []
+    for cost, kwargs in longest_first(pending, costs):
+        target = min(range(shard_count), key=lambda s: (loads[s], counts[s], s))
+        loads[target] += cost
+        counts[target] += 1
+        if target == shard_index - 1:
+            shard.append(kwargs)
+    print(
+        f"Shard {shard_index}/{shard_count}: {len(shard)} of {len(pending)} "
+        f"scenarios, estimated {loads[shard_index - 1]:.0f}s of {sum(loads):.0f}s"
+    )
+    return shard
+
+
+def encode_task(kwargs: dict[str, Any]) -> str:
+    def default(value: Any) -> Any:
+        if isinstance(value, Path):
+            return {"__path__": str(value)}
+        raise TypeError(f"Cannot send {value!r} to a worker")
+
+    return json.dumps(kwargs, default=default)
+
+
+def decode_task(task: str) -> dict[str, Any]:
+    def object_hook(value: dict[str, Any]) -> Any:
+        if list(value) == ["__path__"]:
+            return Path(value["__path__"])
+        return value
+
+    return json.loads(task, object_hook=object_hook)
+
+
+class WorkQueue:
+    """
+    Tasks handed out in order, each leased to one worker until it reports
+    back. Leases that expire are handed out again first, and the first
+    report for a task completes it.
+    """
+
+    def __init__(self, tasks: list[str], lease_seconds: float = LEASE_SECONDS) -> None:
+        self.tasks = tasks
+        self.lease_seconds = lease_seconds
+        self.queued = deque(range(len(tasks)))
+        self.leases: dict[int, float] = {}
+        self.completed: set[int] = set()
+        self.reported = 0
+        self.finished = threading.Event()
+        self.lock = threading.Lock()
+        if not tasks:
+            self.finished.set()
+
+    def take(self) -> int | None:
+        with self.lock:
+            now = time.monotonic()
+            for task_id, expires_at in list(self.leases.items()):
+                if expires_at < now:
+                    del self.leases[task_id]
+                    self.queued.appendleft(task_id)
+            if not self.queued:
+                return None
+            task_id = self.queued.popleft()
+            self.leases[task_id] = now + self.lease_seconds
+            return task_id
+
+    def complete(self, task_id: int, on_complete: Callable[[], None]) -> bool:
+        """
+        Complete a task unless it already was, calling on_complete before
+        it counts towards finished so its result is stored by then.
+        """
+        with self.lock:
+            if task_id in self.completed or not 0 <= task_id < len(self.tasks):
+                return False
+            self.completed.add(task_id)
+            self.leases.pop(task_id, None)
+            if task_id in self.queued:
+                self.queued.remove(task_id)
+        try:
+            on_complete()
+        finally:
+            with self.lock:
+                self.reported += 1
+                if self.reported == len(self.tasks):
+                    self.finished.set()
+        return True
+
+
+class WorkQueueServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        queue: WorkQueue,
+        on_result: Callable[[int, str | None, str | None], None],
+    ) -> None:
+        super().__init__(address, WorkQueueHandler)
+        self.queue = queue
+        self.on_result = on_result
+
+
+class WorkQueueHandler(BaseHTTPRequestHandler):
+    server: WorkQueueServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def send_json(self, value: Any) -> None:
+        content = json.dumps(value).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_POST(self) -> None:
+        queue = self.server.queue
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if self.path == "/take":
+            task_id = queue.take()
+            self.send_json(
+                {
+                    "id": task_id,
+                    "task": None if task_id is None else queue.tasks[task_id],
+                    "finished": queue.finished.is_set(),
+                }
+            )
+        elif self.path == "/complete":
+            task_id = body["id"]
+            accepted = queue.complete(
+                task_id,
+                lambda: self.server.on_result(
+                    task_id, body.get("summary"), body.get("error")
+                ),
+            )
+            self.send_json({"accepted": accepted})
+        else:
+            self.send_error(404)
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise RuntimeError(f"Expected HOST:PORT, e.g. 0.0.0.0:8765: {address}")
+    return host, int(port)
+
+
+def serve_work_queue(
+    address: str,
+    tasks: list[dict[str, Any]],
+    on_result: Callable[[dict[str, Any], str | None, str | None], None],
+) -> None:
+    """
+    Hand out tasks, in order, to workers over HTTP at address until every
+    one has been reported back, calling on_result(task, summary, error)
+    with the summary file content a worker ran it into or its error.
+    """
+    queue = WorkQueue([encode_task(task) for task in tasks])
+
+    def on_task_result(task_id: int, summary: str | None, error: str | None) -> None:
+        on_result(tasks[task_id], summary, error)
+        print(f"{queue.reported + 1}/{len(tasks)} scenarios reported back")
+
+    server = WorkQueueServer(parse_address(address), queue, on_task_result)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    print(f"Serving {len(tasks)} scenarios to workers at http://{host}:{port}")
+    try:
+        # Polled so Ctrl-C is not blocked waiting on the event
+        while not queue.finished.wait(1):
+            pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def post_json(url: str, value: Any) -> Any:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(value).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def run_worker(
+    url: str,
+    run: Callable[[dict[str, Any]], Path],
+    errors: tuple[type[Exception], ...],
+) -> int:
+    """
+    Take tasks from the coordinator at url until it has none left, run
+    each with run, which returns the summary file it wrote, and report the
+    summary back, or the traceback of a failed task when run raises one of
+    errors. Returns the number of tasks run.
+    """
+    url = url.rstrip("/")
+    number_run = 0
+    while True:
+        try:
+            response = post_json(f"{url}/take", {})
+        except COORDINATOR_GONE as e:
+            print(f"Coordinator at {url} is gone: {getattr(e, 'reason', e)}")
+            return number_run
+        if response["id"] is None:
+            if response["finished"]:
+                return number_run
+            time.sleep(POLL_SECONDS)
+            continue
+
+        task = decode_task(response["task"])
+        summary = error = None
+        try:
+            summary = run(task).read_text()
+        except errors as e:
+            error = "".join(traceback.format_exception(e))
+        number_run += 1
+        try:
+            post_json(
+                f"{url}/complete",
+                {"id": response["id"], "summary": summary, "error": error},
+            )
+        except COORDINATOR_GONE as e:
+            print(f"Coordinator at {url} is gone: {getattr(e, 'reason', e)}")
+            return number_run